@@ -0,0 +1,269 @@
+import os
+import sys
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Shared file name parser lives with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from filing_metadata import accession_year
+
+# Persistent per-filing index of geographic dispersion (which US states a 10-K mentions).
+# missing_data.py and fix_plot (1).py used to read every entity_report_*.csv of a tree on every run
+# and append the results to unique_states_per_filing_with_files.csv, so reruns piled up duplicates.
+# Here each filing has one row keyed by its filing ID (the report name without entity_report_ and
+# .csv) holding the report's path, mtime and size. A refresh only reads reports that are new or
+# changed, on a process pool, and the histogram and per-year means for the plots are SQL queries.
+#
+# The same metric from the gazetteer fast path (state_gazetteer.py) is kept in a second table,
+# every aggregate takes source='ner' (entity reports) or source='gazetteer'.
+#
+#   python dispersion_index.py --index state_dispersion.sqlite --refresh /scratch/alpine/nimi2356/new_parsed_data_1
+
+DEFAULT_INDEX = "state_dispersion.sqlite"
+
+# Table of each source of state sets
+SOURCES = {'ner': 'filings', 'gazetteer': 'gazetteer_filings'}
+
+REPORT_PREFIX = "entity_report_"
+REPORT_SUFFIX = ".csv"
+
+# List of U.S. state names for filtering
+STATE_NAMES = [
+    "Alabama", "Alaska", "Arizona", "Arkansas", "California", "Colorado", "Connecticut",
+    "Delaware", "Florida", "Georgia", "Hawaii", "Idaho", "Illinois", "Indiana", "Iowa",
+    "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts", "Michigan",
+    "Minnesota", "Mississippi", "Missouri", "Montana", "Nebraska", "Nevada", "New Hampshire",
+    "New Jersey", "New Mexico", "New York", "North Carolina", "North Dakota", "Ohio",
+    "Oklahoma", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina", "South Dakota",
+    "Tennessee", "Texas", "Utah", "Vermont", "Virginia", "Washington", "West Virginia",
+    "Wisconsin", "Wyoming"
+]
+
+def is_report(file_name):
+    return file_name.startswith(REPORT_PREFIX) and file_name.endswith(REPORT_SUFFIX)
+
+def filing_id(file_name):
+    """entity_report_0000320193-14-000024.csv -> 0000320193-14-000024"""
+    return file_name[len(REPORT_PREFIX):-len(REPORT_SUFFIX)]
+
+def read_report_states(path):
+    """
+    States among the GPE entities of one entity report, sorted, or None if the report has no Type and
+    Entity columns (the old scripts skipped those). Runs in the pool workers.
+    """
+    try:
+        data = pd.read_csv(path, usecols=['Type', 'Entity'])
+    except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+        # Both are ValueErrors too, but an empty or broken report is an error, not a skipped one
+        return path, None, str(e)
+    except ValueError:
+        return path, None, None
+    except Exception as e:
+        return path, None, str(e)
+    gpe_data = data[(data['Type'] == 'GPE') & (data['Entity'].isin(STATE_NAMES))]
+    return path, sorted(gpe_data['Entity'].unique()), None
+
+def scan_reports(base_directory):
+    """(filing id, path, mtime_ns, size) of every entity report under base_directory, paths sorted."""
+    reports = []
+    stack = [base_directory]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif is_report(entry.name):
+                    st = entry.stat()
+                    reports.append((filing_id(entry.name), entry.path, st.st_mtime_ns, st.st_size))
+    reports.sort(key=lambda report: report[1])
+    return reports
+
+class DispersionIndex:
+    """SQLite index of unique US states per filing, refreshed incrementally from entity report trees."""
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS filings (
+                filing_id TEXT PRIMARY KEY,
+                file TEXT NOT NULL,
+                path TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                year INTEGER,
+                unique_states INTEGER,
+                states TEXT
+            )""")
+        self.conn.execute('CREATE INDEX IF NOT EXISTS filings_year ON filings (year)')
+        # Same layout plus the mention count of every state, path is the filing's directory or file
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS gazetteer_filings (
+                filing_id TEXT PRIMARY KEY,
+                file TEXT NOT NULL,
+                path TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                year INTEGER,
+                unique_states INTEGER,
+                states TEXT,
+                mentions TEXT
+            )""")
+        self.conn.execute('CREATE INDEX IF NOT EXISTS gazetteer_filings_year ON gazetteer_filings (year)')
+        self.conn.commit()
+
+    def known(self, source='ner'):
+        """{filing id: (path, mtime_ns, size)} of what is indexed for source."""
+        return {row[0]: row[1:] for row in
+                self.conn.execute(f'SELECT filing_id, path, mtime_ns, size FROM {SOURCES[source]}')}
+
+    def store_gazetteer(self, rows):
+        """Insert or replace gazetteer rows (filing id, file, path, mtime_ns, size, year, unique states, states, mentions)."""
+        self.conn.executemany('INSERT OR REPLACE INTO gazetteer_filings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.conn.commit()
+
+    def import_csv(self, csv_path):
+        """
+        Add the filings of an existing unique_states_per_filing_with_files.csv that the index does not
+        have yet, keyed by filing ID, so an export keeps the rows collected by earlier runs over other
+        trees. Only the count is known for those, the path is the csv's and the states are empty, so
+        a refresh of a tree that has the report replaces the row. Returns the number of rows added.
+        """
+        frame = pd.read_csv(csv_path, usecols=['File', 'UniqueStatesCount'])
+        frame = frame.dropna(subset=['File', 'UniqueStatesCount'])
+        rows = []
+        for file, count in zip(frame['File'].astype(str), frame['UniqueStatesCount']):
+            fid = filing_id(file) if is_report(file) else os.path.splitext(file)[0]
+            rows.append((fid, file, os.path.abspath(csv_path), 0, 0, accession_year(file), int(count), None))
+        before = self.conn.total_changes
+        self.conn.executemany('INSERT OR IGNORE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def delete(self, filing_ids, source='ner'):
+        self.conn.executemany(f'DELETE FROM {SOURCES[source]} WHERE filing_id = ?', [(fid,) for fid in filing_ids])
+        self.conn.commit()
+
+    def states_by_filing(self, source='ner'):
+        """{filing id: set of states} of every filing of source with a state set."""
+        rows = self.conn.execute(f'SELECT filing_id, states FROM {SOURCES[source]} WHERE states IS NOT NULL')
+        return {fid: set(states.split(',')) if states else set() for fid, states in rows}
+
+    def refresh(self, base_directory, workers=None, prune=False):
+        """
+        Read the reports under base_directory that are new or changed since the last refresh.
+        A filing found at several paths is read from the one already indexed, or the first by path.
+        prune removes filings whose report under base_directory is gone.
+        Returns counts of read, unchanged, duplicate, pruned and failed reports.
+        """
+        base_directory = os.path.abspath(base_directory)
+        known = self.known('ner')
+        stats = {'read': 0, 'unchanged': 0, 'duplicates': 0, 'pruned': 0, 'failed': 0}
+
+        seen = {}
+        for fid, path, mtime_ns, size in scan_reports(base_directory):
+            if fid in seen:
+                stats['duplicates'] += 1
+                # Stick with the path already in the index if the filing shows up there too
+                if known.get(fid, (None,))[0] == path:
+                    seen[fid] = (path, mtime_ns, size)
+                continue
+            seen[fid] = (path, mtime_ns, size)
+
+        todo = {}
+        for fid, (path, mtime_ns, size) in seen.items():
+            if known.get(fid) == (path, mtime_ns, size):
+                stats['unchanged'] += 1
+            else:
+                todo[path] = (fid, mtime_ns, size)
+
+        if todo:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for path, states, error in pool.map(read_report_states, sorted(todo), chunksize=64):
+                    if error is not None:
+                        print(f"Error processing file {path}: {error}")
+                        stats['failed'] += 1
+                        continue
+                    fid, mtime_ns, size = todo[path]
+                    file = os.path.basename(path)
+                    self.conn.execute('INSERT OR REPLACE INTO filings VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                      (fid, file, path, mtime_ns, size, accession_year(file),
+                                       None if states is None else len(states),
+                                       None if states is None else ','.join(states)))
+                    stats['read'] += 1
+                    if stats['read'] % 10000 == 0:
+                        self.conn.commit()
+            self.conn.commit()
+
+        if prune:
+            under = base_directory.rstrip(os.sep) + os.sep
+            gone = [fid for fid, (path, _, _) in known.items() if path.startswith(under) and fid not in seen]
+            self.delete(gone, 'ner')
+            stats['pruned'] = len(gone)
+        return stats
+
+    @staticmethod
+    def _under(base_directory):
+        """SQL condition and parameters keeping the filings whose path is under base_directory (None keeps all)."""
+        if base_directory is None:
+            return '', []
+        under = os.path.abspath(base_directory).rstrip(os.sep) + os.sep
+        return ' AND substr(path, 1, ?) = ?', [len(under), under]
+
+    def frame(self, source='ner', under=None):
+        """
+        File and UniqueStatesCount per filing, the layout of unique_states_per_filing_with_files.csv.
+        under limits it to the filings indexed from one tree.
+        """
+        condition, params = self._under(under)
+        return pd.read_sql_query(f'SELECT file AS File, unique_states AS UniqueStatesCount FROM {SOURCES[source]} '
+                                 f'WHERE unique_states IS NOT NULL{condition} ORDER BY file', self.conn, params=params)
+
+    def unique_state_counts(self, source='ner', under=None):
+        """Unique state counts of every filing (or of those under one tree) as an int array, for the dispersion histogram."""
+        condition, params = self._under(under)
+        rows = self.conn.execute(f'SELECT unique_states, COUNT(*) FROM {SOURCES[source]} WHERE unique_states IS NOT NULL'
+                                 f'{condition} GROUP BY unique_states', params).fetchall()
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+        values, counts = zip(*rows)
+        return np.repeat(np.array(values, dtype=np.int64), counts)
+
+    def yearly_means(self, source='ner'):
+        """Year and mean UniqueStatesCount per year, like new_plot.py's groupby."""
+        return pd.read_sql_query(f'SELECT year AS Year, AVG(unique_states) AS UniqueStatesCount FROM {SOURCES[source]} '
+                                 'WHERE unique_states IS NOT NULL AND year IS NOT NULL GROUP BY year ORDER BY year',
+                                 self.conn)
+
+    def export_csv(self, output_csv, source='ner', under=None):
+        """Write unique_states_per_filing_with_files.csv from the index, one row per filing (under one tree if given)."""
+        frame = self.frame(source, under)
+        frame.to_csv(output_csv, index=False)
+        return len(frame)
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Incremental index of unique US states per 10-K.')
+    parser.add_argument('--index', type=str, default=DEFAULT_INDEX, help='Path to the index sqlite file')
+    parser.add_argument('--refresh', type=str, nargs='*', default=[], help='Entity report trees to (re)index')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes reading reports')
+    parser.add_argument('--prune', action='store_true', help='Drop filings whose report is gone from a refreshed tree')
+    parser.add_argument('--import_csv', type=str, required=False, help='Add the filings of an existing File,UniqueStatesCount csv')
+    parser.add_argument('--export', type=str, required=False, help='Write the File,UniqueStatesCount csv here')
+    args = parser.parse_args()
+
+    index = DispersionIndex(args.index)
+    if args.import_csv:
+        print(f"{index.import_csv(args.import_csv)} filings imported from {args.import_csv}")
+    for directory in args.refresh:
+        print(f"{directory}: {index.refresh(directory, workers=args.workers, prune=args.prune)}")
+    if args.export:
+        print(f"{index.export_csv(args.export)} filings written to {args.export}")
+    print(index.yearly_means().to_string(index=False))
+    index.close()
@@ -1,86 +1,123 @@
 import os
-import spacy
 import csv
 import argparse
-from collections import defaultdict, Counter
+import time
+import heapq
+from functools import partial
+from collections import Counter
 from multiprocessing import Pool
 import multiprocessing
+import sys
 
-# Load SpaCy model globally
-nlp = spacy.load('en_core_web_md')
-nlp.max_length = 10_000_000  # Increase limit to handle very large documents
+# Shared filing reader lives with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from filing_storage import read_filing, is_filing, strip_compression_suffix
+from corpus_catalog import CorpusCatalog
+from section_index import parse_sections, section_spans
+from position_index import PositionIndex
+from ner_chunks import iter_entities, DEFAULT_CHUNK_CHARS
+from entity_counts import EntityCounts
+from entity_rows import ENTITY_FIELDS, FORMAT_SUFFIXES, part_path, write_part, finish_directory
 
-def process_file(file_path):
+DEFAULT_MODEL = 'en_core_web_md'
+
+# SpaCy model of this process. Loaded once per pool worker by init_worker, never in the parent.
+# Text goes through it in chunks of at most --chunk_chars (ner_chunks.py), so the default
+# nlp.max_length holds and memory per worker stays bounded on very large filings.
+nlp = None
+
+def init_worker(model_name=DEFAULT_MODEL):
+    """
+    Pool initializer: load the model once, every file the worker gets afterwards reuses it.
+    spaCy is imported here, the parent only partitions, merges and writes and never needs it.
+    """
+    import spacy
+    global nlp
+    nlp = spacy.load(model_name)
+
+def process_file(file_path, sections=None, chunk_chars=DEFAULT_CHUNK_CHARS):
     """
     Processes a single text file to extract named entities (PERSON, ORG, GPE, LOC)
     with their line numbers and occurrences across files.
+    sections (10-K items like ['1', '7']) limits NER to those spans of the file, positions and
+    line numbers are still those of the full file.
+    chunk_chars is the largest piece of text given to spaCy at once.
     """
     entity_data = []
-    entity_counts = defaultdict(lambda: {'Count': 0, 'Documents': set()})
+    token_counts = Counter()
+    # Compressed filings are reported under their plain .txt name
+    file_name = strip_compression_suffix(os.path.basename(file_path))
+
+    if nlp is None:
+        init_worker()
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
-
-        doc = nlp(text)
-        line_starts = [0] + [pos + 1 for pos, char in enumerate(text) if char == '\n']
-
-        for ent in doc.ents:
-            if ent.label_ in ['PERSON', 'ORG', 'GPE', 'LOC']:
-                line_number = next(i + 1 for i, start in enumerate(line_starts) if start > ent.start_char) - 1
-                entity_data.append({
-                    'Entity': ent.text.strip(),
-                    'Type': ent.label_,
-                    'Line Number': line_number,
-                    'Start Position': ent.start_char,
-                    'End Position': ent.end_char,
-                    'File': os.path.basename(file_path)
-                })
-                
-                cleaned_entities = ent.text.strip().split()
-                for entity in cleaned_entities:
-                    key = (ent.label_, entity)
-                    entity_counts[key]['Count'] += 1
-                    entity_counts[key]['Documents'].add(os.path.basename(file_path))
+        text = read_filing(file_path)
+
+        spans = section_spans(text, sections, file_path) if sections else [(0, len(text))]
+        # Offsets come back in the full file whatever the spans and chunks were
+        entities = [ent for ent in iter_entities(nlp, text, spans, chunk_chars)
+                    if ent[1] in ['PERSON', 'ORG', 'GPE', 'LOC']]
+        # All line numbers of the file in one lookup
+        line_numbers = PositionIndex(text).line_numbers([start_char for _, _, start_char, _ in entities])
+
+        for (ent_text, label, start_char, end_char), line_number in zip(entities, line_numbers.tolist()):
+            entity_data.append({
+                'Entity': ent_text.strip(),
+                'Type': label,
+                'Line Number': line_number,
+                'Start Position': start_char,
+                'End Position': end_char,
+                'File': file_name
+            })
+
+            cleaned_entities = ent_text.strip().split()
+            for entity in cleaned_entities:
+                key = (label, entity)
+                token_counts[key] += 1
                     
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
 
-    return entity_data, entity_counts
+    return entity_data, EntityCounts.for_file(file_name, token_counts)
 
 def aggregate_entity_counts(entity_counts_list):
     """
     Aggregates entity counts across all files.
     """
-    aggregated_counts = defaultdict(lambda: {'Count': 0, 'Documents': set()})
+    aggregated_counts = EntityCounts()
     for entity_counts in entity_counts_list:
-        for key, data in entity_counts.items():
-            aggregated_counts[key]['Count'] += data['Count']
-            aggregated_counts[key]['Documents'].update(data['Documents'])
+        aggregated_counts.merge(entity_counts)
     return aggregated_counts
 
-def process_files_in_directory(directory):
+def list_txt_files(directory):
+    """Text files of a directory with their sizes."""
+    txt_files = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file() and is_filing(entry.name):
+                txt_files.append((entry.path, entry.stat().st_size))
+    return txt_files
+
+def process_task(task, sections=None, chunk_chars=DEFAULT_CHUNK_CHARS, output_format='csv'):
     """
-    Processes all text files in a given directory using multiprocessing.
+    Pool task: (directory, file path) -> (directory, number of entity rows, entity counts).
+    The rows themselves are written to the file's part (entity_rows.py) here in the worker.
     """
-    txt_files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.txt')]
-    with Pool(multiprocessing.cpu_count()) as pool:
-        results = pool.map(process_file, txt_files)
-
-    entities_data = [data for file_data, _ in results for data in file_data]
-    all_entity_counts = [count for _, count in results]
-    aggregated_counts = aggregate_entity_counts(all_entity_counts)
+    directory, file_path = task
+    entity_data, entity_counts = process_file(file_path, sections, chunk_chars)
+    write_part(entity_data, part_path(directory, file_path, output_format), output_format)
+    return directory, len(entity_data), entity_counts
 
-    return entities_data, aggregated_counts
-
-def write_to_csv(entities_data, output_file):
+def write_to_csv(entities_data, output_file, mode='w'):
     """
     Writes entity details with line numbers to a CSV file.
+    mode 'a' appends the rows to a file that already has its header.
     """
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['Entity', 'Type', 'Line Number', 'Start Position', 'End Position', 'File']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+    with open(output_file, mode, newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=ENTITY_FIELDS)
+        if mode == 'w':
+            writer.writeheader()
         for entity_data in entities_data:
             writer.writerow(entity_data)
 
@@ -92,40 +129,159 @@ def write_count_summary(aggregated_counts, count_file):
         fieldnames = ['Type', 'Entity', 'Count', 'Documents']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        for (entity_type, entity), data in aggregated_counts.items():
+        for (entity_type, entity), count, documents in aggregated_counts.items():
             writer.writerow({
                 'Type': entity_type,
                 'Entity': entity,
-                'Count': data['Count'],
-                'Documents': ', '.join(data['Documents'])
+                'Count': count,
+                'Documents': ', '.join(documents)
             })
 
-def find_and_process_txt_dirs(base_dir, start_range, end_range):
+def count_file_path(directory):
+    return os.path.join(directory, f"{os.path.basename(directory)}_entity_counts.csv")
+
+# Array job task index, as set by SLURM for --array jobs
+DEFAULT_TASK_ENV = 'SLURM_ARRAY_TASK_ID'
+
+def shard_counts_path(shard_dir, shard_index, shard_count):
+    return os.path.join(shard_dir, f"entity_counts_shard{shard_index}of{shard_count}.npz")
+
+def partition_directories(dir_sizes, shard_count, base_dir):
+    """
+    Split (directory, bytes) pairs into shard_count lists of about the same total size: largest directory
+    first, each to the shard with the least bytes so far. Ties are broken by the path relative to
+    base_dir, so every task computes the same partition from the same tree.
+    """
+    order = sorted(dir_sizes, key=lambda item: (-item[1], os.path.relpath(item[0], base_dir)))
+    shards = [[] for _ in range(shard_count)]
+    loads = [(0, i) for i in range(shard_count)]
+    for directory, size in order:
+        load, i = heapq.heappop(loads)
+        shards[i].append(directory)
+        heapq.heappush(loads, (load + size, i))
+    return shards
+
+def find_and_process_txt_dirs(base_dir, start_range, end_range, catalog=None, sections=None,
+                              chunk_chars=DEFAULT_CHUNK_CHARS, workers=None, model_name=DEFAULT_MODEL,
+                              output_format='csv', shard=None, shard_dir=None):
     """
     Finds and processes subdirectories containing .txt files within numeric directory ranges.
+    Every file of the range goes to one pool whose workers load the model once. The largest files are
+    handed out first so a giant filing does not start last and hold up the run.
+    Workers write each file's entity rows to a part file as they finish it, and when a directory's
+    last file is done its parts are concatenated into <dir>_entities (csv, csv.gz or parquet) and
+    its count summary is written. Neither the parent nor a worker holds more than one file's rows.
+
+    shard (index, count) only processes this task's share of the directories (partition_directories)
+    and saves the task's merged counts to shard_dir for merge_entity_counts.py.
+    catalog (a hashed corpus_catalog.CorpusCatalog of base_dir) leaves out duplicate filings.
     """
+    found = {}
     for root, subdirs, files in os.walk(base_dir):
         dir_name = os.path.basename(root)
         if dir_name.isdigit() and start_range <= int(dir_name) <= end_range:
-            print(f"Processing directory: {root}")
-            entities_data, aggregated_counts = process_files_in_directory(root)
+            found[root] = sorted(list_txt_files(root))
+
+    if catalog is not None:
+        # Duplicates (corpus_catalog.py) are not run through spaCy again. The copy that is kept is picked
+        # among the files of the range, the same way in every shard, so it is always processed by this run.
+        skip_paths = {os.path.abspath(path) for path in
+                      catalog.duplicate_paths(path for txt_files in found.values() for path, _ in txt_files)}
+        found = {root: [(path, size) for path, size in txt_files if os.path.abspath(path) not in skip_paths]
+                 for root, txt_files in found.items()}
+        print(f"Skipping {len(skip_paths)} duplicate filings")
 
-            # Write results to CSV
-            output_file = os.path.join(root, f"{dir_name}_entities.csv")
-            count_file = os.path.join(root, f"{dir_name}_entity_counts.csv")
-            write_to_csv(entities_data, output_file)
-            write_count_summary(aggregated_counts, count_file)
-            print(f"Entity details written to {output_file}")
-            print(f"Entity count summary written to {count_file}")
+    selected = list(found)
+    if shard is not None:
+        shard_index, shard_count = shard
+        dir_sizes = [(root, sum(size for _, size in txt_files)) for root, txt_files in found.items()]
+        selected = partition_directories(dir_sizes, shard_count, base_dir)[shard_index]
+        print(f"Shard {shard_index}/{shard_count}: {len(selected)} of {len(found)} directories")
+    shard_counts = EntityCounts()
+
+    directories = {}
+    tasks = []
+    for root in selected:
+        txt_files = found[root]
+        if not txt_files:
+            finish_directory(root, [], output_format)
+            write_count_summary(EntityCounts(), count_file_path(root))
+            continue
+        # Parts are concatenated in file name order, whatever order they finish in
+        directories[root] = {'remaining': len(txt_files), 'counts': EntityCounts(), 'rows': 0,
+                             'parts': [part_path(root, path, output_format) for path, _ in txt_files]}
+        tasks += [(size, root, path) for path, size in txt_files]
+
+    tasks.sort(key=lambda task: task[0], reverse=True)
+    print(f"Processing {len(tasks)} files in {len(directories)} directories")
+    start = time.time()
+
+    worker = partial(process_task, sections=sections, chunk_chars=chunk_chars, output_format=output_format)
+    with Pool(workers or multiprocessing.cpu_count(), initializer=init_worker, initargs=(model_name,)) as pool:
+        results = pool.imap_unordered(worker, ((root, path) for _, root, path in tasks))
+        for done, (root, rows, entity_counts) in enumerate(results, 1):
+            state = directories[root]
+            state['counts'].merge(entity_counts)
+            state['rows'] += rows
+            state['remaining'] -= 1
+            if state['remaining'] == 0:
+                output_file = finish_directory(root, state['parts'], output_format)
+                count_file = count_file_path(root)
+                write_count_summary(state['counts'], count_file)
+                if shard is not None:
+                    # Document names are only unique within a directory
+                    shard_counts.merge(state['counts'], doc_prefix=os.path.relpath(root, base_dir) + '/')
+                del directories[root]
+                print(f"Entity details written to {output_file} ({state['rows']} rows)")
+                print(f"Entity count summary written to {count_file}")
+
+            if done % 100 == 0:
+                print(f"Progress: {done}/{len(tasks)} files in {time.time() - start:.0f}s")
+
+    if shard is not None:
+        shard_dir = shard_dir or base_dir
+        os.makedirs(shard_dir, exist_ok=True)
+        path = shard_counts_path(shard_dir, *shard)
+        shard_counts.save(path)
+        print(f"Shard counts written to {path}")
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_dir', type=str, required=True, help='Parent directory with subdirectories containing text files')
     parser.add_argument('--start_range', type=int, required=True, help='Start of numeric directory range')
     parser.add_argument('--end_range', type=int, required=True, help='End of numeric directory range')
+    parser.add_argument('--catalog', type=str, required=False, help='Hashed corpus catalog (corpus_catalog.py) of input_dir, duplicate filings are skipped')
+    parser.add_argument('--sections', type=str, required=False, help='Comma separated 10-K items to run NER on, e.g. 1,1A,7,7A. Defaults to the whole file')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='Worker processes, each loads the model once')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, help='SpaCy model to load in the workers')
+    parser.add_argument('--format', type=str, choices=list(FORMAT_SUFFIXES), default='csv', help='Format of the <dir>_entities file')
+    parser.add_argument('--shards', type=int, required=False, help='Split the directories of the range by size across this many array job tasks')
+    parser.add_argument('--shard_index', type=int, required=False, help='Task index for --shards. Defaults to the value of --task_env')
+    parser.add_argument('--task_env', type=str, default=DEFAULT_TASK_ENV, help='Environment variable holding the task index')
+    parser.add_argument('--shard_dir', type=str, required=False, help='Where the shard counts for merge_entity_counts.py go. Defaults to input_dir')
+    parser.add_argument('--chunk_chars', type=int, default=DEFAULT_CHUNK_CHARS, help='Largest piece of text spaCy sees at once, split on paragraph and sentence boundaries')
     args = parser.parse_args()
+    sections = parse_sections(args.sections)
+
+    shard = None
+    if args.shards:
+        shard_index = args.shard_index
+        if shard_index is None:
+            if args.task_env not in os.environ:
+                parser.error(f"--shards needs --shard_index or the {args.task_env} environment variable")
+            shard_index = int(os.environ[args.task_env])
+        if not 0 <= shard_index < args.shards:
+            parser.error(f"Shard index {shard_index} is outside 0..{args.shards - 1}")
+        shard = (shard_index, args.shards)
 
-    find_and_process_txt_dirs(args.input_dir, args.start_range, args.end_range)
+    catalog = CorpusCatalog(args.catalog, args.input_dir) if args.catalog else None
+    try:
+        find_and_process_txt_dirs(args.input_dir, args.start_range, args.end_range, catalog, sections, args.chunk_chars,
+                                  workers=args.workers, model_name=args.model, output_format=args.format,
+                                  shard=shard, shard_dir=args.shard_dir)
+    finally:
+        if catalog is not None:
+            catalog.close()
     print("Processing complete.")
 
 if __name__ == '__main__':
@@ -0,0 +1,160 @@
+import numpy as np
+
+# Compact, mergeable entity counts for entityListandCount.py.
+# The old structure was a dict of (label, entity) -> {'Count': n, 'Documents': set of file names},
+# so every key carried its own set of full file name strings, all of it pickled from the workers
+# and merged key by key in Python. Here entity keys and document names are interned once into
+# integer ids, counts live in one int64 array indexed by key id, and postings (which documents
+# a key appears in) are (key id, doc id) int32 pairs, sorted and deduplicated into CSR arrays
+# when they are read. merge() remaps the other side's ids and concatenates arrays, so merging is
+# associative and the order results come back in does not matter. Pickled (worker -> parent),
+# it is a handful of arrays in the smallest dtypes that fit plus one string of entities.
+
+# Pending postings merged before they are deduplicated
+COMPACT_EVERY = 1 << 22
+
+class EntityCounts:
+    def __init__(self):
+        self.keys = []        # key id -> (label, entity)
+        self.key_ids = {}
+        self.docs = []        # doc id -> file name
+        self.doc_ids = {}
+        self.counts = np.zeros(0, dtype=np.int64)
+        # Pending (key id, doc id) pairs, compacted into sorted unique postings on demand
+        self._pairs = []
+        self._pending = 0
+        self._postings = None
+
+    @classmethod
+    def for_file(cls, file_name, counter):
+        """Counts of one file from a Counter of (label, entity) -> occurrences."""
+        result = cls()
+        doc_id = result._doc_id(file_name)
+        key_ids = np.array([result._key_id(key) for key in counter], dtype=np.int32)
+        result.counts = np.fromiter(counter.values(), dtype=np.int64, count=len(counter))
+        result._pairs.append(np.stack([key_ids, np.full(len(key_ids), doc_id, dtype=np.int32)]))
+        return result
+
+    def _key_id(self, key):
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = self.key_ids[key] = len(self.keys)
+            self.keys.append(key)
+        return key_id
+
+    def _doc_id(self, name):
+        doc_id = self.doc_ids.get(name)
+        if doc_id is None:
+            doc_id = self.doc_ids[name] = len(self.docs)
+            self.docs.append(name)
+        return doc_id
+
+    def merge(self, other, doc_prefix=''):
+        """
+        Add other's counts and postings into this one. Returns self.
+        doc_prefix is put in front of other's document names, so file names that are only unique
+        within their directory stay apart once directories are merged ('100/' + 'document1.txt').
+        """
+        if not other.keys:
+            return self
+        key_map = np.array([self._key_id(key) for key in other.keys], dtype=np.int32)
+        doc_map = np.array([self._doc_id(doc_prefix + name) for name in other.docs], dtype=np.int32)
+
+        if len(self.counts) < len(self.keys):
+            self.counts = np.concatenate([self.counts, np.zeros(len(self.keys) - len(self.counts), dtype=np.int64)])
+        np.add.at(self.counts, key_map, other.counts)
+
+        key_ids, doc_ids = other._compact()
+        self._pairs.append(np.stack([key_map[key_ids], doc_map[doc_ids]]))
+        self._pending += len(key_ids)
+        self._postings = None
+        # Deduplicate now and then so a long run of merges stays close to the size of its postings
+        if self._pending > COMPACT_EVERY:
+            self._compact()
+            self._pending = 0
+        return self
+
+    def _compact(self):
+        """Sorted, unique (key ids, doc ids) of every posting."""
+        if self._postings is None:
+            if self._pairs:
+                pairs = np.concatenate(self._pairs, axis=1)
+                # One int64 per pair sorts by key id, then doc id
+                packed = np.unique((pairs[0].astype(np.int64) << 32) | pairs[1])
+                pairs = np.stack([(packed >> 32).astype(np.int32), (packed & 0xFFFFFFFF).astype(np.int32)])
+            else:
+                pairs = np.zeros((2, 0), dtype=np.int32)
+            self._pairs = [pairs]
+            self._postings = (pairs[0], pairs[1])
+        return self._postings
+
+    def __len__(self):
+        return len(self.keys)
+
+    def postings(self):
+        """
+        CSR postings (indptr, doc ids): the documents of key k are doc_ids[indptr[k]:indptr[k + 1]],
+        sorted. Doc ids use the smallest unsigned type that holds them.
+        """
+        key_ids, doc_ids = self._compact()
+        indptr = np.searchsorted(key_ids, np.arange(len(self.keys) + 1))
+        return indptr, doc_ids.astype(np.min_scalar_type(max(len(self.docs) - 1, 0)))
+
+    def document_frequencies(self):
+        """Number of documents each key appears in, indexed by key id."""
+        indptr, _ = self.postings()
+        return np.diff(indptr)
+
+    def items(self):
+        """Yield ((label, entity), count, [file names]) in the order the keys were first seen."""
+        indptr, doc_ids = self.postings()
+        for key_id, key in enumerate(self.keys):
+            docs = doc_ids[indptr[key_id]:indptr[key_id + 1]]
+            yield key, int(self.counts[key_id]), [self.docs[d] for d in docs]
+
+    def __getstate__(self):
+        # Ship the CSR postings, the id lookups are rebuilt on the other side
+        indptr, doc_ids = self.postings()
+        counts = self.counts.astype(np.min_scalar_type(int(self.counts.max()) if len(self.counts) else 0))
+        # Keys go as label codes plus one newline-joined string, much smaller than a tuple per key.
+        # Entities are whitespace-split tokens, so they never contain a newline.
+        labels = sorted({label for label, _ in self.keys})
+        label_codes = {label: i for i, label in enumerate(labels)}
+        indptr = indptr.astype(np.min_scalar_type(int(indptr[-1])))
+        return {'labels': labels,
+                'label_codes': np.array([label_codes[label] for label, _ in self.keys], dtype=np.uint8),
+                'entities': '\n'.join(entity for _, entity in self.keys),
+                'docs': self.docs, 'counts': counts, 'indptr': indptr, 'doc_ids': doc_ids}
+
+    def __setstate__(self, state):
+        labels = state['labels']
+        entities = state['entities'].split('\n') if len(state['label_codes']) else []
+        self.keys = [(labels[code], entity) for code, entity in zip(state['label_codes'].tolist(), entities)]
+        self.key_ids = {key: i for i, key in enumerate(self.keys)}
+        self.docs = state['docs']
+        self.doc_ids = {name: i for i, name in enumerate(self.docs)}
+        self.counts = state['counts'].astype(np.int64)
+        indptr = state['indptr'].astype(np.int64)
+        key_ids = np.repeat(np.arange(len(self.keys), dtype=np.int32), np.diff(indptr))
+        self._pairs = [np.stack([key_ids, state['doc_ids'].astype(np.int32)])]
+        self._pending = 0
+        self._postings = None
+
+    def save(self, path):
+        """Write to a compressed .npz, e.g. the counts of one shard for merge_entity_counts.py."""
+        state = self.__getstate__()
+        state['labels'] = np.array(state['labels'], dtype=str)
+        state['entities'] = np.array(state['entities'], dtype=str)
+        state['docs'] = np.array(state['docs'], dtype=str)
+        np.savez_compressed(path, **state)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            state = {name: data[name] for name in data.files}
+        state['labels'] = state['labels'].tolist()
+        state['entities'] = str(state['entities'])
+        state['docs'] = state['docs'].tolist()
+        result = cls.__new__(cls)
+        result.__setstate__(state)
+        return result
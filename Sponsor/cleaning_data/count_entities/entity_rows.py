@@ -0,0 +1,86 @@
+import io
+import os
+import csv
+import gzip
+import shutil
+
+# Streaming output of the per-mention entity rows of entityListandCount.py.
+# Each worker writes the rows of the file it just processed to its own part file, so the rows never
+# travel back to the parent and nothing holds more than one file's rows. When the last file of a
+# directory is done the parent concatenates the parts into <dir>_entities.<ext> and removes them.
+# csv and gzip parts are concatenated byte for byte (gzip members can be chained), parquet parts
+# are copied one table at a time through a ParquetWriter.
+
+ENTITY_FIELDS = ['Entity', 'Type', 'Line Number', 'Start Position', 'End Position', 'File']
+
+FORMAT_SUFFIXES = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet'}
+
+def entities_path(directory, output_format='csv'):
+    dir_name = os.path.basename(directory)
+    return os.path.join(directory, f"{dir_name}_entities{FORMAT_SUFFIXES[output_format]}")
+
+def parts_dir(directory):
+    return os.path.join(directory, f".{os.path.basename(directory)}_entities.parts")
+
+def part_path(directory, file_path, output_format='csv'):
+    return os.path.join(parts_dir(directory), os.path.basename(file_path) + FORMAT_SUFFIXES[output_format])
+
+def parquet_schema():
+    import pyarrow as pa
+    return pa.schema([('Entity', pa.string()), ('Type', pa.string()), ('Line Number', pa.int64()),
+                      ('Start Position', pa.int64()), ('End Position', pa.int64()), ('File', pa.string())])
+
+def text_writer(raw, output_format='csv'):
+    """Text stream for csv rows over the binary file raw, gzip compressed for csv.gz."""
+    if output_format == 'csv.gz':
+        # No file name in the gzip header, it would be the temporary one
+        raw = gzip.GzipFile(filename='', mode='wb', fileobj=raw)
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+def write_part(rows, path, output_format='csv'):
+    """Write one file's entity rows (dicts with ENTITY_FIELDS) to a part file, without a header."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    if output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.Table.from_pylist(rows, schema=parquet_schema()), tmp_path)
+    else:
+        with open(tmp_path, 'wb') as raw, text_writer(raw, output_format) as f:
+            csv.DictWriter(f, fieldnames=ENTITY_FIELDS).writerows(rows)
+    # A part only shows up once it is complete
+    os.replace(tmp_path, path)
+
+def write_header(path, output_format='csv'):
+    with open(path, 'wb') as raw, text_writer(raw, output_format) as f:
+        csv.writer(f).writerow(ENTITY_FIELDS)
+
+def concat_parts(part_paths, output_path, output_format='csv'):
+    """Concatenate part files into output_path (with one header) and delete them. Returns the row count for parquet."""
+    tmp_path = output_path + '.tmp'
+    rows = None
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        rows = 0
+        with pq.ParquetWriter(tmp_path, parquet_schema()) as writer:
+            for path in part_paths:
+                table = pq.read_table(path)
+                writer.write_table(table)
+                rows += table.num_rows
+    else:
+        write_header(tmp_path, output_format)
+        with open(tmp_path, 'ab') as out:
+            for path in part_paths:
+                with open(path, 'rb') as part:
+                    shutil.copyfileobj(part, out)
+    os.replace(tmp_path, output_path)
+    for path in part_paths:
+        os.remove(path)
+    return rows
+
+def finish_directory(directory, part_paths, output_format='csv'):
+    """Build the directory's entities file from its parts and remove the parts directory."""
+    output_path = entities_path(directory, output_format)
+    concat_parts([p for p in part_paths if os.path.exists(p)], output_path, output_format)
+    shutil.rmtree(parts_dir(directory), ignore_errors=True)
+    return output_path
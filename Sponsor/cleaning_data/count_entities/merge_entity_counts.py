@@ -0,0 +1,66 @@
+import os
+import re
+import csv
+import glob
+import argparse
+
+from entity_counts import EntityCounts
+
+# Reduce step of a sharded entityListandCount.py run. Every array job task saves the merged counts of
+# its directories as entity_counts_shard{i}of{N}.npz, this merges all of them into one global table
+# of entity counts with document frequencies (how many filings each entity appears in).
+#
+# Simulating a 3 task array job locally (test_merge_entity_counts.py does the same on a small tree):
+#   for i in 0 1 2; do SLURM_ARRAY_TASK_ID=$i python entityListandCount.py --input_dir parsed \
+#       --start_range 100 --end_range 999 --shards 3 --shard_dir shards; done
+#   python merge_entity_counts.py --shard_dir shards --output global_entity_counts.csv
+
+SHARD_FILE = re.compile(r'entity_counts_shard(\d+)of(\d+)\.npz$')
+
+def find_shards(shard_dir):
+    """Shard files of shard_dir as {shard count: {index: path}}."""
+    shards = {}
+    for path in glob.glob(os.path.join(shard_dir, 'entity_counts_shard*of*.npz')):
+        match = SHARD_FILE.search(os.path.basename(path))
+        if match:
+            shards.setdefault(int(match.group(2)), {})[int(match.group(1))] = path
+    return shards
+
+def merge_shards(paths):
+    """Merge shard counts in index order. Merging is associative, the order only fixes the row order."""
+    merged = EntityCounts()
+    for path in paths:
+        merged.merge(EntityCounts.load(path))
+    return merged
+
+def write_global_counts(merged, output_file):
+    """One row per (type, entity) with its total count and the number of documents it appears in."""
+    frequencies = merged.document_frequencies()
+    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Type', 'Entity', 'Count', 'Document Frequency'])
+        for key_id, (entity_type, entity) in enumerate(merged.keys):
+            writer.writerow([entity_type, entity, int(merged.counts[key_id]), int(frequencies[key_id])])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge the shard counts of a sharded entityListandCount.py run.')
+    parser.add_argument('--shard_dir', type=str, required=True, help='Directory with the entity_counts_shard{i}of{N}.npz files')
+    parser.add_argument('--output', type=str, default='global_entity_counts.csv', help='Global entity count table')
+    parser.add_argument('--allow_missing', action='store_true', help='Merge even if some shards of the run are missing')
+    args = parser.parse_args()
+
+    shards = find_shards(args.shard_dir)
+    if not shards:
+        parser.error(f"No shard files in {args.shard_dir}")
+    if len(shards) > 1:
+        parser.error(f"Shard files of different runs in {args.shard_dir}: {sorted(shards)} shards")
+    shard_count, paths = next(iter(shards.items()))
+    missing = sorted(set(range(shard_count)) - set(paths))
+    if missing:
+        print(f"Missing shards {missing} of {shard_count}")
+        if not args.allow_missing:
+            raise SystemExit(1)
+
+    merged = merge_shards([paths[i] for i in sorted(paths)])
+    write_global_counts(merged, args.output)
+    print(f"{len(merged)} entities from {len(merged.docs)} documents in {len(paths)} shards written to {args.output}")
@@ -0,0 +1,64 @@
+import re
+
+# Bounded-memory NER over long filings. spaCy's memory grows with the length of the text it is
+# given (about 1 GB per 100k characters with the parser on), so instead of nlp(text) on a whole
+# 10-K the text is cut into pieces of at most max_chars on paragraph or sentence boundaries and
+# streamed through nlp.pipe. Entity offsets are shifted back to positions in the full text, so
+# the output lines up with a whole-document run while peak memory depends on max_chars only.
+# nlp.pipe holds a whole batch of chunks at once, so the batch size is derived from max_chars to
+# keep the text in flight under MAX_CHARS_IN_FLIGHT: one chunk at the default size, more for small ones.
+
+DEFAULT_CHUNK_CHARS = 100_000
+MAX_CHARS_IN_FLIGHT = 100_000
+
+# Where a chunk may end, best first: blank line, line break, end of a sentence, any whitespace
+BOUNDARIES = [
+    re.compile(r'\n\s*\n'),
+    re.compile(r'\n'),
+    re.compile(r'[.!?]["\')\]]*\s'),
+    re.compile(r'\s'),
+]
+
+def find_cut(text, start, end, min_end):
+    """Best place to end a chunk of text[start:end], not before min_end. Falls back to end."""
+    for boundary in BOUNDARIES:
+        cut = None
+        # Last match in the window wins, so chunks stay as large as allowed
+        for match in boundary.finditer(text, min_end, end):
+            cut = match.end()
+        if cut is not None:
+            return cut
+    return end
+
+def iter_chunks(text, max_chars=DEFAULT_CHUNK_CHARS, start=0, end=None):
+    """
+    Yield (offset, chunk) pieces of text[start:end], each at most max_chars long and cut on the best
+    boundary in its second half. Joining the chunks gives back text[start:end] exactly.
+    """
+    end = len(text) if end is None else end
+    while start < end:
+        if end - start <= max_chars:
+            yield start, text[start:end]
+            return
+        cut = find_cut(text, start, start + max_chars, start + max_chars // 2)
+        yield start, text[start:cut]
+        start = cut
+
+def pipe_batch_size(max_chars, max_in_flight=MAX_CHARS_IN_FLIGHT):
+    """Chunks per nlp.pipe batch so that at most max_in_flight characters are processed at once."""
+    return max(1, max_in_flight // max_chars)
+
+def iter_entities(nlp, text, spans=None, max_chars=DEFAULT_CHUNK_CHARS, batch_size=None):
+    """
+    Run nlp over text (or only over the (start, end) spans) in chunks of at most max_chars and yield
+    (entity text, label, start_char, end_char) with offsets into the full text. batch_size defaults
+    to pipe_batch_size(max_chars).
+    """
+    spans = spans if spans is not None else [(0, len(text))]
+    if batch_size is None:
+        batch_size = pipe_batch_size(max_chars)
+    chunks = ((chunk, offset) for span_start, span_end in spans
+              for offset, chunk in iter_chunks(text, max_chars, span_start, span_end))
+    for doc, offset in nlp.pipe(chunks, as_tuples=True, batch_size=batch_size):
+        for ent in doc.ents:
+            yield ent.text, ent.label_, ent.start_char + offset, ent.end_char + offset
@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import csv
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Shared filing reader lives with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from filing_storage import read_filing, is_filing, strip_compression_suffix
+from filing_metadata import accession_year
+from dispersion_index import DispersionIndex, DEFAULT_INDEX, STATE_NAMES
+
+# Gazetteer fast path for the dispersion metric: which of the 50 state names a filing mentions, found
+# by one compiled pattern over the raw text instead of a spaCy pass and a GPE filter.
+# The pattern is a trie of the names ("New (?:Hampshire|Jersey|Mexico|York)|...") so the regex engine
+# never backtracks through 100 alternatives, in Title Case and UPPER CASE (10-K headings) variants.
+#
+# Boundary rules: no letter right before a name, and no lowercase letter right after it
+# ("Kansas" is not found in "Arkansas", nor "Indiana" in "Indianapolis"). An uppercase letter may
+# follow, because filterHTML.py glues text pieces together ("OhioThe Company ..."), but not after an
+# UPPER CASE name, which would then be part of a longer word. "West Virginia" is a single match,
+# never also "Virginia".
+#
+# Results go to the gazetteer table of the dispersion index, per filing (all documents of a filing
+# directory together), incrementally like the entity report refresh. --agreement compares the state
+# sets with the NER based ones already in the index, per filing and per state.
+#
+#   python state_gazetteer.py --input_dir /scratch/alpine/nimi2356/parsed --agreement gazetteer_agreement.csv
+
+def trie_pattern(words):
+    """Regex alternation of words shaped as a trie, longest alternatives first."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        end = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A word ending here while longer words go on: the longer ones are tried first
+        return f'(?:{body})?' if end else body
+
+    return build(trie)
+
+def state_variants(names):
+    """{spelling: state} for the Title Case and UPPER CASE spelling of every state."""
+    variants = {}
+    for name in names:
+        variants[name] = name
+        variants[name.upper()] = name
+    return variants
+
+STATE_VARIANTS = state_variants(STATE_NAMES)
+# Multi-word names may be split by any whitespace, including a line break.
+# The left boundary is checked in find_states: a lookbehind in front of the trie is tried at every
+# position of the text and makes the scan about 4x slower, while matches are rare.
+STATE_PATTERN = re.compile(r'(' + trie_pattern(STATE_VARIANTS).replace(r'\ ', r'\s+') + r')(?![a-z])')
+WHITESPACE = re.compile(r'\s+')
+
+def find_states(text):
+    """Counter of state name -> mentions in text."""
+    counts = Counter()
+    search = STATE_PATTERN.search
+    match = search(text)
+    while match:
+        start, end = match.span()
+        if start and text[start - 1].isascii() and text[start - 1].isalpha():
+            # Inside a word, look again from the next character ("aWest Virginia" still has "Virginia")
+            match = search(text, start + 1)
+            continue
+        match = search(text, end)
+        spelling = WHITESPACE.sub(' ', text[start:end])
+        state = STATE_VARIANTS.get(spelling)
+        if state is None:
+            continue
+        # An UPPER CASE name must not run on into more capitals ("OHIOAN")
+        if spelling.isupper() and end < len(text) and text[end].isupper():
+            continue
+        counts[state] += 1
+    return counts
+
+def filing_of(path):
+    """Filing id of a text file: the accession directory of a filterHTML.py documentN.txt, else the file name."""
+    name = strip_compression_suffix(os.path.basename(path))
+    if name.startswith('document'):
+        return os.path.basename(os.path.dirname(path)), os.path.dirname(path)
+    return os.path.splitext(name)[0], path
+
+def scan_text_filings(base_directory):
+    """{filing id: (filing path, [(text path, mtime_ns, size)])} of every text file under base_directory."""
+    filings = {}
+    stack = [base_directory]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif is_filing(entry.name):
+                    st = entry.stat()
+                    fid, filing_path = filing_of(entry.path)
+                    # The first place a filing shows up (by path) is the one that counts
+                    known_path, files = filings.setdefault(fid, (filing_path, []))
+                    if known_path == filing_path:
+                        files.append((entry.path, st.st_mtime_ns, st.st_size))
+    return filings
+
+def scan_filing(task):
+    """Pool worker: state mentions over all text files of one filing."""
+    fid, paths = task
+    counts = Counter()
+    size = 0
+    for path in paths:
+        text = read_filing(path, errors='replace')
+        size += len(text)
+        counts.update(find_states(text))
+    return fid, counts, size
+
+def refresh_gazetteer(index, base_directory, workers=None):
+    """Scan the filings under base_directory that are new or changed since the last refresh. Returns counts."""
+    base_directory = os.path.abspath(base_directory)
+    known = index.known('gazetteer')
+    stats = {'scanned': 0, 'unchanged': 0, 'chars': 0, 'seconds': 0.0}
+    todo = {}
+    for fid, (filing_path, files) in scan_text_filings(base_directory).items():
+        # A filing changes when any of its documents does
+        key = (filing_path, max(mtime for _, mtime, _ in files), sum(size for _, _, size in files))
+        if known.get(fid) == key:
+            stats['unchanged'] += 1
+        else:
+            todo[fid] = (key, sorted(path for path, _, _ in files))
+
+    start = time.time()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = ((fid, paths) for fid, (_, paths) in todo.items())
+        for fid, counts, size in pool.map(scan_filing, tasks, chunksize=32):
+            (filing_path, mtime_ns, total_size), _ = todo[fid]
+            states = sorted(counts)
+            rows.append((fid, os.path.basename(filing_path), filing_path, mtime_ns, total_size, accession_year(fid),
+                         len(states), ','.join(states), ';'.join(f'{state}:{counts[state]}' for state in states)))
+            stats['scanned'] += 1
+            stats['chars'] += size
+            if len(rows) >= 10000:
+                index.store_gazetteer(rows)
+                rows = []
+    index.store_gazetteer(rows)
+    stats['seconds'] = round(time.time() - start, 2)
+    return stats
+
+def agreement_report(index, output_csv):
+    """
+    Compare gazetteer and NER state sets of every filing in both, write one row per filing and return
+    (filings compared, filings with identical sets, mean Jaccard, per state [state, both, NER only, gazetteer only]).
+    """
+    ner = index.states_by_filing('ner')
+    gazetteer = index.states_by_filing('gazetteer')
+    common = sorted(set(ner) & set(gazetteer))
+    per_state = {state: [0, 0, 0] for state in STATE_NAMES}
+    identical = 0
+    jaccard_total = 0.0
+
+    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Filing', 'NER States', 'Gazetteer States', 'Jaccard', 'NER Only', 'Gazetteer Only'])
+        for fid in common:
+            a, b = ner[fid], gazetteer[fid]
+            union = a | b
+            jaccard = len(a & b) / len(union) if union else 1.0
+            jaccard_total += jaccard
+            identical += a == b
+            for state in a & b:
+                per_state[state][0] += 1
+            for state in a - b:
+                per_state[state][1] += 1
+            for state in b - a:
+                per_state[state][2] += 1
+            writer.writerow([fid, len(a), len(b), f'{jaccard:.3f}', ' '.join(sorted(a - b)), ' '.join(sorted(b - a))])
+
+    mean_jaccard = jaccard_total / len(common) if common else 0.0
+    return len(common), identical, mean_jaccard, [[state] + per_state[state] for state in STATE_NAMES]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find US state mentions with a gazetteer instead of spaCy.')
+    parser.add_argument('--index', type=str, default=DEFAULT_INDEX, help='Dispersion index to store the results in')
+    parser.add_argument('--input_dir', type=str, nargs='*', default=[], help='Trees of text files (filterHTML.py output or raw filings)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes scanning filings')
+    parser.add_argument('--agreement', type=str, required=False, help='Write the per-filing agreement with the NER results here')
+    parser.add_argument('--export', type=str, required=False, help='Write the File,UniqueStatesCount csv of the gazetteer here')
+    args = parser.parse_args()
+
+    index = DispersionIndex(args.index)
+    for directory in args.input_dir:
+        stats = refresh_gazetteer(index, directory, workers=args.workers)
+        rate = stats['chars'] / 1024 ** 2 / stats['seconds'] if stats['seconds'] else 0
+        print(f"{directory}: {stats['scanned']} filings scanned ({rate:.1f} MB/s), {stats['unchanged']} unchanged")
+
+    if args.export:
+        print(f"{index.export_csv(args.export, source='gazetteer')} filings written to {args.export}")
+
+    if args.agreement:
+        compared, identical, mean_jaccard, per_state = agreement_report(index, args.agreement)
+        print(f"{compared} filings in both: {identical} identical state sets, mean Jaccard {mean_jaccard:.3f}")
+        print(f"{'State':<16}{'Both':>8}{'NER only':>10}{'Gaz only':>10}")
+        for state, both, ner_only, gazetteer_only in per_state:
+            if both or ner_only or gazetteer_only:
+                print(f"{state:<16}{both:>8}{ner_only:>10}{gazetteer_only:>10}")
+        print(f"Per-filing agreement written to {args.agreement}")
+    index.close()
@@ -0,0 +1,22 @@
+from dispersion_index import DispersionIndex
+
+def write_report(directory, accession, states):
+    directory.mkdir(parents=True, exist_ok=True)
+    rows = ''.join(f'GPE,{state}\n' for state in states)
+    (directory / f'entity_report_{accession}.csv').write_text('Type,Entity\n' + rows + 'ORG,Acme Corp\n')
+
+def test_export_of_one_tree(tmp_path):
+    # Two trees in one index, the second one's name starts like the first
+    write_report(tmp_path / 'tree' / '100', '0000100000-14-000001', ['Ohio', 'Texas'])
+    write_report(tmp_path / 'tree' / '101', '0000100000-15-000002', ['Ohio'])
+    write_report(tmp_path / 'tree2' / '100', '0000100000-16-000003', ['Ohio', 'Texas', 'Utah'])
+    index = DispersionIndex(str(tmp_path / 'index.sqlite'))
+    for tree in ['tree', 'tree2']:
+        assert index.refresh(str(tmp_path / tree), workers=1)['read'] > 0
+
+    assert sorted(index.unique_state_counts()) == [1, 2, 3]
+    assert sorted(index.unique_state_counts(under=str(tmp_path / 'tree'))) == [1, 2]
+    output = tmp_path / 'unique_states.csv'
+    assert index.export_csv(str(output), under=str(tmp_path / 'tree2')) == 1
+    assert output.read_text().splitlines() == ['File,UniqueStatesCount', 'entity_report_0000100000-16-000003.csv,3']
+    index.close()
@@ -0,0 +1,79 @@
+import pickle
+from collections import Counter
+
+from entity_counts import EntityCounts
+
+FILES = {
+    'document1.txt': Counter({('GPE', 'Ohio'): 3, ('ORG', 'Barnes Group'): 1}),
+    'document2.txt': Counter({('GPE', 'Ohio'): 1, ('GPE', 'Texas'): 2}),
+    'document3.txt': Counter({('NORP', 'American'): 5, ('ORG', 'Barnes Group'): 2}),
+}
+
+def as_dict(counts):
+    return {key: (count, sorted(docs)) for key, count, docs in counts.items()}
+
+def merged(names, doc_prefix=''):
+    result = EntityCounts()
+    for name in names:
+        result.merge(EntityCounts.for_file(name, FILES[name]), doc_prefix)
+    return result
+
+def test_merge_counts_and_documents():
+    assert as_dict(merged(FILES)) == {
+        ('GPE', 'Ohio'): (4, ['document1.txt', 'document2.txt']),
+        ('ORG', 'Barnes Group'): (3, ['document1.txt', 'document3.txt']),
+        ('GPE', 'Texas'): (2, ['document2.txt']),
+        ('NORP', 'American'): (5, ['document3.txt']),
+    }
+
+def test_merge_order_does_not_matter():
+    expected = as_dict(merged(FILES))
+    assert as_dict(merged(reversed(list(FILES)))) == expected
+    # Merging partial merges, like the parent does with the results of the workers
+    left, right = merged(['document1.txt']), merged(['document2.txt', 'document3.txt'])
+    assert as_dict(EntityCounts().merge(right).merge(left)) == expected
+    # The same document twice counts twice but is one posting
+    twice = merged(['document1.txt', 'document1.txt'])
+    assert as_dict(twice)[('GPE', 'Ohio')] == (6, ['document1.txt'])
+
+def test_csr_postings():
+    counts = merged(FILES)
+    indptr, doc_ids = counts.postings()
+    assert list(indptr) == [0, 2, 4, 5, 6]
+    assert [counts.docs[d] for d in doc_ids[indptr[0]:indptr[1]]] == ['document1.txt', 'document2.txt']
+    assert doc_ids.dtype.itemsize == 1
+
+def test_pickle_round_trip():
+    counts = merged(FILES)
+    copy = pickle.loads(pickle.dumps(counts))
+    assert copy.keys == counts.keys and copy.docs == counts.docs
+    assert as_dict(copy) == as_dict(counts)
+    # A copy keeps merging like the original
+    copy.merge(EntityCounts.for_file('document4.txt', Counter({('GPE', 'Ohio'): 1})))
+    assert as_dict(copy)[('GPE', 'Ohio')] == (5, ['document1.txt', 'document2.txt', 'document4.txt'])
+
+def test_empty_pickle_round_trip():
+    copy = pickle.loads(pickle.dumps(EntityCounts()))
+    assert len(copy) == 0 and list(copy.items()) == []
+    assert as_dict(copy.merge(merged(['document2.txt']))) == as_dict(merged(['document2.txt']))
+
+def test_doc_prefix_keeps_directories_apart():
+    counts = EntityCounts()
+    counts.merge(merged(['document1.txt']), '100/').merge(merged(['document1.txt']), '200/')
+    assert as_dict(counts)[('GPE', 'Ohio')] == (6, ['100/document1.txt', '200/document1.txt'])
+    assert dict(zip(counts.keys, counts.document_frequencies().tolist())) == \
+        {('GPE', 'Ohio'): 2, ('ORG', 'Barnes Group'): 2}
+
+def test_save_load_round_trip(tmp_path):
+    counts = merged(FILES, 'dir/')
+    counts.save(tmp_path / 'shard0.npz')
+    loaded = EntityCounts.load(tmp_path / 'shard0.npz')
+    assert loaded.keys == counts.keys and loaded.docs == counts.docs
+    assert as_dict(loaded) == as_dict(counts)
+    assert list(loaded.document_frequencies()) == list(counts.document_frequencies())
+
+def test_empty_save_load_round_trip(tmp_path):
+    EntityCounts().save(tmp_path / 'empty.npz')
+    loaded = EntityCounts.load(tmp_path / 'empty.npz')
+    assert len(loaded) == 0 and list(loaded.items()) == []
+    assert as_dict(loaded.merge(merged(['document2.txt']))) == as_dict(merged(['document2.txt']))
@@ -0,0 +1,135 @@
+import os
+import re
+import csv
+import random
+from collections import Counter
+
+import pytest
+
+import entityListandCount
+from entityListandCount import partition_directories, find_and_process_txt_dirs, count_file_path
+from merge_entity_counts import find_shards, merge_shards, write_global_counts
+
+# Stand-in for the spaCy model: a fixed vocabulary of entities, found at their positions in the text
+VOCABULARY = {'Ohio': 'GPE', 'Texas': 'GPE', 'Acme Corp': 'ORG', 'Barnes Group': 'ORG', 'John Smith': 'PERSON',
+              'Denver': 'LOC'}
+ENTITY = re.compile('|'.join(sorted(VOCABULARY, key=len, reverse=True)))
+
+class Span:
+    def __init__(self, match):
+        self.text = match.group()
+        self.label_ = VOCABULARY[self.text]
+        self.start_char, self.end_char = match.span()
+
+class Doc:
+    def __init__(self, text):
+        self.ents = [Span(match) for match in ENTITY.finditer(text)]
+
+class VocabularyNlp:
+    def pipe(self, items, as_tuples=False, batch_size=1):
+        for text, context in items:
+            yield Doc(text), context
+
+def vocabulary_worker(model_name=None):
+    entityListandCount.nlp = VocabularyNlp()
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    # Numeric directories of different sizes, the same file names in several of them
+    monkeypatch.setattr(entityListandCount, 'init_worker', vocabulary_worker)
+    rng = random.Random(0)
+    base = tmp_path / 'parsed'
+    for n, directory in enumerate(['100', '101', '102', '203', '250', '999']):
+        path = base / directory[0] / directory
+        path.mkdir(parents=True)
+        for i in range(1 + n % 3):
+            words = [rng.choice(list(VOCABULARY) + ['the', 'company', 'sold', 'widgets', 'in']) for _ in range(40 * (n + 1))]
+            (path / f'document{i + 1}.txt').write_text(' '.join(words) + '\n')
+    # Out of the range
+    (base / '1' / '1000').mkdir(parents=True)
+    (base / '1' / '1000' / 'document1.txt').write_text('Ohio')
+    return str(base)
+
+def directory_sizes(base):
+    sizes = []
+    for root, _, files in os.walk(base):
+        name = os.path.basename(root)
+        if name.isdigit() and 100 <= int(name) <= 999:
+            sizes.append((root, sum(os.path.getsize(os.path.join(root, f)) for f in files)))
+    return sizes
+
+def test_partition_directories(tree):
+    sizes = directory_sizes(tree)
+    size_of = dict(sizes)
+    largest = max(size for _, size in sizes)
+    for shard_count in range(1, 5):
+        shards = partition_directories(sizes, shard_count, tree)
+        # Every directory in exactly one shard
+        assert sorted(d for shard in shards for d in shard) == sorted(size_of)
+        # Every task computes the same partition, whatever order it listed the tree in
+        assert partition_directories(list(reversed(sizes)), shard_count, tree) == shards
+        # Largest first: the first shard_count directories go to different shards, each shard gets
+        # its directories in decreasing size, and no shard ends up more than one directory ahead
+        firsts = sorted((shard[0] for shard in shards if shard), key=lambda d: -size_of[d])
+        assert firsts == sorted(size_of, key=lambda d: -size_of[d])[:len(firsts)]
+        for shard in shards:
+            assert [size_of[d] for d in shard] == sorted((size_of[d] for d in shard), reverse=True)
+        loads = [sum(size_of[d] for d in shard) for shard in shards]
+        assert max(loads) - min(loads) <= largest
+
+def read_table(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return {(row['Type'], row['Entity']): (int(row['Count']), int(row['Document Frequency']))
+                for row in csv.DictReader(f)}
+
+def unsharded_table(base):
+    """The global table from the per-directory count summaries of a run without --shards."""
+    find_and_process_txt_dirs(base, 100, 999, workers=2)
+    counts = Counter()
+    documents = {}
+    for root, _ in directory_sizes(base):
+        with open(count_file_path(root), newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                key = (row['Type'], row['Entity'])
+                counts[key] += int(row['Count'])
+                documents.setdefault(key, set()).update(os.path.join(root, name) for name in row['Documents'].split(', '))
+    return {key: (count, len(documents[key])) for key, count in counts.items()}
+
+def test_sharded_run_matches_unsharded_run(tree, tmp_path):
+    expected = unsharded_table(tree)
+    assert expected
+    for shard_count in range(1, 4):
+        shard_dir = str(tmp_path / f'shards{shard_count}')
+        # One array job task after the other, like SLURM_ARRAY_TASK_ID=0..N-1
+        for shard_index in range(shard_count):
+            find_and_process_txt_dirs(tree, 100, 999, workers=2, shard=(shard_index, shard_count), shard_dir=shard_dir)
+        shards = find_shards(shard_dir)
+        assert list(shards) == [shard_count] and sorted(shards[shard_count]) == list(range(shard_count))
+        output = str(tmp_path / f'global{shard_count}.csv')
+        write_global_counts(merge_shards([shards[shard_count][i] for i in range(shard_count)]), output)
+        assert read_table(output) == expected
+
+def documents_of(root, entity):
+    with open(count_file_path(root), newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row['Entity'] == entity:
+                return sorted(row['Documents'].split(', '))
+    return []
+
+def test_duplicates_are_processed_once_within_the_run(tree, tmp_path):
+    # The same filing in 100 and in 999. 100 has the smallest path, but a run of 500..999 must still keep 999's copy.
+    for directory in ['1/100', '9/999']:
+        with open(os.path.join(tree, directory, 'document9.txt'), 'w') as f:
+            f.write('Barnes Group in Denver\n')
+    catalog = entityListandCount.CorpusCatalog(str(tmp_path / 'catalog.sqlite'), tree)
+    catalog.refresh()
+    catalog.hash_files()
+    try:
+        find_and_process_txt_dirs(tree, 500, 999, catalog, workers=2)
+        assert 'document9.txt' in documents_of(os.path.join(tree, '9', '999'), 'Denver')
+
+        find_and_process_txt_dirs(tree, 100, 999, catalog, workers=2)
+        assert 'document9.txt' in documents_of(os.path.join(tree, '1', '100'), 'Denver')
+        assert 'document9.txt' not in documents_of(os.path.join(tree, '9', '999'), 'Denver')
+    finally:
+        catalog.close()
@@ -0,0 +1,69 @@
+import re
+
+from ner_chunks import iter_chunks, iter_entities, pipe_batch_size, MAX_CHARS_IN_FLIGHT
+
+# Stand-in for the spaCy model: a fixed vocabulary of entities, found at their positions in the chunk
+VOCABULARY = {'Ohio': 'GPE', 'Acme Corp': 'ORG', 'John Smith': 'PERSON'}
+ENTITY = re.compile('|'.join(VOCABULARY))
+
+class FakeSpan:
+    def __init__(self, match):
+        self.text = match.group()
+        self.label_ = VOCABULARY[self.text]
+        self.start_char, self.end_char = match.span()
+
+class FakeDoc:
+    def __init__(self, text):
+        self.ents = [FakeSpan(match) for match in ENTITY.finditer(text)]
+
+class FakeNlp:
+    """Records the chunks of every nlp.pipe batch."""
+    def __init__(self):
+        self.batches = []
+
+    def pipe(self, items, as_tuples, batch_size):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == batch_size:
+                self.batches.append(batch)
+                yield from ((FakeDoc(text), context) for text, context in batch)
+                batch = []
+        if batch:
+            self.batches.append(batch)
+            yield from ((FakeDoc(text), context) for text, context in batch)
+
+def test_chunks_join_back():
+    text = "One sentence. Another one.\n\nA new paragraph here.\n" * 200
+    chunks = list(iter_chunks(text, 500))
+    assert ''.join(chunk for _, chunk in chunks) == text
+    assert all(len(chunk) <= 500 for _, chunk in chunks)
+    assert all(text.startswith(chunk, offset) for offset, chunk in chunks)
+
+def test_text_in_flight_is_bounded():
+    assert pipe_batch_size(100_000) == 1
+    assert pipe_batch_size(400_000) == 1
+    assert pipe_batch_size(10_000) == 10
+    nlp = FakeNlp()
+    list(iter_entities(nlp, "word " * 100_000, max_chars=20_000))
+    assert len(nlp.batches) > 1
+    assert all(sum(len(text) for text, _ in batch) <= MAX_CHARS_IN_FLIGHT for batch in nlp.batches)
+
+def test_entity_offsets_point_into_the_full_text():
+    paragraph = "Acme Corp hired John Smith.\nSales grew in Ohio\n\nThe board met.\n"
+    text = paragraph * 50
+    entities = list(iter_entities(FakeNlp(), text, max_chars=200))
+    assert len(entities) == 150
+    assert all(text[start:end] == name and VOCABULARY[name] == label for name, label, start, end in entities)
+    # Same as one run over the whole text
+    assert entities == list(iter_entities(FakeNlp(), text, max_chars=len(text)))
+    # Some chunks end right after an entity ("Ohio" before the blank line)
+    offsets = {offset for offset, _ in iter_chunks(text, 200)}
+    assert any(end + 2 in offsets for name, _, _, end in entities if name == 'Ohio')
+
+def test_entity_offsets_of_spans():
+    text = "Intro about Ohio.\n" + "Acme Corp and John Smith in Ohio. " * 40 + "\nOutro about Ohio."
+    start = text.index('Acme')
+    end = text.index('\nOutro')
+    entities = list(iter_entities(FakeNlp(), text, spans=[(start, end)], max_chars=100))
+    assert entities == [(m.group(), VOCABULARY[m.group()], m.start(), m.end()) for m in ENTITY.finditer(text, start, end)]
@@ -1,9 +1,16 @@
 import os
 import shutil
 import argparse
+import multiprocessing
 from pathlib import Path
 from datetime import datetime
 
+# Completion manifests, one per first_3 directory, live in dest_base/.manifests
+MANIFEST_DIR = '.manifests'
+
+# Shared file counter, set in each worker by init_worker
+progress_counter = None
+
 def pad_cik(cik_str):
     """Pad a CIK number to 10 digits by adding leading zeros."""
     return str(cik_str).zfill(10)
@@ -20,18 +27,115 @@ def should_process_directory(dir_name, start_range, end_range):
     except ValueError:
         return False
 
-def restructure_directories(source_base, dest_base, start_range, end_range):
+def place_file(item, new_dir, mode):
+    """Copy, move or hardlink one file into new_dir. Hardlinks fall back to copying across filesystems."""
+    if mode == 'move':
+        shutil.move(str(item), str(new_dir / item.name))
+    elif mode == 'link':
+        try:
+            os.link(item, new_dir / item.name)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copy2(item, new_dir)
+    else:
+        shutil.copy2(item, new_dir)
+
+def manifest_path(dest_base, first_3_name):
+    return Path(dest_base) / MANIFEST_DIR / f"{first_3_name}.done"
+
+def process_first_3_dir(first_3_dir, dest_base, mode='copy'):
+    """
+    Restructure every CIK directory inside one first_3 directory. This is one unit of work.
+    Returns (directory name, files processed, errors). The completion manifest is only written when there were no errors.
+    """
+    first_3_dir = Path(first_3_dir)
+    dest_base = Path(dest_base)
+    files_processed = 0
+    errors = 0
+
+    print(f"\nProcessing directory: {first_3_dir}")
+
+    # Process each CIK subdirectory
+    for cik_dir in first_3_dir.iterdir():
+        if not cik_dir.is_dir():
+            continue
+            
+        # Get the original partial CIK from the directory name
+        partial_cik = cik_dir.name
+        
+        # Pad the CIK to 10 digits
+        full_cik = pad_cik(partial_cik)
+        
+        # Get the first 6 digits for the new structure
+        first_6 = get_first_six(full_cik)
+        
+        # Create the new directory path
+        new_dir = dest_base / first_6 / full_cik
+        
+        # Create the new directory structure
+        new_dir.mkdir(parents=True, exist_ok=True)
+        
+        files_in_dir = 0
+        try:
+            # Copy only text files
+            for item in cik_dir.iterdir():
+                if item.is_file() and item.suffix.lower() in ['.txt', '', '.gz', '.zst']:  # Include files without extension and compressed filings
+                    place_file(item, new_dir, mode)
+                    files_in_dir += 1
+                    files_processed += 1
+            
+            if files_in_dir > 0:
+                print(f"  Moved {files_in_dir} files from {cik_dir} to {new_dir}")
+                if progress_counter is not None:
+                    with progress_counter.get_lock():
+                        progress_counter.value += files_in_dir
+                
+        except Exception as e:
+            errors += 1
+            print(f"Error processing {cik_dir}: {str(e)}")
+
+    if errors == 0:
+        manifest = manifest_path(dest_base, first_3_dir.name)
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest, 'w') as f:
+            f.write(f"{files_processed} files {mode} {datetime.now().isoformat()}\n")
+
+    return first_3_dir.name, files_processed, errors
+
+def init_worker(counter):
+    """Give every worker the shared file counter used for combined progress."""
+    global progress_counter
+    progress_counter = counter
+
+def process_unit(args):
+    return process_first_3_dir(*args)
+
+def print_progress(files_processed, units_done, units_total, start_time):
+    elapsed_time = datetime.now() - start_time
+    print(f"\nProgress update:")
+    print(f"Directories completed: {units_done}/{units_total}")
+    print(f"Files processed: {files_processed}")
+    print(f"Time elapsed: {elapsed_time}")
+    if elapsed_time.total_seconds() > 0:
+        print(f"Average speed: {files_processed / elapsed_time.total_seconds():.2f} files/second")
+
+def restructure_directories(source_base, dest_base, start_range, end_range, workers=1, mode='copy', resume=True):
     """
     Restructure the CIK directories from:
     source_base/first_3/partial_cik/contents
     to:
     dest_base/first_6/full_cik/contents
     
-    Only process directories between start_range and end_range (inclusive)
+    Only process directories between start_range and end_range (inclusive).
+    Each first_3 directory is a unit of work. With workers > 1 the units are spread over a process pool.
+    Finished units get a manifest in dest_base/.manifests, and with resume they are skipped on reruns.
+    mode is 'copy', 'move' or 'link' (hardlink).
     """
     start_time = datetime.now()
     files_processed = 0
     dirs_processed = 0
+    failed_dirs = []
     
     # Create destination base directory if it doesn't exist
     dest_base = Path(dest_base)
@@ -42,7 +146,9 @@ def restructure_directories(source_base, dest_base, start_range, end_range):
     
     print(f"Starting processing of directories between {start_range} and {end_range}")
     print(f"Start time: {start_time}")
-    
+
+    units = []
+    skipped = 0
     for first_3_dir in sorted(source_base.iterdir()):
         if not first_3_dir.is_dir():
             continue
@@ -50,52 +156,37 @@ def restructure_directories(source_base, dest_base, start_range, end_range):
         # Check if this directory falls within our range
         if not should_process_directory(first_3_dir.name, start_range, end_range):
             continue
-            
-        print(f"\nProcessing directory: {first_3_dir}")
-        dirs_processed += 1
-        
-        # Process each CIK subdirectory
-        for cik_dir in first_3_dir.iterdir():
-            if not cik_dir.is_dir():
-                continue
-                
-            # Get the original partial CIK from the directory name
-            partial_cik = cik_dir.name
-            
-            # Pad the CIK to 10 digits
-            full_cik = pad_cik(partial_cik)
-            
-            # Get the first 6 digits for the new structure
-            first_6 = get_first_six(full_cik)
-            
-            # Create the new directory path
-            new_dir = dest_base / first_6 / full_cik
-            
-            # Create the new directory structure
-            new_dir.mkdir(parents=True, exist_ok=True)
-            
-            files_in_dir = 0
-            try:
-                # Copy only text files
-                for item in cik_dir.iterdir():
-                    if item.is_file() and item.suffix.lower() in ['.txt', '']:  # Include files without extension
-                        shutil.copy2(item, new_dir)
-                        files_in_dir += 1
-                        files_processed += 1
-                
-                if files_in_dir > 0:
-                    print(f"  Moved {files_in_dir} files from {cik_dir} to {new_dir}")
-                    
-                # Print progress every 1000 files
-                if files_processed % 1000 == 0:
-                    elapsed_time = datetime.now() - start_time
-                    print(f"\nProgress update:")
-                    print(f"Files processed: {files_processed}")
-                    print(f"Time elapsed: {elapsed_time}")
-                    print(f"Average speed: {files_processed / elapsed_time.total_seconds():.2f} files/second")
-                    
-            except Exception as e:
-                print(f"Error processing {cik_dir}: {str(e)}")
+
+        # Skip units a previous run already finished
+        if resume and manifest_path(dest_base, first_3_dir.name).exists():
+            skipped += 1
+            continue
+
+        units.append((first_3_dir, dest_base, mode))
+
+    print(f"{len(units)} directories to process, {skipped} already done")
+
+    counter = multiprocessing.Value('q', 0)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(counter,))
+        results = pool.imap_unordered(process_unit, units)
+    else:
+        pool = None
+        init_worker(counter)
+        results = map(process_unit, units)
+
+    try:
+        for name, unit_files, unit_errors in results:
+            dirs_processed += 1
+            files_processed += unit_files
+            if unit_errors:
+                failed_dirs.append(name)
+            # Print progress for all workers combined
+            print_progress(counter.value, dirs_processed, len(units), start_time)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     end_time = datetime.now()
     elapsed_time = end_time - start_time
@@ -105,7 +196,10 @@ def restructure_directories(source_base, dest_base, start_range, end_range):
     print(f"End time: {end_time}")
     print(f"Total time elapsed: {elapsed_time}")
     print(f"Total directories processed: {dirs_processed}")
+    print(f"Total directories skipped (already done): {skipped}")
     print(f"Total files processed: {files_processed}")
+    if failed_dirs:
+        print(f"Directories with errors (will be redone on the next run): {failed_dirs}")
     if elapsed_time.total_seconds() > 0:
         print(f"Average processing speed: {files_processed / elapsed_time.total_seconds():.2f} files/second")
 
@@ -115,6 +209,9 @@ if __name__ == "__main__":
     parser.add_argument('--end', type=int, required=True, help='End of directory range (inclusive)')
     parser.add_argument('--source', type=str, default="/scratch/alpine/nimi2356/raw_data", help='Source directory path')
     parser.add_argument('--dest', type=str, default="/scratch/alpine/nimi2356/new_raw_data", help='Destination directory path')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--mode', type=str, choices=['copy', 'move', 'link'], default='copy', help='Copy, move or hardlink the files')
+    parser.add_argument('--no_resume', action='store_true', help='Redo directories that already have a completion manifest')
     
     args = parser.parse_args()
     
@@ -124,4 +221,5 @@ if __name__ == "__main__":
         exit(1)
     
     # Run the restructuring
-    restructure_directories(args.source, args.dest, args.start, args.end)
\ No newline at end of file
+    restructure_directories(args.source, args.dest, args.start, args.end,
+                            workers=args.workers, mode=args.mode, resume=not args.no_resume)
\ No newline at end of file
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from sgml_splitter import iter_documents, document_text
+
+# Benchmark of the byte-level <DOCUMENT> splitter against the BeautifulSoup path filterHTML.py used before.
+# Default input is Sponsor/test_data/test2.txt. That file is already extracted text with no <DOCUMENT>
+# tags, so it is also wrapped into a synthetic submission (--documents copies as 10-K/EX documents with
+# HTML markup) to time an actual split. Any raw EDGAR filing can be passed with --file as well.
+#
+#   python benchmark_splitter.py
+#   python benchmark_splitter.py --file /scratch/alpine/nimi2356/raw_data/320/320193/0000320193-14-000024.txt
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'test_data', 'test2.txt')
+
+def soup_documents(file_path):
+    """The old filterHTML.py path: whole file into a string, full html.parser tree, find_all('document')."""
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as infile:
+        content = infile.read()
+    soup = BeautifulSoup(content, 'html.parser')
+    return [document.get_text(strip=True) for document in soup.find_all('document')]
+
+def splitter_documents(file_path):
+    """The new path: memory-mapped scan, tags stripped per document."""
+    return [document_text(document['content']) for document in iter_documents(file_path)]
+
+def make_synthetic_filing(text, documents, path):
+    """Wrap plain text into an EDGAR style submission with documents <DOCUMENT> blocks of HTML."""
+    paragraphs = [p for p in text.split('.') if p.strip()]
+    # Every tenth paragraph is a table row with a bare comparison, which must stay text
+    body = ''.join(f'<p style="font-family:Times">{p.strip()}.&nbsp;</p>\n' if i % 10 else
+                   f'<table><tr><td>{p.strip()}</td><td>growth < 5% and margin > 3%</td></tr></table>\n'
+                   for i, p in enumerate(paragraphs))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<SEC-DOCUMENT>0000000000-14-000001.txt\n<SEC-HEADER>\nCONFORMED SUBMISSION TYPE:\t10-K\n</SEC-HEADER>\n')
+        for i in range(documents):
+            doc_type = '10-K' if i == 0 else f'EX-{i + 10}'
+            f.write(f'<DOCUMENT>\n<TYPE>{doc_type}\n<SEQUENCE>{i + 1}\n<FILENAME>doc{i + 1}.htm\n<TEXT>\n')
+            f.write('<html><head><style>p {margin:0} td > p {color:#000}</style>'
+                    '<script>if (a < b) { x = "</p>"; }</script></head>'
+                    f'<body><!-- page 1 > cover --><div>\n{body}</div></body></html>\n</TEXT>\n</DOCUMENT>\n')
+        f.write('</SEC-DOCUMENT>\n')
+
+def measure(name, func, file_path, repeat):
+    """Best wall time of repeat runs and the peak traced memory of one run."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(file_path)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(file_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    size_mb = os.path.getsize(file_path) / 1024 ** 2
+    best = min(times)
+    print(f'  {name:<14} {best * 1000:9.1f} ms  {size_mb / best:8.1f} MB/s  peak {peak / 1024 ** 2:7.1f} MB  {len(result)} documents')
+    return result, best
+
+def run(file_path, repeat):
+    print(f'{file_path} ({os.path.getsize(file_path) / 1024:.0f} KB)')
+    soup_result, soup_time = measure('BeautifulSoup', soup_documents, file_path, repeat)
+    split_result, split_time = measure('splitter', splitter_documents, file_path, repeat)
+    same = sum(a == b for a, b in zip(soup_result, split_result))
+    print(f'  speedup {soup_time / split_time:.1f}x, identical documents: {same}/{max(len(soup_result), len(split_result))}')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the <DOCUMENT> splitter against BeautifulSoup.')
+    parser.add_argument('--file', type=str, default=DEFAULT_FILE, help='Filing to split. Defaults to test_data/test2.txt')
+    parser.add_argument('--documents', type=int, default=5, help='Documents in the synthetic filing built from --file')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per method, the best one is reported')
+    args = parser.parse_args()
+
+    run(args.file, args.repeat)
+
+    with open(args.file, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic = os.path.join(tmp, 'synthetic_filing.txt')
+        make_synthetic_filing(text, args.documents, synthetic)
+        print('\nSynthetic submission built from the same text:')
+        run(synthetic, args.repeat)
@@ -1,16 +1,41 @@
 import os
+import sys
+import time
+import shutil
+import signal
 import argparse
 import csv
-import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
-def extract_documents_and_save(soup, output_dir):
-    # Find all <DOCUMENT> tags
-    document_tags = soup.find_all('document')
+# Shared filing reader and <DOCUMENT> splitter live with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from sgml_splitter import iter_documents, document_text, type_matches, TEXT_DOCUMENT_TYPES
+from filing_storage import find_filing, strip_compression_suffix
+from section_index import write_section_index
 
-    # Iterate through each <DOCUMENT> tag and save its content
-    for i, document in enumerate(document_tags):
-        document_content = document.get_text(strip=True)
+class FilingTimeout(Exception):
+    pass
+
+def extract_documents_and_save(file_path, output_dir, document_types=None):
+    """
+    Write the <DOCUMENT>s of the filing whose <TYPE> is in document_types (None keeps all) to output_dir
+    as documentN.txt, N being the document's position in the filing.
+    Returns a report of documents and raw bytes kept and dropped.
+    """
+    report = {'docs_kept': 0, 'docs_dropped': 0, 'bytes_kept': 0, 'bytes_dropped': 0, 'dropped_types': []}
+    # Scan the memory-mapped filing for <DOCUMENT> blocks, the HTML inside is never parsed
+    for document in iter_documents(file_path):
+        i = document['document'] - 1
+        if not type_matches(document['type'], document_types):
+            # Graphics, archives, XBRL, ... never reach the text stage
+            report['docs_dropped'] += 1
+            report['bytes_dropped'] += len(document['content'])
+            report['dropped_types'].append(document['type'])
+            continue
+
+        # Strip the tags only now that we need the text
+        document_content = document_text(document['content'])
         
         # Construct the output filename
         file_name = f'document{i + 1}.txt'  # Names like document1.txt, document2.txt, etc.
@@ -26,15 +51,23 @@ def extract_documents_and_save(soup, output_dir):
         # Save the extracted document content to a new file
         with open(output_file, mode='w', encoding='utf-8') as outfile:
             outfile.write(document_content)
+        # Item offsets of the 10-K body for the section-targeted NER runs
+        if type_matches(document['type'], ['10-K*']):
+            write_section_index(output_file, document_content)
 
         print(f'Saved: {output_file}')
+        report['docs_kept'] += 1
+        report['bytes_kept'] += len(document['content'])
+    return report
 
-def process_file(file_path, output_dir):
+def format_report(report):
+    return (f"kept {report['docs_kept']} documents ({report['bytes_kept']} bytes), "
+            f"dropped {report['docs_dropped']} ({report['bytes_dropped']} bytes: {', '.join(report['dropped_types'])})")
+
+def process_file(file_path, output_dir, document_types=None):
     try:
-        with open(file_path, 'r', encoding='utf-8') as infile:
-            content = infile.read()
-            soup = BeautifulSoup(content, 'html.parser')
-            extract_documents_and_save(soup, output_dir)
+        report = extract_documents_and_save(file_path, output_dir, document_types)
+        print(f"{file_path}: {format_report(report)}")
     except FileNotFoundError:
         print(f"Error: The file {file_path} was not found.")
         return
@@ -45,6 +78,199 @@ def process_file(file_path, output_dir):
         print(f"An unexpected error occurred: {e}")
         return
 
+def parse_shard(shard):
+    """'2/8' -> (2, 8). Shards are numbered from 0."""
+    index, count = (int(x) for x in shard.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}, got {index}")
+    return index, count
+
+def iter_manifest(manifest_path, shard_index=0, shard_count=1):
+    """
+    Stream (file path, file size) out of a master csv ('Name of document', 'Path to file', 'File size')
+    one row at a time. Row n belongs to shard n % shard_count, so every array task gets an even share.
+    Blank lines and rows without a path are skipped.
+    """
+    with open(manifest_path, mode='r', newline='', encoding='utf-8') as infile:
+        reader = csv.reader(infile)
+        for n, row in enumerate(reader):
+            if len(row) < 2 or not row[1].strip():
+                if any(field.strip() for field in row):
+                    print(f"Skipping manifest line {reader.line_num}, it has no path: {row}")
+                continue
+            if row[1] == 'Path to file':
+                continue
+            if n % shard_count != shard_index:
+                continue
+            size = int(row[2]) if len(row) > 2 and row[2].isdigit() else 0
+            yield row[1], size
+
+def resolve_path(path, path_prefix):
+    """Pather.py strips the leading ../../ off the paths, so try them relative to path_prefix too."""
+    if find_filing(path) is None and path_prefix:
+        prefixed = os.path.join(path_prefix, path)
+        if find_filing(prefixed) is not None:
+            return prefixed
+    return path
+
+def output_dir_for(path, directory_path):
+    """{directory_path}/parsed/{first3 or first6}/{cik}/{accession}/"""
+    parts = os.path.normpath(path).split(os.sep)
+    accession = os.path.splitext(strip_compression_suffix(parts[-1]))[0]
+    return os.path.join(directory_path, 'parsed', *parts[-3:-1], accession)
+
+def init_batch_worker(max_memory_mb):
+    """Cap the address space of each worker so one pathological filing raises MemoryError instead of getting us OOM killed."""
+    if max_memory_mb:
+        import resource
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def on_alarm(signum, frame):
+    raise FilingTimeout()
+
+def process_batch_file(file_path, output_dir, timeout, document_types=None):
+    """
+    Split one filing in a worker process within the time budget.
+    Returns (file path, status, detail, report), status is 'done', 'quarantined' or 'error'.
+    """
+    signal.signal(signal.SIGALRM, on_alarm)
+    signal.alarm(timeout or 0)
+    start = time.time()
+    try:
+        # Start clean so a rerun does not add document1_1.txt next to document1.txt
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        report = extract_documents_and_save(file_path, output_dir, document_types)
+        return file_path, 'done', f'{time.time() - start:.1f}s', report
+    except FilingTimeout:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return file_path, 'quarantined', f'over the {timeout}s time budget', None
+    except MemoryError:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return file_path, 'quarantined', 'over the memory budget', None
+    except Exception as e:
+        return file_path, 'error', str(e), None
+    finally:
+        signal.alarm(0)
+
+def new_pool(args):
+    return ProcessPoolExecutor(max_workers=args.workers, initializer=init_batch_worker, initargs=(args.max_memory_mb,))
+
+def run_batch(args):
+    """
+    Split every filing of the manifest (or of this shard of it) on a process pool.
+    The manifest is read as the pool needs work, never more than a few tasks per worker are queued.
+    Filings over the size, time or memory budget go to quarantine.csv instead of stalling the run,
+    and so do filings whose worker process dies (e.g. killed at the --max_memory_mb cap).
+    """
+    shard_index, shard_count = parse_shard(args.shard)
+    os.makedirs(args.directory_path, exist_ok=True)
+    suffix = f'_shard{shard_index}of{shard_count}' if shard_count > 1 else ''
+    quarantine_path = os.path.join(args.directory_path, f'quarantine{suffix}.csv')
+    report_path = os.path.join(args.directory_path, f'document_filter_report{suffix}.csv')
+    document_types = document_types_from_args(args)
+    max_in_flight = args.workers * 4
+    counts = {'done': 0, 'quarantined': 0, 'error': 0}
+    totals = {'bytes_kept': 0, 'bytes_dropped': 0}
+    start = time.time()
+
+    with open(quarantine_path, 'a', newline='', encoding='utf-8') as qfile, \
+            open(report_path, 'a', newline='', encoding='utf-8') as rfile:
+        quarantine = csv.writer(qfile)
+        # Bytes kept versus dropped by the document type filter, one row per filing
+        filter_report = csv.writer(rfile)
+        if rfile.tell() == 0:
+            filter_report.writerow(['File', 'Documents kept', 'Documents dropped', 'Bytes kept', 'Bytes dropped', 'Dropped types'])
+        # future -> (path, output dir) of the filing it splits
+        in_flight = {}
+        # Filings that were in flight when a worker died and took the pool down with it
+        broken = []
+
+        def record(file_path, status, detail, report):
+            counts[status] += 1
+            if report is not None:
+                filter_report.writerow([file_path, report['docs_kept'], report['docs_dropped'], report['bytes_kept'],
+                                        report['bytes_dropped'], ' '.join(report['dropped_types'])])
+                totals['bytes_kept'] += report['bytes_kept']
+                totals['bytes_dropped'] += report['bytes_dropped']
+            if status != 'done':
+                print(f"[{status.upper()}] {file_path}: {detail}")
+                quarantine.writerow([file_path, status, detail])
+                qfile.flush()
+            total = sum(counts.values())
+            if total and total % 1000 == 0:
+                print(f"Progress: {counts} in {time.time() - start:.0f}s")
+
+        def collect(done_futures):
+            for future in done_futures:
+                task = in_flight.pop(future)
+                try:
+                    record(*future.result())
+                except BrokenProcessPool:
+                    broken.append(task)
+
+        def recover(pool):
+            """
+            Rerun the filings that were in flight when the pool broke one at a time on a new pool, so
+            the one that kills its worker again is quarantined and the others are split as usual.
+            """
+            done, _ = wait(in_flight)
+            collect(done)
+            pool.shutdown(wait=True)
+            pool = new_pool(args)
+            print(f"A worker process died, rerunning the {len(broken)} filings it may have been splitting one at a time")
+            while broken:
+                path, output_dir = broken.pop(0)
+                try:
+                    record(*pool.submit(process_batch_file, path, output_dir, args.timeout, document_types).result())
+                except BrokenProcessPool:
+                    shutil.rmtree(output_dir, ignore_errors=True)
+                    record(path, 'quarantined', 'worker process died (over the memory cap or crashed)', None)
+                    pool.shutdown(wait=True)
+                    pool = new_pool(args)
+            return pool
+
+        pool = new_pool(args)
+        try:
+            for path, size in iter_manifest(args.file_path, shard_index, shard_count):
+                path = resolve_path(path, args.path_prefix)
+                if args.max_file_mb and size > args.max_file_mb * 1024 * 1024:
+                    counts['quarantined'] += 1
+                    quarantine.writerow([path, 'quarantined', f'{size} bytes is over the size budget'])
+                    continue
+
+                output_dir = output_dir_for(path, args.directory_path)
+                in_flight[pool.submit(process_batch_file, path, output_dir, args.timeout, document_types)] = (path, output_dir)
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if broken:
+                    pool = recover(pool)
+
+            done, _ = wait(in_flight)
+            collect(done)
+            if broken:
+                pool = recover(pool)
+        finally:
+            pool.shutdown(wait=True)
+
+    print(f"Batch complete: {counts} in {time.time() - start:.0f}s. Quarantined filings are listed in {quarantine_path}")
+    print(f"Document filter kept {totals['bytes_kept'] / 1024 ** 2:.1f} MB and dropped {totals['bytes_dropped'] / 1024 ** 2:.1f} MB, "
+          f"per filing in {report_path}")
+
+def document_types_from_args(args):
+    """
+    --all_documents keeps everything, otherwise only --document_types reach the text files. Without
+    --document_types a batch keeps TEXT_DOCUMENT_TYPES and a single file (--one_all 1) keeps everything.
+    """
+    if args.all_documents:
+        return None
+    if args.document_types is None:
+        return TEXT_DOCUMENT_TYPES if args.one_all != 1 else None
+    return args.document_types
+
 def main(args):
     if args.one_all == 1:
         #This section is for individually testing .txt files
@@ -52,34 +278,26 @@ def main(args):
         name = os.path.splitext(base_name)[0]
         output_dir = os.path.join(args.directory_path, 'parsedTest')
         os.makedirs(output_dir, exist_ok=True)
-        process_file(args.file_path, output_dir)
+        process_file(args.file_path, output_dir, document_types_from_args(args))
     else:
-        with open(args.file_path, mode='r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            for row in reader:
-                if row:  # Check if the row is not empty
-                    split_elements = row[1].split('/')
-    
-                    # Ensure that split_elements has enough elements
-                    if len(split_elements) == 7:
-                        ident_CIK = split_elements[7].split('-')[-1].split('.')[0]
-                        output_dir = os.path.join(args.directory_path)
-                        dir_path = f'{output_dir}/parsed/{split_elements[3]}/{split_elements[4]}/{ident_CIK}/{row[1]}'
-                        print(ident_CIK)
-                        os.makedirs(dir_path, exist_ok=True)
-
-                        file_name = row[1]  # Get the file name from the second column
-                        #process_file(file_name, dir_path)
-                    else:
-                        print(f"Warning: Expected at least 3 elements, but got {len(split_elements)}: {split_elements}")
-
-# Argument parsing
-parser = argparse.ArgumentParser(description='Fetch scratch file directory path')
-parser.add_argument('--file_path', type=str, required=True, help='The path to the text file or CSV file')
-parser.add_argument('--directory_path', type=str, required=True, help='The path to the directory to store documents')
-parser.add_argument('--one_all', type=int, required=True, help='1 to process a single file, 2 for all files from CSV')
-
-args = parser.parse_args()
-
-# Run the main function
-main(args)
+        run_batch(args)
+
+if __name__ == "__main__":
+    # Argument parsing
+    parser = argparse.ArgumentParser(description='Fetch scratch file directory path')
+    parser.add_argument('--file_path', type=str, required=True, help='The path to the text file or CSV file')
+    parser.add_argument('--directory_path', type=str, required=True, help='The path to the directory to store documents')
+    parser.add_argument('--one_all', type=int, required=True, help='1 to process a single file, 2 for all files from CSV')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes for --one_all 2')
+    parser.add_argument('--shard', type=str, default='0/1', help='i/N: only process every N-th manifest row starting at row i (for array jobs)')
+    parser.add_argument('--timeout', type=int, default=300, help='Seconds a single filing may take before it is quarantined (0 for no limit)')
+    parser.add_argument('--max_memory_mb', type=int, default=0, help='Memory cap per worker in MB, filings that hit it are quarantined (0 for no limit)')
+    parser.add_argument('--max_file_mb', type=int, default=0, help='Quarantine filings bigger than this without opening them (0 for no limit)')
+    parser.add_argument('--document_types', type=str, nargs='*', default=None, help='<TYPE>s to keep, a trailing * matches by prefix. Batches default to the 10-K body, EX-13 and EX-21, a single file keeps every document')
+    parser.add_argument('--all_documents', action='store_true', help='Keep every document, including graphics, archives and XBRL')
+    parser.add_argument('--path_prefix', type=str, default='/', help='Prefix for manifest paths that do not exist as written')
+
+    args = parser.parse_args()
+
+    # Run the main function
+    main(args)
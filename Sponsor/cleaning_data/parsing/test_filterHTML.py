@@ -0,0 +1,83 @@
+import os
+import csv
+import argparse
+
+import filterHTML
+
+FILING = """<SEC-DOCUMENT>
+<DOCUMENT>
+<TYPE>10-K
+<SEQUENCE>1
+<FILENAME>form10k.htm
+<TEXT>
+<html><body><p>Annual report of {name}</p></body></html>
+</TEXT>
+</DOCUMENT>
+<DOCUMENT>
+<TYPE>GRAPHIC
+<SEQUENCE>2
+<FILENAME>logo.jpg
+<TEXT>
+begin 644 logo.jpg
+end
+</TEXT>
+</DOCUMENT>
+</SEC-DOCUMENT>
+"""
+
+def batch_args(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / 'raw' / '123' / '1234567' / f'{name}.txt'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(FILING.format(name=name))
+        paths.append(str(path))
+    manifest = tmp_path / 'manifest.csv'
+    with open(manifest, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Name of document', 'Path to file', 'File size'])
+        writer.writerows([[os.path.basename(path), path, os.path.getsize(path)] for path in paths])
+    return argparse.Namespace(file_path=str(manifest), directory_path=str(tmp_path / 'out'), one_all=2, workers=2,
+                              shard='0/1', timeout=0, max_memory_mb=0, max_file_mb=0, document_types=None,
+                              all_documents=False, path_prefix='/')
+
+def quarantined(args):
+    with open(os.path.join(args.directory_path, 'quarantine.csv'), newline='') as f:
+        return [(os.path.basename(row[0]), row[1]) for row in csv.reader(f)]
+
+def test_dead_worker_is_quarantined_and_the_batch_goes_on(tmp_path, monkeypatch):
+    names = [f'0001234567-14-00000{i}' for i in range(6)]
+    args = batch_args(tmp_path, names)
+    extract = filterHTML.extract_documents_and_save
+
+    def dies_on_filing_3(file_path, output_dir, document_types=None):
+        # Stands in for a worker killed at the memory cap, the pool's workers are forked after the patch
+        if file_path.endswith('0001234567-14-000003.txt'):
+            os._exit(1)
+        return extract(file_path, output_dir, document_types)
+
+    monkeypatch.setattr(filterHTML, 'extract_documents_and_save', dies_on_filing_3)
+    filterHTML.run_batch(args)
+    assert quarantined(args) == [('0001234567-14-000003.txt', 'quarantined')]
+    parsed = os.path.join(args.directory_path, 'parsed', '123', '1234567')
+    assert sorted(os.listdir(parsed)) == [name for name in names if not name.endswith('3')]
+
+def test_document_types_default_depends_on_mode(tmp_path):
+    args = batch_args(tmp_path, [])
+    assert filterHTML.document_types_from_args(args) == filterHTML.TEXT_DOCUMENT_TYPES
+    args.one_all = 1
+    assert filterHTML.document_types_from_args(args) is None
+    args.document_types = ['EX-21']
+    assert filterHTML.document_types_from_args(args) == ['EX-21']
+    args.all_documents = True
+    assert filterHTML.document_types_from_args(args) is None
+
+def test_manifest_rows_without_a_path_are_skipped(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('Name of document,Path to file,File size\n'
+                        'a.txt,raw/a.txt,10\n'
+                        '\n'
+                        'b.txt\n'
+                        'c.txt,,5\n'
+                        'd.txt,raw/d.txt\n')
+    assert list(filterHTML.iter_manifest(str(manifest))) == [('raw/a.txt', 10), ('raw/d.txt', 0)]
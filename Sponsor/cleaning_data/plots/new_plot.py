@@ -1,50 +1,49 @@
+import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# Path to the combined CSV file
-input_file = "unique_states_per_filing_with_files.csv"
+# The dispersion index lives with the entity counting scripts, the file name parser with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'count_entities'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from dispersion_index import DispersionIndex, DEFAULT_INDEX
+from filing_metadata import accession_metadata
 
-# Read the updated CSV file
-data = pd.read_csv(input_file, header=0, names=["File", "UniqueStatesCount"])
+# The dispersion index (dispersion_index.py) answers the per-year means with one query.
+# Without it the combined CSV file is read and grouped as before.
+index_file = DEFAULT_INDEX
 
-# Ensure UniqueStatesCount is numeric, replacing invalid values with NaN
-data['UniqueStatesCount'] = pd.to_numeric(data['UniqueStatesCount'], errors='coerce')
+# Path to the combined CSV file
+input_file = "unique_states_per_filing_with_files.csv"
 
-# Print invalid rows for debugging
-invalid_rows = data[pd.to_numeric(data['UniqueStatesCount'], errors='coerce').isna()]
-print("Invalid rows causing issues:")
-print(invalid_rows)
+if os.path.exists(index_file):
+    index = DispersionIndex(index_file)
+    yearly_data = index.yearly_means()
+    index.close()
+else:
+    # Read the updated CSV file
+    data = pd.read_csv(input_file, header=0, names=["File", "UniqueStatesCount"])
 
-# Drop rows with missing or invalid values
-data.dropna(subset=["File", "UniqueStatesCount"], inplace=True)
+    # Ensure UniqueStatesCount is numeric, replacing invalid values with NaN
+    data['UniqueStatesCount'] = pd.to_numeric(data['UniqueStatesCount'], errors='coerce')
 
-# Extract year from the file name
-def extract_year(file_name):
-    try:
-        parts = file_name.split('-')
-        if len(parts) < 2:  # Ensure there is at least one hyphen
-            return None
-        year_code = int(parts[1])  # Extract the year part
-        if year_code >= 94:  # Years 94–99 -> 1994–1999
-            return 1900 + year_code
-        else:  # Years 00–24 -> 2000–2024
-            return 2000 + year_code
-    except (IndexError, ValueError, TypeError):  # Handle invalid file names
-        return None
+    # Print invalid rows for debugging
+    invalid_rows = data[pd.to_numeric(data['UniqueStatesCount'], errors='coerce').isna()]
+    print("Invalid rows causing issues:")
+    print(invalid_rows)
 
-# Apply the extraction function to get the Year column
-data['Year'] = data['File'].apply(extract_year)
-data.dropna(subset=["Year"], inplace=True)
+    # Drop rows with missing or invalid values
+    data.dropna(subset=["File", "UniqueStatesCount"], inplace=True)
 
-# Debug rows for 2003
-data_2003 = data[data['Year'] == 2003]
-print(f"Rows for 2003:\n{data_2003}")
+    # Year of the accession number in every file name, the whole column at once
+    data['Year'] = accession_metadata(data['File'].astype(str))['filer_year']
+    data.dropna(subset=["Year"], inplace=True)
 
-# Convert Year to integer
-data['Year'] = data['Year'].astype(int)
+    # Convert Year to integer
+    data['Year'] = data['Year'].astype(int)
 
-# Group by year and calculate the average number of unique states mentioned
-yearly_data = data.groupby('Year')['UniqueStatesCount'].mean().reset_index()
+    # Group by year and calculate the average number of unique states mentioned
+    yearly_data = data.groupby('Year')['UniqueStatesCount'].mean().reset_index()
 
 # Debug: Display yearly data
 print(yearly_data)
@@ -1,36 +1,18 @@
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 import os
 import argparse
-import time
+from edgar_downloader import EdgarDownloader, EDGAR_URL_BASE, SEC_MAX_REQUESTS_PER_SECOND
+from download_journal import DownloadJournal
+from index_catalog import IndexCatalog
+from sgml_splitter import DEFAULT_DOCUMENT_TYPES
 
 # This code pulls all quarters of all years from the Edgar database and then filters it, extracting CIK, Company Name, Form Type, Date Filed, and Filename to a csv. 
 headers = {
     "User-Agent" : "Nicholas Miller (nimi2356@colorado.edu)"
 }
 
-qtrs = ["QTR1", "QTR2", "QTR3", "QTR4"]
-
 #params: start-year, end-year
 
-EDGAR_URL_BASE = 'https://www.sec.gov/Archives/'
-
-error_data = {
-    'CIK': [],
-    'Company Name': [],
-    'Form Type': [],
-    'Date Filed': [],
-    'Filename': [],
-    'Year': [],
-    'QTR': []
-}
-
-def transform_file(file) -> str:
-    return file #BROKEN
-    # soup = BeautifulSoup(file, 'html.parser')
-    # return soup.getText() 
-
 def go():
     #get params
     parser = argparse.ArgumentParser(description='Fetch start and end years.')
@@ -39,6 +21,17 @@ def go():
     parser.add_argument('--startyear', type=int, required=True, help='The start year (INCLUSIVE)')
     parser.add_argument('--endyear', type=int, required=False, help='The end year (EXCLUSIVE)')
     parser.add_argument('--basedir', type=str, required=False, help='Base directory for saving the files. Defaults to .')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent download threads')
+    parser.add_argument('--rate', type=float, default=SEC_MAX_REQUESTS_PER_SECOND, help='Max requests per second for the whole process')
+    parser.add_argument('--journal', type=str, required=False, help='Download journal (sqlite). Defaults to <basedir>/download_journal.sqlite')
+    parser.add_argument('--catalog', type=str, required=False, help='master.idx catalog (sqlite). Defaults to <basedir>/index_catalog.sqlite')
+    parser.add_argument('--forms', type=str, nargs='*', help='Exact form types to download. Defaults to the 10-K forms without amendments')
+    parser.add_argument('--amendments', action='store_true', help='Also download the /A amendments of the forms')
+    parser.add_argument('--refresh_index', action='store_true', help='Download master.idx again even if the quarter is cataloged')
+    parser.add_argument('--compression', type=str, choices=['gzip', 'zstd'], required=False, help='Compress filings on the fly. Defaults to plain text')
+    parser.add_argument('--split_documents', type=str, nargs='*', required=False, help='Split out <DOCUMENT>s of these types while downloading, e.g. 10-K* EX-21. No types means the main 10-K body')
+    parser.add_argument('--retry_failed', action='store_true', help='Only retry filings the journal has as failed')
+    parser.add_argument('--baseurl', type=str, default=EDGAR_URL_BASE, help='Archives base url. Point at local_edgar_server.py for testing')
 
     # Parse the arguments
     args = parser.parse_args()
@@ -63,50 +56,52 @@ def go():
 
     print(f'Running for {years}, saving @ base directory: {base_directory}')
 
-    for year in years:
-        for qtr in qtrs:
-            file_count = 0
-            print(f'Now downloading 10-Ks for: {year}, {qtr}')
-            file_url = r"https://www.sec.gov/Archives/edgar/full-index/{}/{}/master.idx".format(year, qtr)
-            content = requests.get(file_url, headers=headers).content.decode("latin-1")
-            #print a preview of the master file to make it obvious when we exceed the rate request
-            print(f'{content[:250]}')
-
-            #for each line of the master file download and save the document if it's a 10-K
-            for line in content.splitlines():
-                if "10-K" in line:
-                    elements = line.split('|')
-                    assert(len(elements) == 5)
-
-                    try:
-                        file_count += 1
-                        if file_count % 9:
-                            time.sleep(1)
-                        #Try downloading form. Functionalize and add retries
-                        form_url = EDGAR_URL_BASE + elements[4]
-                        downloaded_file = requests.get(form_url, headers=headers).content.decode() #file is type string
-                    except:
-                        #Form failed to download
-                        print(f'[ERROR] Form download failed. Year: {year}, Quarter: {qtr}, Info: {elements}')
-                        error_data['CIK'].append(elements[0])
-                        error_data['Company Name'].append(elements[1])
-                        error_data['Form Type'].append(elements[2])
-                        error_data['Date Filed'].append(elements[3])
-                        error_data['Filename'].append(elements[4])
-                        error_data['Year'].append(year)
-                        error_data['QTR'].append(qtr)
-                        continue
-
-                    cleaned_file = transform_file(downloaded_file)
-                    file_name = elements[4].split('/')[-1]
-                    dir_path = f'{base_directory}/{year}/{qtr}/{elements[0][:3]}/{elements[0]}'
-                    os.makedirs(dir_path, exist_ok=True)
-
-                    with open(f'{dir_path}/{file_name}', 'w') as f:
-                        f.write(cleaned_file)
+    #--split_documents with no types keeps just the main 10-K body
+    document_types = None
+    if args.split_documents is not None:
+        document_types = args.split_documents or DEFAULT_DOCUMENT_TYPES
+
+    #the journal survives crashes, reruns skip every filing it has as done
+    os.makedirs(base_directory, exist_ok=True)
+    journal = DownloadJournal(args.journal or os.path.join(base_directory, 'download_journal.sqlite'))
+    #each master.idx is parsed once, changing --forms afterwards is a local query
+    catalog = IndexCatalog(args.catalog or os.path.join(base_directory, 'index_catalog.sqlite'))
+
+    #quarters and years are fetched in parallel, all requests share one rate limiter
+    downloader = EdgarDownloader(base_directory, headers, journal, catalog, base_url=args.baseurl,
+                                 max_workers=args.workers, requests_per_second=args.rate,
+                                 forms=args.forms, amendments=args.amendments, refresh_index=args.refresh_index,
+                                 compression=args.compression, document_types=document_types)
+    if args.retry_failed:
+        saved = downloader.retry_failed(years)
+    else:
+        saved = downloader.run(years)
+    downloader.close()
+    print(f'Saved {saved} filings. Journal: {journal.summary()}')
 
     #output the failed downloads as a csv
+    error_data = {
+        'CIK': [],
+        'Company Name': [],
+        'Form Type': [],
+        'Date Filed': [],
+        'Filename': [],
+        'Year': [],
+        'QTR': []
+    }
+    for year, qtr, elements in journal.failed(years):
+        error_data['CIK'].append(elements[0])
+        error_data['Company Name'].append(elements[1])
+        error_data['Form Type'].append(elements[2])
+        error_data['Date Filed'].append(elements[3])
+        error_data['Filename'].append(elements[4])
+        error_data['Year'].append(year)
+        error_data['QTR'].append(qtr)
+    journal.close()
+    catalog.close()
+
     df = pd.DataFrame(error_data)
     df.to_csv("error_output.csv", index=False)
 
-go()
+if __name__ == "__main__":
+    go()
@@ -1,25 +1,21 @@
-import os
-import pandas as pd
+from corpus_catalog import CorpusCatalog
 
 def go():
     # Add parameters
     scratch_dir = '../../scratch/alpine/nimi2356/raw_data'
+    catalog_path = '../../scratch/alpine/nimi2356/corpus_catalog.sqlite'
 
-    # List to store each file's info
-    file_data = []
+    # The catalog remembers every directory's mtime, so only directories that changed since the
+    # last run are listed again instead of walking and stat'ing the whole tree
+    catalog = CorpusCatalog(catalog_path, scratch_dir)
+    stats = catalog.refresh()
+    print(f"Directories listed: {stats['listed']}, unchanged: {stats['unchanged']}, "
+          f"files updated: {stats['updated']}, removed: {stats['removed']}")
 
-    # Traverse through directory and subdirectories
-    for root, dirs, files in os.walk(scratch_dir):
-        for file in files:
-            if file.endswith('.txt'):
-                file_path = os.path.join(root, file)
-                file_size = os.path.getsize(file_path)  # Get the file size
-                file_data.append({
-                    'Name of document': file,
-                    'Path to file': file_path.lstrip('./'), # Takes off the ../../
-                    'File size': file_size
-                })
+    # Same csv as before ('Name of document', 'Path to file', 'File size') for the stages that still read it
+    count = catalog.write_master_csv("../../scratch/alpine/nimi2356/new_master.csv")
+    print(f"{count} files written to new_master.csv")
+    catalog.close()
 
-    df = pd.DataFrame(file_data)
-    df.to_csv("../../scratch/alpine/nimi2356/new_master.csv", index=False)
-go()
\ No newline at end of file
+if __name__ == "__main__":
+    go()
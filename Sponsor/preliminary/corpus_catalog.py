@@ -0,0 +1,383 @@
+import os
+import csv
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from filing_storage import is_filing, strip_compression_suffix, open_filing, CHUNK_SIZE
+from filing_metadata import accession_year, QUARTER, ACCESSION_NAME
+
+# xxhash is much faster than any cryptographic hash, blake2b is the fastest one in the standard library
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Persistent catalog of the filings on disk, replacing the full os.walk that Pather.py did on every run.
+# Every directory's mtime is stored. On a refresh a directory whose mtime has not changed is not listed
+# again, only its known subdirectories are checked, so adding one quarter only rescans that quarter.
+# Downstream stages can query it by CIK, year, quarter and form instead of reading master csvs.
+#
+# Works for all three layouts we have: {year}/{qtr}/{cik[:3]}/{cik} (downloader),
+# {cik[:3]}/{cik} (raw_data_joiner.py) and {cik10[:6]}/{cik10} (restructure_directories.py).
+#
+# Each filing also gets a hash of its uncompressed content, so the same filing stored in several
+# trees (or downloaded for overlapping year ranges) is only stored and NER-processed once.
+
+def content_hash(path):
+    """Hash of a filing's uncompressed bytes, so plain and compressed copies hash the same."""
+    h = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    with open_filing(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return h.hexdigest()
+            h.update(chunk)
+
+def is_split_dir(name, filing_stems=()):
+    """
+    True for a folder of split documents (EdgarFilterer.py --split_documents): it sits next to its
+    filing and is named after it. Its documentN.txt files are parts of that filing, not filings.
+    """
+    return name in filing_stems or ACCESSION_NAME.match(name) is not None
+
+def path_metadata(rel_dir, name):
+    """(cik, year, qtr) from a directory relative to the corpus root and a filing name."""
+    parts = rel_dir.split(os.sep) if rel_dir else []
+    cik = int(parts[-1]) if parts and parts[-1].isdigit() else None
+    year = None
+    qtr = None
+    for i, part in enumerate(parts[:-1]):
+        if QUARTER.match(part) and i > 0 and parts[i - 1].isdigit():
+            year = int(parts[i - 1])
+            qtr = part
+    if year is None:
+        year = accession_year(name)
+    return cik, year, qtr
+
+class CorpusCatalog:
+    """SQLite catalog of the filings under one corpus root, indexed on CIK, year, quarter and form."""
+    def __init__(self, path, root):
+        self.path = path
+        self.root = root
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime_ns INTEGER
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                cik INTEGER,
+                year INTEGER,
+                qtr TEXT,
+                form TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                content_hash TEXT
+            )""")
+        # Catalogs made before content hashing was added
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(files)')]
+        if 'content_hash' not in columns:
+            self.conn.execute('ALTER TABLE files ADD COLUMN content_hash TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS files_dir ON files (dir)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS files_cik ON files (cik)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS files_year_qtr ON files (year, qtr)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS files_form ON files (form)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS files_hash ON files (content_hash)')
+        self.conn.commit()
+
+    def _forget_dir(self, rel_dir):
+        """Drop a directory that disappeared, with everything under it."""
+        # '_' and '%' are wildcards to LIKE, a directory named "1_2" must not take "102" with it
+        like = rel_dir.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + os.sep + '%'
+        self.conn.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (rel_dir, like))
+        self.conn.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (rel_dir, like))
+
+    def _scan_dir(self, rel_dir, stats):
+        """Rescan one directory whose mtime changed. Returns its subdirectories."""
+        full_dir = os.path.join(self.root, rel_dir)
+        known = {row[0]: (row[1], row[2]) for row in self.conn.execute(
+            'SELECT name, size, mtime_ns FROM files WHERE dir = ?', (rel_dir,))}
+        subdirs = []
+        seen = set()
+        with os.scandir(full_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                    continue
+                if not is_filing(entry.name):
+                    continue
+                seen.add(entry.name)
+                st = entry.stat()
+                if known.get(entry.name) == (st.st_size, st.st_mtime_ns):
+                    continue
+                cik, year, qtr = path_metadata(rel_dir, entry.name)
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO files (path, dir, name, cik, year, qtr, form, size, mtime_ns, content_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?, NULL)""",
+                    (os.path.join(rel_dir, entry.name), rel_dir, entry.name, cik, year, qtr, st.st_size, st.st_mtime_ns))
+                stats['updated'] += 1
+
+        for name in set(known) - seen:
+            self.conn.execute('DELETE FROM files WHERE path = ?', (os.path.join(rel_dir, name),))
+            stats['removed'] += 1
+
+        stems = {os.path.splitext(strip_compression_suffix(name))[0] for name in seen}
+        subdirs = [os.path.join(rel_dir, name) if rel_dir else name
+                   for name in subdirs if not is_split_dir(name, stems)]
+
+        # Subdirectories that are gone
+        current = set(subdirs)
+        for (old,) in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (rel_dir,)).fetchall():
+            if old not in current:
+                self._forget_dir(old)
+        return subdirs
+
+    def refresh(self, subpath=''):
+        """
+        Bring the catalog up to date with the disk, starting at subpath (relative to root).
+        Returns counts of directories listed, files updated and files removed.
+        """
+        stats = {'listed': 0, 'unchanged': 0, 'updated': 0, 'removed': 0}
+        parent = os.path.dirname(subpath) if subpath else None
+        stack = [(subpath, parent)]
+        visited = 0
+        while stack:
+            rel_dir, parent = stack.pop()
+            try:
+                mtime_ns = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+            except FileNotFoundError:
+                self._forget_dir(rel_dir)
+                continue
+
+            row = self.conn.execute('SELECT mtime_ns FROM dirs WHERE path = ?', (rel_dir,)).fetchone()
+            if row is not None and row[0] == mtime_ns:
+                # Nothing was added or removed here, only check the subdirectories we already know
+                stats['unchanged'] += 1
+                subdirs = [r[0] for r in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (rel_dir,))]
+                # Split document folders cataloged before they were left out
+                for subdir in [s for s in subdirs if is_split_dir(os.path.basename(s))]:
+                    self._forget_dir(subdir)
+                    subdirs.remove(subdir)
+            else:
+                stats['listed'] += 1
+                subdirs = self._scan_dir(rel_dir, stats)
+                self.conn.execute('INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)',
+                                  (rel_dir, parent, mtime_ns))
+            stack.extend((subdir, rel_dir) for subdir in subdirs)
+
+            visited += 1
+            if visited % 1000 == 0:
+                self.conn.commit()
+        self.conn.commit()
+        return stats
+
+    def fill_forms(self, index_catalog_path):
+        """Look up the form type of files that don't have one yet in the master.idx catalog (index_catalog.py)."""
+        self.conn.execute('ATTACH DATABASE ? AS idx', (index_catalog_path,))
+        self.conn.execute("""
+            UPDATE files SET form = (
+                SELECT form_type FROM idx.master_index m
+                WHERE m.filename = 'edgar/data/' || files.cik || '/' || substr(files.name, 1, instr(files.name, '.txt') + 3)
+            ) WHERE form IS NULL AND cik IS NOT NULL""")
+        self.conn.commit()
+        self.conn.execute('DETACH DATABASE idx')
+
+    def hash_files(self, workers=8):
+        """Hash every filing that has no content hash yet (new or changed since the last refresh)."""
+        paths = [row[0] for row in self.conn.execute('SELECT path FROM files WHERE content_hash IS NULL')]
+        print(f'Hashing {len(paths)} files')
+
+        def hash_one(path):
+            try:
+                return path, content_hash(os.path.join(self.root, path))
+            except OSError as e:
+                print(f'Error hashing {path}: {e}')
+                return path, None
+
+        hashed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, digest in pool.map(hash_one, paths):
+                if digest is None:
+                    continue
+                self.conn.execute('UPDATE files SET content_hash = ? WHERE path = ?', (digest, path))
+                hashed += 1
+                if hashed % 10000 == 0:
+                    self.conn.commit()
+        self.conn.commit()
+        return hashed
+
+    def duplicate_stats(self):
+        """(files, unique payloads, bytes that duplicates take up)."""
+        files, unique = self.conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT content_hash) FROM files WHERE content_hash IS NOT NULL').fetchone()
+        wasted = self.conn.execute("""
+            SELECT COALESCE(SUM(size), 0) FROM files
+            WHERE content_hash IS NOT NULL AND path <> (SELECT MIN(f2.path) FROM files f2 WHERE f2.content_hash = files.content_hash)
+            """).fetchone()[0]
+        return files, unique, wasted
+
+    def duplicate_paths(self, paths=None):
+        """
+        Full paths of every filing whose content is already stored under another (canonical) path.
+        With paths (full paths, e.g. the files one run is about to process) only those files are looked at
+        and the canonical copy is the smallest of them, so nothing is skipped in favour of a copy the run
+        never processes.
+        """
+        if paths is None:
+            rows = self.conn.execute("""
+                SELECT path FROM files
+                WHERE content_hash IS NOT NULL AND path <> (SELECT MIN(f2.path) FROM files f2 WHERE f2.content_hash = files.content_hash)
+                """)
+            return {os.path.join(self.root, row[0]) for row in rows}
+
+        root = os.path.abspath(self.root)
+        self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS selected (path TEXT PRIMARY KEY)')
+        self.conn.execute('DELETE FROM selected')
+        self.conn.executemany('INSERT OR IGNORE INTO selected (path) VALUES (?)',
+                              ((os.path.relpath(os.path.abspath(path), root),) for path in paths))
+        rows = self.conn.execute("""
+            SELECT f.path FROM files f JOIN selected s ON s.path = f.path
+            WHERE f.content_hash IS NOT NULL AND f.path <> (
+                SELECT MIN(f2.path) FROM files f2 JOIN selected s2 ON s2.path = f2.path
+                WHERE f2.content_hash = f.content_hash)
+            """).fetchall()
+        self.conn.execute('DELETE FROM selected')
+        return {os.path.join(self.root, row[0]) for row in rows}
+
+    def link_duplicates(self, dry_run=True):
+        """
+        Store each unique payload once: every duplicate is replaced by a hardlink to the canonical copy
+        (the smallest path with that hash). Only files with the same compression suffix are linked.
+        Returns (files linked, bytes freed).
+        """
+        rows = self.conn.execute("""
+            SELECT f.path, f.size, c.path FROM files f
+            JOIN files c ON c.path = (SELECT MIN(f2.path) FROM files f2 WHERE f2.content_hash = f.content_hash)
+            WHERE f.content_hash IS NOT NULL AND f.path <> c.path""").fetchall()
+        linked = 0
+        freed = 0
+        for path, size, canonical in rows:
+            if os.path.splitext(path)[1] != os.path.splitext(canonical)[1]:
+                continue
+            full_path = os.path.join(self.root, path)
+            full_canonical = os.path.join(self.root, canonical)
+            try:
+                if os.path.samefile(full_path, full_canonical):
+                    continue
+                if not dry_run:
+                    # Link next to the duplicate, then rename over it, so the path never goes missing
+                    tmp_path = full_path + '.dedupe'
+                    os.link(full_canonical, tmp_path)
+                    os.replace(tmp_path, full_path)
+                    # The link has the canonical file's mtime, keep the catalog in step so it isn't rehashed
+                    self.conn.execute('UPDATE files SET mtime_ns = ? WHERE path = ?',
+                                      (os.stat(full_path).st_mtime_ns, path))
+            except OSError as e:
+                print(f'Could not link {path} to {canonical}: {e}')
+                continue
+            linked += 1
+            freed += size
+        self.conn.commit()
+        return linked, freed
+
+    def query(self, cik=None, ciks=None, years=None, qtr=None, forms=None, unique_only=False):
+        """
+        Filings matching every given filter, as (path, name, cik, year, qtr, form, size) tuples.
+        path is relative to the corpus root. With unique_only, filings whose content is already
+        stored under another path are left out (files that are not hashed yet are kept).
+        """
+        clauses = []
+        params = []
+        if unique_only:
+            clauses.append('(content_hash IS NULL OR path = '
+                           '(SELECT MIN(f2.path) FROM files f2 WHERE f2.content_hash = files.content_hash))')
+        if cik is not None:
+            clauses.append('cik = ?')
+            params.append(cik)
+        if ciks:
+            ciks = list(ciks)
+            clauses.append(f'cik IN ({",".join("?" * len(ciks))})')
+            params += ciks
+        if years is not None:
+            years = list(years)
+            clauses.append(f'year IN ({",".join("?" * len(years))})')
+            params += years
+        if qtr is not None:
+            clauses.append('qtr = ?')
+            params.append(qtr)
+        if forms:
+            forms = list(forms)
+            clauses.append(f'form IN ({",".join("?" * len(forms))})')
+            params += forms
+
+        query = 'SELECT path, name, cik, year, qtr, form, size FROM files'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY path'
+        return self.conn.execute(query, params)
+
+    def unique_filings(self, **filters):
+        """Full paths of the selected filings, each unique payload once. Feed this to the NER stages."""
+        for row in self.query(unique_only=True, **filters):
+            yield os.path.join(self.root, row[0])
+
+    def write_master_csv(self, output_file, **filters):
+        """Write the selected filings in the same format Pather.py always produced."""
+        count = 0
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Name of document', 'Path to file', 'File size'])
+            for path, name, _, _, _, _, size in self.query(**filters):
+                writer.writerow([strip_compression_suffix(name), os.path.join(self.root, path).lstrip('./'), size])
+                count += 1
+        return count
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Refresh and query the corpus catalog.')
+    parser.add_argument('--root', type=str, required=True, help='Corpus root directory')
+    parser.add_argument('--catalog', type=str, required=True, help='Path to the catalog sqlite file')
+    parser.add_argument('--subpath', type=str, default='', help='Only refresh this part of the tree, e.g. 2014/QTR2')
+    parser.add_argument('--index_catalog', type=str, required=False, help='master.idx catalog to fill in form types from')
+    parser.add_argument('--output', type=str, required=False, help='Write a master csv of the selection here')
+    parser.add_argument('--cik', type=int, required=False, help='Only this CIK')
+    parser.add_argument('--startyear', type=int, required=False, help='The start year (INCLUSIVE)')
+    parser.add_argument('--endyear', type=int, required=False, help='The end year (EXCLUSIVE)')
+    parser.add_argument('--qtr', type=str, required=False, help='Only this quarter, e.g. QTR1')
+    parser.add_argument('--forms', type=str, nargs='*', help='Only these form types')
+    parser.add_argument('--hash', action='store_true', help='Hash new and changed filings for deduplication')
+    parser.add_argument('--unique_only', action='store_true', help='Leave duplicate filings out of --output')
+    parser.add_argument('--link_duplicates', action='store_true', help='Replace duplicate files with hardlinks to one copy')
+    parser.add_argument('--workers', type=int, default=8, help='Number of hashing threads')
+    args = parser.parse_args()
+
+    catalog = CorpusCatalog(args.catalog, args.root)
+    print(f'Refresh: {catalog.refresh(args.subpath)}')
+    if args.index_catalog:
+        catalog.fill_forms(args.index_catalog)
+    if args.hash:
+        catalog.hash_files(args.workers)
+        files, unique, wasted = catalog.duplicate_stats()
+        print(f'{files} hashed files, {unique} unique, {wasted / 1024 ** 3:.2f} GB in duplicates')
+    if args.link_duplicates:
+        linked, freed = catalog.link_duplicates(dry_run=False)
+        print(f'Linked {linked} duplicates, freed {freed / 1024 ** 3:.2f} GB')
+    if args.output:
+        years = None
+        if args.startyear is not None:
+            years = range(args.startyear, args.endyear if args.endyear else args.startyear + 1)
+        count = catalog.write_master_csv(args.output, cik=args.cik, years=years, qtr=args.qtr, forms=args.forms,
+                                         unique_only=args.unique_only)
+        print(f'{count} filings written to {args.output}')
+    catalog.close()
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import time
+
+# Persistent download journal for the EDGAR downloader. Every filing url gets a row with its state
+# (pending, done, failed), byte size and sha256 checksum. Rows are committed as soon as they change,
+# so a crash or node preemption never loses more than the filings that were in flight.
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+class DownloadJournal:
+    """
+    SQLite backed journal shared by all downloader threads.
+    One connection is used behind a lock, WAL mode keeps the commits cheap.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS filings (
+                url TEXT PRIMARY KEY,
+                year INTEGER,
+                qtr TEXT,
+                cik TEXT,
+                company TEXT,
+                form_type TEXT,
+                date_filed TEXT,
+                state TEXT NOT NULL,
+                bytes INTEGER,
+                sha256 TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated REAL
+            )""")
+        self.conn.execute('CREATE INDEX IF NOT EXISTS filings_state ON filings (state)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS filings_year_qtr ON filings (year, qtr)')
+        self.conn.commit()
+
+    def add_pending(self, year, qtr, entries):
+        """
+        Register the filings of one quarter. Filings already in the journal keep their state,
+        so rerunning a quarter does not reset finished or failed rows.
+        """
+        rows = [(e[4], year, qtr, e[0], e[1], e[2], e[3], PENDING, time.time()) for e in entries]
+        with self.lock:
+            self.conn.executemany("""
+                INSERT OR IGNORE INTO filings (url, year, qtr, cik, company, form_type, date_filed, state, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+            self.conn.commit()
+
+    def done_urls(self, year, qtr):
+        """Set of filing paths already downloaded for a quarter."""
+        with self.lock:
+            cur = self.conn.execute('SELECT url FROM filings WHERE year = ? AND qtr = ? AND state = ?',
+                                    (year, qtr, DONE))
+            return {row[0] for row in cur}
+
+    def mark_done(self, url, size, checksum):
+        with self.lock:
+            self.conn.execute("""
+                UPDATE filings SET state = ?, bytes = ?, sha256 = ?, attempts = attempts + 1,
+                last_error = NULL, updated = ? WHERE url = ?""", (DONE, size, checksum, time.time(), url))
+            self.conn.commit()
+
+    def mark_failed(self, url, error):
+        with self.lock:
+            self.conn.execute("""
+                UPDATE filings SET state = ?, attempts = attempts + 1, last_error = ?, updated = ?
+                WHERE url = ?""", (FAILED, str(error), time.time(), url))
+            self.conn.commit()
+
+    def failed(self, years=None):
+        """
+        Failed filings as (year, qtr, [cik, company, form type, date filed, filename]) tuples,
+        optionally limited to some years.
+        """
+        query = 'SELECT year, qtr, cik, company, form_type, date_filed, url FROM filings WHERE state = ?'
+        params = [FAILED]
+        if years is not None:
+            years = list(years)
+            query += f' AND year IN ({",".join("?" * len(years))})'
+            params += years
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [(row[0], row[1], list(row[2:])) for row in rows]
+
+    def summary(self):
+        """Count of filings in each state."""
+        with self.lock:
+            return dict(self.conn.execute('SELECT state, COUNT(*) FROM filings GROUP BY state').fetchall())
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,242 @@
+import os
+import random
+import shutil
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from index_catalog import ten_k_forms
+from filing_storage import write_stream, find_filing, open_compressed_writer, stored_name, CHUNK_SIZE
+from sgml_splitter import StreamingDocumentSplitter
+
+# Concurrent download engine for EdgarFilterer.py. Every request in the process goes through one
+# shared requests.Session (keep-alive connection pool) and one token bucket, so we stay under the
+# SEC fair access limit no matter how many worker threads are running.
+# https://www.sec.gov/search-filings/edgar-search-assistance/accessing-edgar-data
+
+EDGAR_URL_BASE = 'https://www.sec.gov/Archives/'
+
+# SEC allows at most 10 requests per second from one client
+SEC_MAX_REQUESTS_PER_SECOND = 10
+
+qtrs = ["QTR1", "QTR2", "QTR3", "QTR4"]
+
+# Status codes worth retrying. 403 is what SEC returns when the rate limit is exceeded
+RETRY_STATUS = {403, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available.
+    With capacity 1 requests are spaced evenly, so no one second window ever goes over the rate.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def make_session(headers, pool_size):
+    """Create a keep-alive session whose connection pool is big enough for every worker thread."""
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+class EdgarDownloader:
+    """
+    Downloads the 10-K filings listed in the master.idx files for a set of years.
+    All quarters of all years are fetched in parallel on a bounded thread pool.
+
+    base_url can point at a local stand-in server (see local_edgar_server.py) for testing.
+    journal is a DownloadJournal. Filings it already has as done are skipped, so a rerun resumes
+    mid-quarter, and every failure is recorded the moment it happens.
+    catalog is an IndexCatalog. Each master.idx is only downloaded if the catalog does not have that
+    quarter yet (or refresh_index is set). forms selects exact form types, default is TEN_K_FORMS,
+    amendments adds their /A forms.
+    Filings are streamed to disk in chunks, compressed with compression ('gzip', 'zstd' or None) on the way.
+    With document_types set, the <DOCUMENT> blocks of those types are also split out while the bytes
+    arrive, into a folder next to the filing (see sgml_splitter.py).
+    """
+    def __init__(self, base_directory, headers, journal, catalog, base_url=EDGAR_URL_BASE, max_workers=8,
+                 requests_per_second=SEC_MAX_REQUESTS_PER_SECOND, timeout=60, max_retries=5, backoff=2.0,
+                 forms=None, amendments=False, refresh_index=False, compression=None, document_types=None):
+        self.base_directory = base_directory
+        self.compression = compression
+        self.document_types = document_types
+        self.journal = journal
+        self.catalog = catalog
+        self.forms = ten_k_forms(forms, amendments)
+        self.refresh_index = refresh_index
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limiter = TokenBucket(requests_per_second)
+        self.session = make_session(headers, max_workers)
+
+    def get(self, url, stream=False):
+        """
+        Rate limited GET through the shared session. With stream=True the body is left on the socket
+        for iter_content, use the response as a context manager so the connection goes back to the pool.
+        Connection errors and retryable status codes are retried with exponential backoff plus jitter.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, timeout=self.timeout, stream=stream)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response
+                response.close()
+                error = requests.HTTPError(f'{response.status_code} for url: {url}', response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            delay = self.backoff * (2 ** attempt) + random.uniform(0, 1)
+            print(f'[RETRY] {url} failed ({error}), retrying in {delay:.1f}s')
+            time.sleep(delay)
+
+    def index_url(self, year, qtr):
+        return f'{self.base_url}edgar/full-index/{year}/{qtr}/master.idx'
+
+    def fetch_index(self, year, qtr):
+        """
+        Make sure one quarter is in the catalog, then select its filings by form type.
+        Returns [cik, company, form type, date filed, filename] lists.
+        """
+        if self.refresh_index or not self.catalog.has_quarter(year, qtr):
+            content = self.get(self.index_url(year, qtr)).content.decode("latin-1")
+            #print a preview of the master file to make it obvious when we exceed the rate request
+            print(f'Index for {year}, {qtr}:\n{content[:250]}')
+            count = self.catalog.load_quarter(year, qtr, content)
+            print(f'Cataloged {count} filings for {year}, {qtr}')
+
+        rows = self.catalog.query(forms=self.forms, years=[year], qtr=qtr)
+        return [[str(row[0]), row[1], row[2], row[3], row[4]] for row in rows]
+
+    def filing_path(self, year, qtr, elements):
+        file_name = elements[4].split('/')[-1]
+        return f'{self.base_directory}/{year}/{qtr}/{elements[0][:3]}/{elements[0]}/{file_name}'
+
+    def download_filing(self, year, qtr, elements):
+        """
+        Download a single filing and save it under {year}/{qtr}/{cik[:3]}/{cik}.
+        The body is streamed to disk chunk by chunk, through a .part file that is renamed at the end.
+        """
+        path = self.filing_path(year, qtr, elements)
+        try:
+            form_url = self.base_url + elements[4]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self.get(form_url, stream=True) as response:
+                chunks = response.iter_content(CHUNK_SIZE)
+                if self.document_types:
+                    chunks = self.split_documents(chunks, path)
+                try:
+                    _, size, checksum = write_stream(chunks, path, self.compression)
+                finally:
+                    # Runs the splitter's cleanup right away if write_stream stopped early
+                    if self.document_types:
+                        chunks.close()
+        except Exception as e:
+            #Form failed to download
+            print(f'[ERROR] Form download failed. Year: {year}, Quarter: {qtr}, Info: {elements}, Error: {e}')
+            self.journal.mark_failed(elements[4], e)
+            return False
+
+        # size and checksum are of the uncompressed filing, so they do not depend on --compression
+        self.journal.mark_done(elements[4], size, checksum)
+        return True
+
+    def split_documents(self, chunks, path):
+        """
+        Pass the chunks through unchanged while splitting them into documents.
+        Documents go to {filing name}/document{N}.txt, their offsets to {filing name}/documents.csv.
+        If the download fails or the chunks are not read to the end, the open document is closed and
+        the folder removed, so there are never documents without their documents.csv.
+        """
+        output_dir = os.path.splitext(path)[0]
+        compression = self.compression
+        splitter = StreamingDocumentSplitter(
+            output_dir, self.document_types,
+            open_writer=lambda p: open_compressed_writer(stored_name(p, compression), compression))
+        finished = False
+        try:
+            for chunk in chunks:
+                splitter.feed(chunk)
+                yield chunk
+            splitter.close()
+            os.makedirs(output_dir, exist_ok=True)
+            splitter.write_index(os.path.join(output_dir, 'documents.csv'))
+            finished = True
+        finally:
+            if not finished:
+                splitter.abort()
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+    def submit_quarter(self, pool, year, qtr, entries):
+        """Journal the quarter's filings and queue the ones that are not finished yet."""
+        self.journal.add_pending(year, qtr, entries)
+        done = self.journal.done_urls(year, qtr)
+        todo = [e for e in entries if e[4] not in done or find_filing(self.filing_path(year, qtr, e)) is None]
+        print(f'Now downloading {len(todo)} 10-Ks for: {year}, {qtr} ({len(entries) - len(todo)} already done)')
+        return [pool.submit(self.download_filing, year, qtr, elements) for elements in todo]
+
+    def wait(self, filing_futures):
+        saved = 0
+        for future in as_completed(filing_futures):
+            if future.result():
+                saved += 1
+                if saved % 1000 == 0:
+                    print(f'{saved} filings saved so far')
+        return saved
+
+    def run(self, years):
+        """
+        Fetch every quarter of every year. Index files and filings share one pool, so filings from
+        the first index that arrives start downloading while the other indexes are still coming in.
+        Returns the number of filings saved.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            index_futures = {pool.submit(self.fetch_index, year, qtr): (year, qtr)
+                             for year in years for qtr in qtrs}
+            filing_futures = []
+
+            for future in as_completed(index_futures):
+                year, qtr = index_futures[future]
+                try:
+                    entries = future.result()
+                except Exception as e:
+                    print(f'[ERROR] Index download failed. Year: {year}, Quarter: {qtr}, Error: {e}')
+                    continue
+                filing_futures += self.submit_quarter(pool, year, qtr, entries)
+
+            return self.wait(filing_futures)
+
+    def retry_failed(self, years=None):
+        """Download again only the filings the journal has as failed, without refetching any index."""
+        failed = self.journal.failed(years)
+        print(f'Retrying {len(failed)} failed filings')
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return self.wait([pool.submit(self.download_filing, year, qtr, elements)
+                              for year, qtr, elements in failed])
+
+    def close(self):
+        self.session.close()
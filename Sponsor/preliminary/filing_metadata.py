@@ -0,0 +1,243 @@
+import re
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# pyarrow's string kernels work on whole columns in C++, without a Python call per row
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# Metadata in file names and paths, parsed a whole column at a time.
+# Every stage used to take names apart on its own, one Python call per row: new_plot.py split the
+# accession number at '-', the caption count scripts split names at '.', reorganize_spacy.py looked
+# for channels with a substring loop and filterHTML.py split paths at '/'.
+#
+# parse_accession(), parse_filing_path() and parse_caption_name() are the rules for one value.
+# accession_metadata(), filing_path_metadata() and caption_metadata() apply the same rules to a
+# list or Series with pyarrow kernels (split, fixed-width slices, one regex capture) and return a
+# DataFrame with nullable Int64 columns for the numbers. Without pyarrow they fall back to the
+# scalar rules row by row, with the same output.
+#
+# Layouts:
+#   0000320193-14-000024                           accession number: filer CIK, two digit year, sequence
+#   {year}/{qtr}/{cik[:3]}/{cik}/{accession}.txt   filing paths of the downloader, {year}/{qtr} optional
+#   {network}.Text.{year}.{index}.csv              caption files, also cleaned_{network} and *_counts.csv
+#
+#   python filing_metadata.py --benchmark 1000000
+
+# Anywhere in the value, e.g. entity_report_0000320193-14-000024.csv
+ACCESSION_PATTERN = r'(?:^|[^0-9])(?P<accession>[0-9]{10}-[0-9]{2}-[0-9]{6})'
+ACCESSION = re.compile(ACCESSION_PATTERN)
+# A file name that is an accession number (up to its first '.')
+ACCESSION_NAME = re.compile(r'^[0-9]{10}-[0-9]{2}-[0-9]{6}$')
+QUARTER = re.compile(r'^QTR[1-4]$')
+YEAR = re.compile(r'^[0-9]{4}$')
+DIGITS = re.compile(r'^[0-9]+$')
+
+# <source>.<kind>.<year>.<part>.csv, source being [cleaned_]<network> and part the shard index or e.g. PERSON_counts
+CAPTION_PATTERN = (r'(?:^|/)(?P<source>(?:cleaned_)?(?P<network>[^./]+))\.[^./]+\.(?P<year>[0-9]{4})\.'
+                   r'(?P<part>[^/]+)\.csv$')
+CAPTION = re.compile(CAPTION_PATTERN)
+
+ACCESSION_COLUMNS = ['accession', 'filer_cik', 'filer_year', 'sequence']
+FILING_PATH_COLUMNS = ['year', 'quarter', 'bucket', 'cik'] + ACCESSION_COLUMNS
+CAPTION_COLUMNS = ['source', 'network', 'year', 'part', 'shard']
+INT_COLUMNS = {'filer_cik', 'filer_year', 'sequence', 'year', 'cik', 'shard'}
+# Missing values are <NA> in both column types
+STRING = pd.StringDtype('pyarrow' if pa is not None else 'python')
+
+# Two digit accession years: EDGAR starts in 1993, so 93-99 are the 1990s and 00-92 are 2000-2092
+CENTURY_PIVOT = 93
+
+def full_year(yy):
+    """93-99 -> 1993-1999, 00-92 -> 2000-2092."""
+    return 2000 + yy if yy < CENTURY_PIVOT else 1900 + yy
+
+def accession_fields(accession):
+    """Columns of one accession number (or None)."""
+    if accession is None:
+        return dict.fromkeys(ACCESSION_COLUMNS)
+    return {'accession': accession, 'filer_cik': int(accession[:10]),
+            'filer_year': full_year(int(accession[11:13])), 'sequence': int(accession[14:20])}
+
+def parse_accession(value):
+    """accession, filer_cik, filer_year and sequence of the first accession number in value."""
+    match = ACCESSION.search(value) if isinstance(value, str) else None
+    return accession_fields(match.group('accession') if match else None)
+
+def accession_year(value):
+    """Year of the accession number in a file name, or None."""
+    return parse_accession(value)['filer_year']
+
+def parse_filing_path(path):
+    """
+    year, quarter, bucket (the cik[:3] directory), cik and the accession columns of a '/' separated
+    filing path. Needs at least {bucket}/{cik}/{name}. year is the {year} of a {year}/{QTRn} above the
+    bucket, else the accession's.
+    """
+    parts = path.split('/') if isinstance(path, str) else []
+    if len(parts) < 3:
+        return dict.fromkeys(FILING_PATH_COLUMNS)
+    stem = parts[-1].split('.', 1)[0]
+    fields = accession_fields(stem if ACCESSION_NAME.match(stem) else None)
+    quarter = None
+    year = fields['filer_year']
+    if len(parts) >= 5 and QUARTER.match(parts[-4]) and YEAR.match(parts[-5]):
+        quarter = parts[-4]
+        year = int(parts[-5])
+    return {'year': year, 'quarter': quarter, 'bucket': parts[-3],
+            'cik': int(parts[-2]) if DIGITS.match(parts[-2]) else None, **fields}
+
+def parse_caption_name(name):
+    """source, network, year, part and shard (part as a number) of a caption file name or path."""
+    match = CAPTION.search(name) if isinstance(name, str) else None
+    if match is None:
+        return dict.fromkeys(CAPTION_COLUMNS)
+    part = match.group('part')
+    return {'source': match.group('source'), 'network': match.group('network'), 'year': int(match.group('year')),
+            'part': part, 'shard': int(part) if DIGITS.match(part) else None}
+
+# Column versions
+
+def rows_frame(parse, values, columns, index):
+    """Fallback without pyarrow: the scalar rule on every value."""
+    frame = pd.DataFrame([parse(value) for value in values], columns=columns, index=index)
+    for name in columns:
+        frame[name] = frame[name].astype('Int64' if name in INT_COLUMNS else STRING)
+    return frame
+
+def arrow_frame(arrays, columns, index):
+    """DataFrame from pyarrow arrays, Int64 numbers and pyarrow backed strings (no copy of the strings)."""
+    types = {pa.int64(): pd.Int64Dtype(), pa.string(): STRING}.get
+    return pd.DataFrame({name: arrays[name].to_pandas(types_mapper=types).array for name in columns}, index=index)
+
+def strings(values):
+    return pa.array(values, type=pa.string(), from_pandas=True)
+
+def null_unless(array, mask):
+    return pc.if_else(pc.fill_null(mask, False), array, pa.scalar(None, array.type))
+
+def arrow_accession_fields(accession):
+    """accession_fields() over an array of accession numbers (null where there is none): fixed-width slices."""
+    def number(start, stop):
+        return pc.cast(pc.utf8_slice_codeunits(accession, start, stop), pa.int64())
+    yy = number(11, 13)
+    return {'accession': accession, 'filer_cik': number(0, 10),
+            'filer_year': pc.add(yy, pc.if_else(pc.less(yy, CENTURY_PIVOT), 2000, 1900)), 'sequence': number(14, 20)}
+
+def accession_metadata(values):
+    """parse_accession() over a list or Series of names."""
+    index = values.index if isinstance(values, pd.Series) else None
+    if pc is None:
+        return rows_frame(parse_accession, values, ACCESSION_COLUMNS, index)
+    accession = pc.struct_field(pc.extract_regex(strings(values), ACCESSION_PATTERN), 'accession')
+    return arrow_frame(arrow_accession_fields(accession), ACCESSION_COLUMNS, index)
+
+def filing_path_metadata(paths):
+    """parse_filing_path() over a list or Series of paths: one split, then the last components by offset."""
+    index = paths.index if isinstance(paths, pd.Series) else None
+    if pc is None:
+        return rows_frame(parse_filing_path, paths, FILING_PATH_COLUMNS, index)
+    # Only the last five components are ever needed
+    parts = pc.split_pattern(strings(paths), '/', max_splits=5, reverse=True)
+    offsets = parts.offsets.to_numpy()
+    counts = np.diff(offsets)
+    last = offsets[1:] - 1
+    components = parts.values
+
+    def component(from_end, min_count):
+        """The from_end-th component counted from the last one, null for paths of fewer than min_count."""
+        short = counts < min_count
+        return components.take(pa.array(np.where(short, 0, last - from_end), mask=short))
+
+    name = component(0, 3)
+    stem = pc.list_element(pc.split_pattern(name, '.', max_splits=1), 0)
+    arrays = arrow_accession_fields(null_unless(stem, pc.match_substring_regex(stem, ACCESSION_NAME.pattern)))
+
+    quarter = component(3, 5)
+    year = component(4, 5)
+    dated = pc.and_(pc.fill_null(pc.match_substring_regex(quarter, QUARTER.pattern), False),
+                    pc.fill_null(pc.match_substring_regex(year, YEAR.pattern), False))
+    cik = component(1, 3)
+    arrays['quarter'] = null_unless(quarter, dated)
+    arrays['year'] = pc.if_else(dated, pc.cast(null_unless(year, dated), pa.int64()), arrays['filer_year'])
+    arrays['bucket'] = component(2, 3)
+    arrays['cik'] = pc.cast(null_unless(cik, pc.ascii_is_decimal(cik)), pa.int64())
+    return arrow_frame(arrays, FILING_PATH_COLUMNS, index)
+
+def caption_metadata(names):
+    """parse_caption_name() over a list or Series of caption file names or paths."""
+    index = names.index if isinstance(names, pd.Series) else None
+    if pc is None:
+        return rows_frame(parse_caption_name, names, CAPTION_COLUMNS, index)
+    match = pc.extract_regex(strings(names), CAPTION_PATTERN)
+    arrays = {name: pc.struct_field(match, name) for name in ('source', 'network', 'year', 'part')}
+    arrays['year'] = pc.cast(arrays['year'], pa.int64())
+    arrays['shard'] = pc.cast(null_unless(arrays['part'], pc.ascii_is_decimal(arrays['part'])),
+                              pa.int64())
+    return arrow_frame(arrays, CAPTION_COLUMNS, index)
+
+def match_channels(names, channels, default='Other'):
+    """
+    Channel of every name: the first of channels contained in it, ignoring case, else default.
+    One substring scan of all names per channel.
+    """
+    names = list(names)
+    result = np.full(len(names), default, dtype=object)
+    unmatched = np.ones(len(names), dtype=bool)
+    lowered = None if pc is not None else [name.lower() for name in names]
+    for channel in channels:
+        if pc is not None:
+            found = pc.match_substring(strings(names), channel, ignore_case=True).to_numpy(zero_copy_only=False)
+        else:
+            found = np.array([channel.lower() in name for name in lowered], dtype=bool)
+        hit = found & unmatched
+        result[hit] = channel
+        unmatched &= ~hit
+    return result.tolist()
+
+def synthetic_paths(count, seed=0):
+    """Downloader style filing paths for the benchmark."""
+    rng = np.random.default_rng(seed)
+    ciks = rng.integers(1, 2_000_000, count).tolist()
+    years = rng.integers(1994, 2025, count).tolist()
+    return [f'/scratch/alpine/edgar/{year}/QTR{1 + i % 4}/{str(cik)[:3]}/{cik}/{cik:010d}-{year % 100:02d}-{i % 1_000_000:06d}.txt'
+            for i, (cik, year) in enumerate(zip(ciks, years))]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parse filing paths, accession numbers or caption file names in bulk.')
+    parser.add_argument('--input', type=str, required=False, help='Text file with one path or name per line')
+    parser.add_argument('--kind', choices=['filing', 'accession', 'caption'], default='filing', help='Layout of the values')
+    parser.add_argument('--output', type=str, required=False, help='Write the parsed columns here as csv')
+    parser.add_argument('--benchmark', type=int, default=0, help='Time this many synthetic filing paths, column versus row by row')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        paths = pd.Series(synthetic_paths(args.benchmark))
+        start = time.perf_counter()
+        frame = filing_path_metadata(paths)
+        seconds = time.perf_counter() - start
+        engine = 'pyarrow' if pc is not None else 'row by row, no pyarrow'
+        print(f"filing_path_metadata: {len(frame)} paths in {seconds:.2f}s ({len(frame) / seconds:,.0f} paths/s, {engine})")
+        start = time.perf_counter()
+        rows = rows_frame(parse_filing_path, paths, FILING_PATH_COLUMNS, paths.index)
+        seconds = time.perf_counter() - start
+        print(f"parse_filing_path:    {len(rows)} paths in {seconds:.2f}s ({len(rows) / seconds:,.0f} paths/s), "
+              f"{'same' if rows.equals(frame) else 'DIFFERENT'} columns")
+
+    if args.input:
+        parsers = {'filing': filing_path_metadata, 'accession': accession_metadata, 'caption': caption_metadata}
+        with open(args.input, encoding='utf-8') as f:
+            values = pd.Series(f.read().splitlines())
+        frame = parsers[args.kind](values)
+        if args.output:
+            frame.insert(0, 'value', values)
+            frame.to_csv(args.output, index=False)
+            print(f"{len(frame)} rows written to {args.output}")
+        else:
+            print(frame.to_string())
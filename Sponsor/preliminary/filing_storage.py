@@ -0,0 +1,115 @@
+import io
+import os
+import gzip
+import hashlib
+
+# Streaming, optionally compressed storage for downloaded filings.
+# Writers take the response in chunks, so a 100 MB filing never has to sit in memory, and can
+# compress on the fly with gzip (standard library) or zstd (needs the zstandard package).
+# open_filing() is the matching reader: it picks the decompressor from the file extension, so
+# downstream stages (filterHTML.py, entityListandCount.py, Pather.py) read every layout the same way.
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# Every extension a stored filing can have, used when scanning directories
+FILING_SUFFIXES = ('.txt', '.txt.gz', '.txt.zst')
+
+CHUNK_SIZE = 1 << 20
+
+def stored_name(file_name, compression=None):
+    """Name a filing is stored under for the given compression."""
+    return file_name + COMPRESSION_SUFFIXES[compression]
+
+def is_filing(file_name):
+    return file_name.endswith(FILING_SUFFIXES)
+
+def strip_compression_suffix(file_name):
+    """document.txt.gz -> document.txt"""
+    for suffix in ('.gz', '.zst'):
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+def open_compressed_writer(path, compression=None, level=None):
+    """Binary file object that writes path, compressed with compression. path should already have the suffix."""
+    if compression is None:
+        return open(path, 'wb')
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=level or 6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstd compression needs the zstandard package (pip install zstandard)')
+        raw = open(path, 'wb')
+        return zstandard.ZstdCompressor(level=level or 3).stream_writer(raw, closefd=True)
+    raise ValueError(f'Unknown compression: {compression}')
+
+def write_stream(chunks, path, compression=None, level=None):
+    """
+    Write an iterable of byte chunks to path (plus the compression suffix).
+    Goes through a .part file and a rename so a crash never leaves a truncated filing behind.
+    Returns (final path, uncompressed size, sha256 of the uncompressed bytes).
+    """
+    final_path = stored_name(path, compression)
+    part_path = final_path + '.part'
+    size = 0
+    sha256 = hashlib.sha256()
+    try:
+        with open_compressed_writer(part_path, compression, level) as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                f.write(chunk)
+                size += len(chunk)
+                sha256.update(chunk)
+        os.replace(part_path, final_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return final_path, size, sha256.hexdigest()
+
+def find_filing(path):
+    """Return whichever of path, path.gz, path.zst exists, or None."""
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+def open_filing(path, mode='r', encoding='utf-8', errors='strict'):
+    """
+    Open a stored filing for reading whatever its compression.
+    mode 'r' gives text, 'rb' gives bytes. path may name the file with or without the compression suffix.
+    """
+    if not os.path.exists(path):
+        found = find_filing(path)
+        if found is None:
+            raise FileNotFoundError(path)
+        path = found
+
+    binary = 'b' in mode
+    if path.endswith('.gz'):
+        raw = gzip.open(path, 'rb')
+    elif path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('Reading .zst filings needs the zstandard package (pip install zstandard)')
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    else:
+        return open(path, 'rb') if binary else open(path, 'r', encoding=encoding, errors=errors)
+
+    if binary:
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding, errors=errors)
+
+def read_filing(path, encoding='utf-8', errors='strict'):
+    """Read a whole stored filing as text."""
+    with open_filing(path, 'r', encoding=encoding, errors=errors) as f:
+        return f.read()
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+import argparse
+import csv
+
+# Local catalog of the EDGAR master.idx files. Each quarter's index is downloaded and parsed once
+# into typed columns (CIK, company, form type, date filed, filename), so choosing which filings to
+# download is a local query instead of another pass over the network.
+#
+# Example: 10-K and 10-K405 for 2003-2008, CIKs 100xxx
+#   python index_catalog.py --catalog index_catalog.sqlite --forms 10-K 10-K405 --startyear 2003 --endyear 2009 \
+#       --cik_min 100000 --cik_max 100999 --output selection.csv
+
+# Annual report form types, selected by exact match. 10-K405 and 10-KT405 were filed until 2002,
+# 10-KSB and 10-KSB40 by small businesses until 2009, 10-KT covers a transition period.
+# Amendments (the same types with /A) restate parts of a filing and are only selected on request.
+TEN_K_FORMS = ['10-K', '10-K405', '10-KSB', '10-KSB40', '10-KT', '10-KT405']
+
+def ten_k_forms(forms=None, amendments=False):
+    """forms (default TEN_K_FORMS) as an exact list, plus their /A amendments if amendments is set."""
+    forms = list(forms or TEN_K_FORMS)
+    if amendments:
+        forms += [form + '/A' for form in forms if not form.endswith('/A')]
+    return forms
+
+def normalize_date(date_filed):
+    """Older indexes write dates as YYYYMMDD, newer ones as YYYY-MM-DD. Store everything as YYYY-MM-DD."""
+    date_filed = date_filed.strip()
+    if len(date_filed) == 8 and date_filed.isdigit():
+        return f'{date_filed[:4]}-{date_filed[4:6]}-{date_filed[6:]}'
+    return date_filed
+
+def parse_master_idx(content):
+    """
+    Parse the text of a master.idx into (cik, company, form type, date filed, filename) tuples.
+    Everything up to the dashed line under the column header is skipped.
+    """
+    lines = content.splitlines()
+    start = 0
+    for i, line in enumerate(lines):
+        if line.startswith('-----'):
+            start = i + 1
+            break
+
+    rows = []
+    for line in lines[start:]:
+        elements = line.split('|')
+        if len(elements) != 5 or not elements[0].strip().isdigit():
+            continue
+        rows.append((int(elements[0]), elements[1].strip(), elements[2].strip(),
+                     normalize_date(elements[3]), elements[4].strip()))
+    return rows
+
+class IndexCatalog:
+    """
+    SQLite catalog of parsed master.idx files, indexed by form type, year and CIK.
+    Thread-safe so the downloader threads can load quarters as their indexes arrive.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS master_index (
+                cik INTEGER NOT NULL,
+                company TEXT,
+                form_type TEXT NOT NULL,
+                date_filed TEXT,
+                filename TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                qtr TEXT NOT NULL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS loaded_quarters (
+                year INTEGER NOT NULL,
+                qtr TEXT NOT NULL,
+                filings INTEGER,
+                PRIMARY KEY (year, qtr)
+            )""")
+        self.conn.execute('CREATE INDEX IF NOT EXISTS master_form_year ON master_index (form_type, year)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS master_year_qtr ON master_index (year, qtr)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS master_cik ON master_index (cik)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS master_filename ON master_index (filename)')
+        self.conn.commit()
+
+    def has_quarter(self, year, qtr):
+        with self.lock:
+            row = self.conn.execute('SELECT 1 FROM loaded_quarters WHERE year = ? AND qtr = ?', (year, qtr)).fetchone()
+        return row is not None
+
+    def load_quarter(self, year, qtr, content):
+        """Replace one quarter in the catalog with the parsed contents of its master.idx. Returns the row count."""
+        rows = parse_master_idx(content)
+        with self.lock:
+            self.conn.execute('DELETE FROM master_index WHERE year = ? AND qtr = ?', (year, qtr))
+            self.conn.executemany('INSERT INTO master_index VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                  [row + (year, qtr) for row in rows])
+            self.conn.execute('INSERT OR REPLACE INTO loaded_quarters VALUES (?, ?, ?)', (year, qtr, len(rows)))
+            self.conn.commit()
+        return len(rows)
+
+    def query(self, forms=None, years=None, qtr=None, cik_min=None, cik_max=None, ciks=None):
+        """
+        Select filings from the catalog. All filters are optional and combined with AND.
+        forms is a list of exact form types.
+        Returns (cik, company, form type, date filed, filename, year, qtr) tuples.
+        """
+        clauses = []
+        params = []
+        if forms:
+            forms = list(forms)
+            clauses.append(f'form_type IN ({",".join("?" * len(forms))})')
+            params += forms
+        if years is not None:
+            years = list(years)
+            clauses.append(f'year IN ({",".join("?" * len(years))})')
+            params += years
+        if qtr is not None:
+            clauses.append('qtr = ?')
+            params.append(qtr)
+        if cik_min is not None:
+            clauses.append('cik >= ?')
+            params.append(cik_min)
+        if cik_max is not None:
+            clauses.append('cik <= ?')
+            params.append(cik_max)
+        if ciks:
+            ciks = list(ciks)
+            clauses.append(f'cik IN ({",".join("?" * len(ciks))})')
+            params += ciks
+
+        query = 'SELECT cik, company, form_type, date_filed, filename, year, qtr FROM master_index'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY year, qtr, cik, filename'
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query the local master.idx catalog.')
+    parser.add_argument('--catalog', type=str, required=True, help='Path to the catalog sqlite file')
+    parser.add_argument('--forms', type=str, nargs='*', help='Exact form types. Defaults to the 10-K forms without amendments')
+    parser.add_argument('--amendments', action='store_true', help='Also select the /A amendments of the forms')
+    parser.add_argument('--startyear', type=int, required=False, help='The start year (INCLUSIVE)')
+    parser.add_argument('--endyear', type=int, required=False, help='The end year (EXCLUSIVE)')
+    parser.add_argument('--cik_min', type=int, required=False, help='Smallest CIK (INCLUSIVE)')
+    parser.add_argument('--cik_max', type=int, required=False, help='Largest CIK (INCLUSIVE)')
+    parser.add_argument('--output', type=str, default='selection.csv', help='Where to write the selected filings')
+    args = parser.parse_args()
+
+    years = None
+    if args.startyear is not None:
+        years = range(args.startyear, args.endyear if args.endyear else args.startyear + 1)
+
+    catalog = IndexCatalog(args.catalog)
+    rows = catalog.query(forms=ten_k_forms(args.forms, args.amendments), years=years, cik_min=args.cik_min, cik_max=args.cik_max)
+    catalog.close()
+
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['CIK', 'Company Name', 'Form Type', 'Date Filed', 'Filename', 'Year', 'QTR'])
+        writer.writerows(rows)
+    print(f'{len(rows)} filings written to {args.output}')
@@ -0,0 +1,145 @@
+import os
+import re
+import time
+import argparse
+import tempfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# Local stand-in for www.sec.gov/Archives so the downloader can be tested without hitting EDGAR.
+# It writes fake master.idx files and filings into a directory laid out like the Archives and serves it.
+#
+# It can also answer slowly (--delay) and fail the first requests for some paths with the status
+# codes the downloader has to retry (--fail_statuses 429 503 --fail_pattern QTR1), and it records
+# every request so a test can check the concurrency and the request rate (test_edgar_downloader.py).
+#
+# Usage:
+#   python local_edgar_server.py --startyear 2003 --endyear 2005 --port 8000
+#   python EdgarFilterer.py --startyear 2003 --endyear 2005 --baseurl http://127.0.0.1:8000/ --basedir ./test_download
+
+MASTER_HEADER = """Description:           Master Index of EDGAR Dissemination Feed
+Last Data Received:    Fake
+Comments:              webmaster@sec.gov
+Anonymous FTP:         ftp://ftp.sec.gov/edgar/
+
+CIK|Company Name|Form Type|Date Filed|Filename
+--------------------------------------------------------------------------------
+"""
+
+FAKE_FILING = """<SEC-DOCUMENT>{accession}.txt
+<SEC-HEADER>
+CONFORMED SUBMISSION TYPE:	{form}
+COMPANY CONFORMED NAME:	{company}
+CENTRAL INDEX KEY:	{cik}
+</SEC-HEADER>
+<DOCUMENT>
+<TYPE>{form}
+<SEQUENCE>1
+<FILENAME>main.htm
+<TEXT>
+<html><body><p>{company} is headquartered in New York and has offices in Texas.</p></body></html>
+</TEXT>
+</DOCUMENT>
+<DOCUMENT>
+<TYPE>EX-21
+<SEQUENCE>2
+<FILENAME>ex21.htm
+<TEXT>
+<html><body><p>Subsidiaries of {company}: Fake Holdings LLC (Delaware)</p></body></html>
+</TEXT>
+</DOCUMENT>
+</SEC-DOCUMENT>
+"""
+
+# (form type, number of filings per quarter). Non 10-K forms make sure the filter is exercised.
+FAKE_FORMS = [('10-K', 5), ('10-K405', 2), ('10-K/A', 1), ('8-K', 3)]
+
+def build_fake_archive(root, years, qtrs=("QTR1", "QTR2", "QTR3", "QTR4")):
+    """Write master.idx files and their filings under root. Returns the number of filings written."""
+    written = 0
+    for year in years:
+        for q, qtr in enumerate(qtrs, start=1):
+            lines = []
+            for form_num, (form, count) in enumerate(FAKE_FORMS):
+                for i in range(count):
+                    cik = f'{100 + form_num}{year % 100:02d}{q}{i}'
+                    company = f'FAKE {form} CO {i}'
+                    accession = f'0000{cik}-{str(year)[2:]}-{q:06d}'
+                    path = f'edgar/data/{cik}/{accession}.txt'
+                    lines.append(f'{cik}|{company}|{form}|{year}-{q * 3:02d}-15|{path}')
+
+                    filing_path = os.path.join(root, path)
+                    os.makedirs(os.path.dirname(filing_path), exist_ok=True)
+                    with open(filing_path, 'w') as out:
+                        out.write(FAKE_FILING.format(accession=accession, form=form, company=company, cik=cik))
+                    written += 1
+
+            index_dir = os.path.join(root, 'edgar', 'full-index', str(year), qtr)
+            os.makedirs(index_dir, exist_ok=True)
+            with open(os.path.join(index_dir, 'master.idx'), 'w', encoding='latin-1') as f:
+                f.write(MASTER_HEADER + '\n'.join(lines) + '\n')
+    return written
+
+class FakeEdgarHandler(SimpleHTTPRequestHandler):
+    """Serves the archive after the server's delay, failing the first requests of the failing paths."""
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            attempt = server.attempts[self.path] = server.attempts.get(self.path, 0) + 1
+            server.requests.append((time.monotonic(), self.path))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            if attempt <= len(server.fail_statuses) and server.fail_pattern.search(self.path):
+                self.send_error(server.fail_statuses[attempt - 1])
+            else:
+                super().do_GET()
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(root, port, delay=0, fail_statuses=(), fail_pattern=''):
+    """
+    Server for the archive under root, port 0 picks a free one. Every request waits delay seconds.
+    The first len(fail_statuses) requests of each path matching fail_pattern get those statuses.
+    server.requests has (time, path) of every request, server.attempts the requests per path and
+    server.max_in_flight the most requests it had at the same time.
+    """
+    handler = partial(FakeEdgarHandler, directory=root)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.fail_statuses = list(fail_statuses)
+    server.fail_pattern = re.compile(fail_pattern)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.attempts = {}
+    server.in_flight = 0
+    server.max_in_flight = 0
+    print(f'Serving fake EDGAR archive from {root} at http://127.0.0.1:{server.server_port}/')
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a fake EDGAR archive for testing the downloader.')
+    parser.add_argument('--startyear', type=int, required=True, help='The start year (INCLUSIVE)')
+    parser.add_argument('--endyear', type=int, required=True, help='The end year (EXCLUSIVE)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--root', type=str, required=False, help='Directory for the fake archive. Defaults to a temp directory')
+    parser.add_argument('--delay', type=float, default=0, help='Seconds every request waits before it is answered')
+    parser.add_argument('--fail_statuses', type=int, nargs='*', default=[], help='Statuses of the first requests for each failing path, e.g. 429 503')
+    parser.add_argument('--fail_pattern', type=str, default='', help='Regex of the paths that fail first. Defaults to every path')
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix='fake_edgar_')
+    count = build_fake_archive(root, range(args.startyear, args.endyear))
+    print(f'Wrote {count} fake filings')
+    server = serve(root, args.port, args.delay, args.fail_statuses, args.fail_pattern)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -2,6 +2,7 @@
 
 import pandas as pd
 import csv
+import argparse
 
 def detect_delimiter(file_path):
     with open(file_path, 'r') as file:
@@ -11,19 +12,53 @@ def detect_delimiter(file_path):
         delimiter = sniffer.sniff(first_line).delimiter
         return delimiter
 
-def combine_csv_files(file_paths, output_file, custom_header=None):
-    combined_df = pd.DataFrame()
+def normalize_chunk(chunk, custom_header):
+    """Give every chunk the same column names, in the same order, before it is appended."""
+    if custom_header is not None:
+        if len(chunk.columns) != len(custom_header):
+            raise ValueError(f"Expected {len(custom_header)} columns, got {len(chunk.columns)}: {list(chunk.columns)}")
+        chunk.columns = custom_header
+    return chunk
 
-    for file in file_paths:
-        print("Current Path: " + file)
-        # Detect the delimiter for each file
-        delimiter = detect_delimiter(file)
-        df = pd.read_csv(file, delimiter=delimiter, header=0)
-        combined_df = pd.concat([combined_df, df], ignore_index=True)
+def combine_csv_files(file_paths, output_file, custom_header=None, chunksize=500_000, output_format='csv'):
+    """
+    Stream every input file in chunks straight into the output, so memory stays at one chunk
+    no matter how many masters are combined. output_format is 'csv' or 'parquet'.
+    """
+    writer = None
+    schema = None
+    rows = 0
+    first = True
 
-    # Save the combined DataFrame to the output CSV file
-    combined_df.to_csv(output_file, index=False, header=custom_header)
-    print(f"Combined file saved as {output_file}")
+    try:
+        for file in file_paths:
+            print("Current Path: " + file)
+            # Detect the delimiter for each file
+            delimiter = detect_delimiter(file)
+            for chunk in pd.read_csv(file, delimiter=delimiter, header=0, chunksize=chunksize):
+                chunk = normalize_chunk(chunk, custom_header)
+
+                if output_format == 'parquet':
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    # Nullable dtypes keep a column's type the same in every chunk (an int column with
+                    # a missing value would otherwise turn into float and break the parquet schema)
+                    chunk = chunk.convert_dtypes()
+                    if writer is None:
+                        schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                        writer = pq.ParquetWriter(output_file, schema)
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                else:
+                    # First chunk creates the file with the header, the rest are appended
+                    chunk.to_csv(output_file, index=False, header=first, mode='w' if first else 'a')
+
+                first = False
+                rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"Combined file saved as {output_file} ({rows} rows)")
 
 file_paths = [
     '../../scratch/alpine/mame5632/1993_1998_master.csv', # Max
@@ -36,4 +71,11 @@ file_paths = [
 
 custom_header = ['Name of document', 'Path to file', 'File size']
 
-combine_csv_files(file_paths, '../../scratch/alpine/nimi2356/1993_2025_master.csv', custom_header)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Combine the year range master csvs.')
+    parser.add_argument('--output', type=str, default='../../scratch/alpine/nimi2356/1993_2025_master.csv', help='Combined output file')
+    parser.add_argument('--format', type=str, choices=['csv', 'parquet'], default='csv', help='Output format')
+    parser.add_argument('--chunksize', type=int, default=500_000, help='Rows read at a time')
+    args = parser.parse_args()
+
+    combine_csv_files(file_paths, args.output, custom_header, chunksize=args.chunksize, output_format=args.format)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import re
+import numpy as np
+
+# Character offset -> line (or paragraph) number for a whole text in one go.
+# Line starts are found by NumPy on the encoded text instead of a Python loop over every character,
+# and all offsets of a file are resolved with a single searchsorted call, so the cost is
+# O(chars) in C plus O(entities * log lines) instead of O(chars + entities * lines).
+#
+#   index = PositionIndex(text)
+#   index.line_numbers([ent.start_char for ent in doc.ents])
+#
+# entityListandCount.py is the only stage that reports line numbers. The others report no line or
+# paragraph positions: state_gazetteer.py keeps counts, spacy_implementation.py character offsets,
+# and the Moody scripts number sentences as spaCy splits them, which a character index can't give.
+
+# A paragraph starts after a blank line, or at the top of the text
+PARAGRAPH_BREAK = re.compile(r'\n[ \t\r\f\v]*\n')
+
+def newline_offsets(text):
+    """Character offsets of every '\\n' in text, as an int64 array."""
+    if text.isascii():
+        codes = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    else:
+        # Fixed width encoding keeps byte position / 4 == character position
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    return np.flatnonzero(codes == ord('\n'))
+
+class PositionIndex:
+    """
+    Line and paragraph starts of a text. Numbers are 1-based: an offset on the first line is line 1,
+    an offset right after a '\\n' is on the next line (same as counting line starts <= offset).
+    """
+    def __init__(self, text):
+        self.length = len(text)
+        self.line_starts = np.concatenate(([0], newline_offsets(text) + 1))
+        self._text = text
+        self._paragraph_starts = None
+
+    @property
+    def paragraph_starts(self):
+        # Only built when someone asks for paragraphs
+        if self._paragraph_starts is None:
+            ends = [m.end() for m in PARAGRAPH_BREAK.finditer(self._text)]
+            self._paragraph_starts = np.array([0] + ends, dtype=np.int64)
+        return self._paragraph_starts
+
+    def line_numbers(self, offsets):
+        """Line number of every offset, as an int64 array in the same order."""
+        return np.searchsorted(self.line_starts, np.asarray(offsets, dtype=np.int64), side='right')
+
+    def paragraph_numbers(self, offsets):
+        """Paragraph number of every offset, paragraphs being separated by blank lines."""
+        return np.searchsorted(self.paragraph_starts, np.asarray(offsets, dtype=np.int64), side='right')
+
+    def line_number(self, offset):
+        return int(self.line_numbers([offset])[0])
+
+    @property
+    def lines(self):
+        return len(self.line_starts)
@@ -1,80 +1,232 @@
 import os
-import shutil
 import sys
+import errno
+import shutil
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Merges year/quarter/first3cik/fullcik download trees into one first3cik/fullcik tree.
+# Directories are listed with os.scandir (one round trip per directory instead of one per file),
+# the per-CIK merges run on a thread pool so the metadata calls overlap, and files are hardlinked
+# (or reflinked) when source and destination share a filesystem. Copying is only the fallback.
+# Note that a hardlinked file is the same file as the source, so do not edit merged files in place.
+#
+# One task merges every quarter's directory of a CIK, in year and quarter order, so a destination
+# directory has a single writer and the first copy of a file wins like it did with the old loop.
+# Subdirectories (the <cik>/<accession>/ folders of --split_documents) are merged the same way.
+# Files are created exclusively, an existing destination file is never overwritten or removed.
+
+DEFAULT_DEST_DIR = os.path.join('../../scratch/alpine/nimi2356', 'raw_data')
+
+# Linux ioctl for a copy-on-write clone (btrfs, xfs with reflink)
+FICLONE = 0x40049409
+
+# Used by the dry run to project the copy time, metadata time is measured during the scan
+DEFAULT_COPY_MB_PER_SECOND = 200
+
+def list_dirs(path):
+    with os.scandir(path) as it:
+        return [entry for entry in it if entry.is_dir()]
+
+def reflink(src_file, dest_file):
+    """
+    Copy-on-write clone of src_file. Raises FileExistsError if dest_file exists, other OSErrors if
+    the filesystem can't do it.
+    """
+    import fcntl
+    with open(src_file, 'rb') as src, open(dest_file, 'xb') as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dest.close()
+            os.remove(dest_file)
+            raise
+    shutil.copystat(src_file, dest_file)
+
+def copy_exclusive(src_file, dest_file):
+    """shutil.copy2 that raises FileExistsError instead of overwriting dest_file."""
+    with open(src_file, 'rb') as src, open(dest_file, 'xb') as dest:
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+    shutil.copystat(src_file, dest_file)
+
+class MergeStats:
+    """Counters shared by the worker threads."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.linked = 0
+        self.reflinked = 0
+        self.copied = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+class RawDataMerger:
+    """
+    mode 'link' tries a hardlink, then a reflink, then copies. mode 'copy' always copies.
+    Once a link fails because source and destination are on different filesystems we stop trying it.
+    """
+    def __init__(self, dest_dir, mode='link', dry_run=False):
+        self.dest_dir = dest_dir
+        self.mode = mode
+        self.dry_run = dry_run
+        self.stats = MergeStats()
+        self.can_link = mode == 'link'
+        self.can_reflink = mode == 'link'
+
+    def place(self, src_file, dest_file):
+        """Put src_file at dest_file with the cheapest method that works. Returns the method used."""
+        if self.can_link:
+            try:
+                os.link(src_file, dest_file)
+                return 'linked'
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                if e.errno == errno.EXDEV:
+                    self.can_link = False
+        if self.can_reflink:
+            try:
+                reflink(src_file, dest_file)
+                return 'reflinked'
+            except FileExistsError:
+                raise
+            except (OSError, ImportError):
+                self.can_reflink = False
+        copy_exclusive(src_file, dest_file)
+        return 'copied'
+
+    def merge_cik(self, first3cik, fullcik, src_dirs):
+        """Merge the directories of one CIK, in order, into dest_dir/first3cik/fullcik."""
+        dest_fullcik_dir = os.path.join(self.dest_dir, first3cik, fullcik)
+        existing = {}
+        for src_dir in src_dirs:
+            self.merge_dir(src_dir, dest_fullcik_dir, existing)
+
+    def merge_dir(self, src_dir, dest_dir, existing):
+        """
+        Merge src_dir into dest_dir without overwriting, subdirectories too. existing caches
+        {destination directory: names in it} across the quarters of one CIK.
+        """
+        if dest_dir not in existing:
+            # One listing of the destination instead of an os.path.exists per file
+            try:
+                with os.scandir(dest_dir) as it:
+                    existing[dest_dir] = {entry.name for entry in it}
+            except FileNotFoundError:
+                existing[dest_dir] = set()
+                if not self.dry_run:
+                    os.makedirs(dest_dir, exist_ok=True)
+        names = existing[dest_dir]
+
+        with os.scandir(src_dir) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_dir():
+                names.add(entry.name)
+                self.merge_dir(entry.path, os.path.join(dest_dir, entry.name), existing)
+                continue
+            if not entry.is_file():
+                continue
+            if entry.name in names:
+                # Skip copying if the file already exists, an earlier quarter's copy wins
+                self.stats.add(skipped=1)
+                continue
+            names.add(entry.name)
+            size = entry.stat().st_size
+            if self.dry_run:
+                self.stats.add(files=1, bytes=size)
+                continue
+            try:
+                method = self.place(entry.path, os.path.join(dest_dir, entry.name))
+            except FileExistsError:
+                # Created since the destination was listed, by something outside this run
+                self.stats.add(skipped=1)
+                continue
+            self.stats.add(files=1, bytes=size, **{method: 1})
 
-def copy_all_first3cik_files(src_dir, start_year, end_year, dest_dir):
+def copy_all_first3cik_files(src_dir, start_year, end_year, dest_dir=DEFAULT_DEST_DIR, workers=16, mode='link',
+                             dry_run=False, copy_mb_per_second=DEFAULT_COPY_MB_PER_SECOND):
     # Convert start and end year to integers
     start_year = int(start_year)
     end_year = int(end_year)
-    
-    # Ensure the destination directory is the specific raw_data directory
-    dest_dir = os.path.join('../../scratch/alpine/nimi2356', 'raw_data')
-    
+
     # Create the destination directory if it doesn't exist
-    if not os.path.exists(dest_dir):
-        os.makedirs(dest_dir)
-    
-    # Iterate over the range of years
+    if not dry_run:
+        os.makedirs(dest_dir, exist_ok=True)
+
+    merger = RawDataMerger(dest_dir, mode=mode, dry_run=dry_run)
+    start_time = time.time()
+
+    # Source directories of every CIK in year and quarter order, one merge task per CIK
+    cik_dirs = {}
     for year in range(start_year, end_year):
         year_dir = os.path.join(src_dir, str(year))
-        
+
         # Check if the year directory exists
-        if not os.path.exists(year_dir):
+        if not os.path.isdir(year_dir):
             print("Year directory {} does not exist, skipping.".format(year_dir))
             continue
-        
+
         # Iterate over quarters
-        for quarter in os.listdir(year_dir):
-            quarter_dir = os.path.join(year_dir, quarter)
-            
-            # Ensure it is a directory
-            if not os.path.isdir(quarter_dir):
-                continue
-            
+        for quarter in sorted(list_dirs(year_dir), key=lambda entry: entry.name):
             # Log progress for current year and quarter
-            print("Currently working on year {} quarter {}".format(year, quarter))
-            
-            # Iterate over all first 3 cik directories
-            for first3cik in os.listdir(quarter_dir):
-                first3cik_dir = os.path.join(quarter_dir, first3cik)
-                
-                # Ensure it's a directory
-                if not os.path.isdir(first3cik_dir):
-                    continue
-                
-                # Now iterate over the full cik directories inside the first 3 cik directory
-                for fullcik in os.listdir(first3cik_dir):
-                    fullcik_dir = os.path.join(first3cik_dir, fullcik)
-                    
-                    # Ensure it is a directory
-                    if not os.path.isdir(fullcik_dir):
-                        continue
-                    
-                    # Destination path for the fullcik directory
-                    dest_fullcik_dir = os.path.join(dest_dir, first3cik, fullcik)
-                    
-                    # Create the destination 'first3cik/fullcik' directory if it doesn't exist
-                    if not os.path.exists(dest_fullcik_dir):
-                        os.makedirs(dest_fullcik_dir)
-                    
-                    # Copy the files inside the 'fullcik' directory to the destination, merging without overwriting
-                    for filename in os.listdir(fullcik_dir):
-                        src_file = os.path.join(fullcik_dir, filename)
-                        dest_file = os.path.join(dest_fullcik_dir, filename)
-                        
-                        # If the file doesn't already exist in the destination, copy it
-                        if not os.path.exists(dest_file):
-                            shutil.copy2(src_file, dest_file)
-                        # Skip copying if the file already exists
+            print("Currently working on year {} quarter {}".format(year, quarter.name))
+
+            # Iterate over all first 3 cik directories and their fullcik directories
+            for first3cik in list_dirs(quarter.path):
+                for fullcik in list_dirs(first3cik.path):
+                    cik_dirs.setdefault((first3cik.name, fullcik.name), []).append(fullcik.path)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(merger.merge_cik, first3cik, fullcik, dirs): fullcik
+                   for (first3cik, fullcik), dirs in cik_dirs.items()}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error merging CIK {futures[future]}: {e}")
+
+    elapsed = time.time() - start_time
+    stats = merger.stats
+    if dry_run:
+        # The scan did the same listings and stats as a real run, so its time per file approximates
+        # the metadata cost. Linking adds one more metadata call per file, copying adds the bytes.
+        seen = stats.files + stats.skipped
+        per_file = elapsed / seen if seen else 0
+        projected = stats.files * per_file * 2
+        if mode == 'copy':
+            projected += stats.bytes / (copy_mb_per_second * 1024 * 1024)
+        print(f"[DRY RUN] {stats.files} files ({stats.bytes / 1024 ** 3:.2f} GB) to merge, "
+              f"{stats.skipped} already in {dest_dir}")
+        print(f"[DRY RUN] Scan took {elapsed:.1f}s, projected merge time with mode '{mode}': {projected:.1f}s")
+    else:
+        print(f"Merged {stats.files} files ({stats.bytes / 1024 ** 3:.2f} GB) in {elapsed:.1f}s: "
+              f"{stats.linked} linked, {stats.reflinked} reflinked, {stats.copied} copied, {stats.skipped} already there")
+    return stats
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python file.py <source_directory> <start_year> <end_year>")
+    parser = argparse.ArgumentParser(description='Merge year/quarter download trees into one first3cik/fullcik tree.')
+    parser.add_argument('source_directory', type=str, help='Directory holding the year directories')
+    parser.add_argument('start_year', type=int, help='The start year (INCLUSIVE)')
+    parser.add_argument('end_year', type=int, help='The end year (EXCLUSIVE)')
+    parser.add_argument('--dest', type=str, default=DEFAULT_DEST_DIR, help='Destination raw_data directory')
+    parser.add_argument('--workers', type=int, default=16, help='Number of threads')
+    parser.add_argument('--mode', type=str, choices=['link', 'copy'], default='link', help='link (hardlink/reflink, copy as fallback) or copy')
+    parser.add_argument('--dry_run', action='store_true', help='Only report file counts, bytes and projected time')
+    parser.add_argument('--copy_rate', type=float, default=DEFAULT_COPY_MB_PER_SECOND, help='MB/s assumed for the dry run projection when copying')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source_directory):
+        print(f"Source directory {args.source_directory} does not exist")
         sys.exit(1)
-    
-    source_dir = sys.argv[1]
-    start_year = sys.argv[2]
-    end_year = sys.argv[3]
-    destination_dir = os.path.join('../../scratch/alpine/nimi2356', "raw_data")
-    
-    copy_all_first3cik_files(source_dir, start_year, end_year, destination_dir)
+
+    copy_all_first3cik_files(args.source_directory, args.start_year, args.end_year, args.dest,
+                             workers=args.workers, mode=args.mode, dry_run=args.dry_run,
+                             copy_mb_per_second=args.copy_rate)
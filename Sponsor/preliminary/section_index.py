@@ -0,0 +1,136 @@
+import os
+import re
+import csv
+import argparse
+
+from filing_storage import read_filing, is_filing, strip_compression_suffix
+
+# Character offsets of the Item sections (Item 1, 1A, 7, 7A, ...) of an extracted 10-K text file.
+# The index is stored next to the text as documentN.sections.csv, so the NER stages can run spaCy
+# over a few items instead of the whole filing (entityListandCount.py --sections 1,7) and still
+# report offsets and line numbers in the full document.
+#
+# Every item heading shows up at least twice, once in the table of contents and once where the
+# section starts, and the text also refers to items ("see Item 7. Management's Discussion").
+# For each item we keep the occurrence followed by the longest run of text before the next heading,
+# which is the real section. Sections end where the next kept heading starts.
+#
+#   python section_index.py --input_dir /scratch/alpine/nimi2356/parsed
+
+# Items of Regulation S-K in 10-K order. Longer keys first so 1A wins over 1 and 10 over 1.
+ITEMS = ['1', '1A', '1B', '1C', '2', '3', '4', '5', '6', '7', '7A', '8', '9', '9A', '9B', '9C',
+         '10', '11', '12', '13', '14', '15', '16']
+ITEM_ORDER = {item: i for i, item in enumerate(ITEMS)}
+
+# filterHTML.py joins the text pieces with nothing in between, so a heading can be glued to the
+# previous word ("PART IIItem 7.Management's"). It is matched without a leading word boundary and
+# needs punctuation after the number, or a capitalized title, to tell it from a plain reference.
+# Only the word and the item number are case-insensitive: the title lookahead must see a real
+# capital, or "see item 7 of this report" would count as a heading.
+ITEM_HEADING = re.compile(
+    r'(?i:ITEM)\s*((?i:' + '|'.join(sorted(ITEMS, key=len, reverse=True)) + r'))(?![0-9A-Za-z])'
+    r'\s*(?:[.:\-–—]|\s+(?=[A-Z]))')
+
+SECTIONS_SUFFIX = '.sections.csv'
+
+def parse_sections(value):
+    """'1,7a' -> ['1', '7A']. None or '' means every section."""
+    if not value:
+        return None
+    sections = [s.strip().upper() for s in value.split(',') if s.strip()]
+    unknown = [s for s in sections if s not in ITEM_ORDER]
+    if unknown:
+        raise ValueError(f"Unknown 10-K items: {', '.join(unknown)}")
+    return sections
+
+def find_sections(text):
+    """
+    Locate the Item sections of a 10-K text. Returns a list of (item, start, end) character offsets
+    in text order. An empty list means no headings were found.
+    """
+    headings = [(m.group(1).upper(), m.start()) for m in ITEM_HEADING.finditer(text)]
+    if not headings:
+        return []
+
+    # Longest run of text between each heading and the next one, whatever item that is
+    best = {}
+    for i, (item, start) in enumerate(headings):
+        end = headings[i + 1][1] if i + 1 < len(headings) else len(text)
+        if item not in best or end - start > best[item][1]:
+            best[item] = (start, end - start)
+
+    starts = sorted((start, item) for item, (start, _) in best.items())
+    sections = []
+    for i, (start, item) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        sections.append((item, start, end))
+    return sections
+
+def sidecar_path(text_path):
+    """documentN.txt (or .txt.gz/.txt.zst) -> documentN.sections.csv"""
+    base = strip_compression_suffix(text_path)
+    if base.endswith('.txt'):
+        base = base[:-len('.txt')]
+    return base + SECTIONS_SUFFIX
+
+def write_section_index(text_path, text=None):
+    """Index one text file and write its sidecar. Returns the sections."""
+    if text is None:
+        text = read_filing(text_path, errors='replace')
+    sections = find_sections(text)
+    with open(sidecar_path(text_path), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Item', 'Start', 'End'])
+        writer.writerows(sections)
+    return sections
+
+def read_section_index(text_path):
+    """Sections from the sidecar, or None if the file has not been indexed."""
+    path = sidecar_path(text_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['Item'], int(row['Start']), int(row['End'])) for row in csv.DictReader(f)]
+
+def section_spans(text, sections, text_path=None):
+    """
+    (start, end) spans of the wanted items, in text order. Uses the sidecar of text_path when there
+    is one and indexes the text otherwise. A file without any item headings is returned whole,
+    so nothing is silently dropped from the NER run.
+    """
+    index = read_section_index(text_path) if text_path else None
+    if index is None:
+        index = find_sections(text)
+    if not index:
+        return [(0, len(text))]
+    wanted = set(sections)
+    return [(start, end) for item, start, end in index if item in wanted]
+
+def index_directory(input_dir):
+    """Write a sidecar for every text file under input_dir. Returns (files, files without headings)."""
+    files = 0
+    empty = 0
+    for root, _, names in os.walk(input_dir):
+        for name in names:
+            if not is_filing(name):
+                continue
+            sections = write_section_index(os.path.join(root, name))
+            files += 1
+            if not sections:
+                empty += 1
+    return files, empty
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a 10-K Item section index next to every extracted text file.')
+    parser.add_argument('--input_dir', type=str, help='Directory tree of extracted documents (filterHTML.py output)')
+    parser.add_argument('--file', type=str, help='Index a single file and print its sections')
+    args = parser.parse_args()
+
+    if args.file:
+        for item, start, end in write_section_index(args.file):
+            print(f'Item {item:<3} {start:>10} {end:>10} ({end - start} characters)')
+    elif args.input_dir:
+        files, empty = index_directory(args.input_dir)
+        print(f'Indexed {files} files, {empty} without any Item headings')
+    else:
+        parser.error('--input_dir or --file is required')
@@ -0,0 +1,256 @@
+import os
+import re
+import csv
+import mmap
+from html import unescape
+
+from filing_storage import open_filing
+
+# Splits an EDGAR submission into its <DOCUMENT> blocks.
+# StreamingDocumentSplitter is fed the raw bytes while they are being downloaded, so the filing is
+# split during acquisition instead of in a second pass over the corpus (filterHTML.py).
+# iter_documents() does the same for a file already on disk by scanning a memory map, which is what
+# filterHTML.py uses instead of building a BeautifulSoup tree of the whole filing.
+# Neither one parses the HTML inside a document, document_text() strips the tags when asked.
+#
+# A submission looks like:
+#   <SEC-DOCUMENT>...<SEC-HEADER>...</SEC-HEADER>
+#   <DOCUMENT>
+#   <TYPE>10-K
+#   <SEQUENCE>1
+#   <FILENAME>form10k.htm
+#   <TEXT>
+#   ...
+#   </TEXT>
+#   </DOCUMENT>
+#   <DOCUMENT>
+#   <TYPE>EX-21
+#   ...
+
+DOC_START = b'<DOCUMENT>'
+DOC_END = b'</DOCUMENT>'
+TEXT_START = b'<TEXT>'
+
+# If no <TEXT> shows up within this many bytes the header is parsed with whatever we have
+MAX_HEADER_BYTES = 64 * 1024
+
+# Markup the way html.parser (what BeautifulSoup used here) sees it: script and style blocks with
+# everything in them, comments, and tags, which start with '<' and a letter, '/', '!' or '?'.
+# Any other '<' is text ("revenue < 5 and cost > 3"). A tag or comment left open runs to the end.
+TAG = re.compile(r'<script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?(?:-->|\Z)|<[a-zA-Z/!?][^>]*(?:>|\Z)',
+                 re.IGNORECASE | re.DOTALL)
+
+HEADER_FIELD = re.compile(rb'<(TYPE|SEQUENCE|FILENAME|DESCRIPTION)>[ \t]*([^\r\n<]*)')
+
+# Main 10-K body: the first document's type is the form type (10-K, 10-K405, 10-K/A, ...)
+DEFAULT_DOCUMENT_TYPES = ['10-K*']
+
+# Documents worth running NER on: the 10-K body, the annual report to shareholders (EX-13) and the
+# list of subsidiaries (EX-21). Everything else is left out, above all GRAPHIC, ZIP, PDF and EX-101 XBRL,
+# which are uuencoded or machine readable and only cost spaCy time.
+TEXT_DOCUMENT_TYPES = ['10-K*', 'EX-13*', 'EX-21*']
+
+def parse_document_header(header):
+    """Read TYPE, SEQUENCE, FILENAME and DESCRIPTION out of the bytes at the top of a document."""
+    fields = {}
+    for match in HEADER_FIELD.finditer(header):
+        name = match.group(1).decode('ascii').lower()
+        if name not in fields:
+            fields[name] = match.group(2).strip().decode('latin-1')
+    return fields
+
+def document_text(data, encoding='utf-8'):
+    """
+    Text of a document with the markup stripped, the way filterHTML.py always wrote it
+    (BeautifulSoup get_text(strip=True)): every piece of text between tags is unescaped and
+    stripped, empty pieces are dropped and the rest are joined with nothing in between.
+    Script and style contents and comments are dropped like get_text() does. Entities go through
+    html.unescape(), which differs from BeautifulSoup only on malformed ones ("&copy2020", "&bogus;").
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode(encoding, errors='replace')
+    pieces = (unescape(piece).strip() for piece in TAG.split(data))
+    return ''.join(piece for piece in pieces if piece)
+
+def iter_documents(path, document_types=None):
+    """
+    Yield every <DOCUMENT> of a filing as a dict with its position in the filing ('document', from 1),
+    type, sequence, filename, description, byte offsets ('start', 'end', same as documents.csv) and
+    'content', the raw bytes between <DOCUMENT> and </DOCUMENT>. HTML inside is left alone.
+    Plain files are memory-mapped, compressed ones are decompressed into memory first.
+    document_types filters by <TYPE> like StreamingDocumentSplitter.
+    """
+    if os.path.exists(path) and not path.endswith(('.gz', '.zst')):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from _scan_documents(data, document_types)
+    else:
+        with open_filing(path, 'rb') as f:
+            yield from _scan_documents(f.read(), document_types)
+
+def _scan_documents(data, document_types):
+    number = 0
+    pos = 0
+    while True:
+        start = data.find(DOC_START, pos)
+        if start < 0:
+            return
+        body = start + len(DOC_START)
+        end = data.find(DOC_END, body)
+        # A truncated last document runs to the end of the file
+        content_end = end if end >= 0 else len(data)
+        number += 1
+
+        header_end = data.find(TEXT_START, body, min(content_end, body + MAX_HEADER_BYTES))
+        if header_end < 0:
+            header_end = min(content_end, body + MAX_HEADER_BYTES)
+        fields = parse_document_header(data[body:header_end])
+
+        if type_matches(fields.get('type', ''), document_types):
+            yield {
+                'document': number,
+                'type': fields.get('type', ''),
+                'sequence': fields.get('sequence', ''),
+                'filename': fields.get('filename', ''),
+                'description': fields.get('description', ''),
+                'start': start,
+                'end': content_end + len(DOC_END) if end >= 0 else content_end,
+                'content': data[body:content_end],
+            }
+        if end < 0:
+            return
+        pos = end + len(DOC_END)
+
+def type_matches(doc_type, patterns):
+    """
+    True if doc_type is one of patterns. A pattern ending with * matches by prefix,
+    so '10-K*' keeps 10-K, 10-K405 and 10-K/A but not EX-10.
+    patterns None means keep everything.
+    """
+    if patterns is None:
+        return True
+    doc_type = (doc_type or '').upper()
+    for pattern in patterns:
+        pattern = pattern.upper()
+        if pattern.endswith('*'):
+            if doc_type.startswith(pattern[:-1]):
+                return True
+        elif doc_type == pattern:
+            return True
+    return False
+
+class StreamingDocumentSplitter:
+    """
+    Incremental <DOCUMENT> splitter. feed() it byte chunks in order and close() it at the end.
+    Documents whose <TYPE> matches document_types are written to output_dir/document{N}.txt as their
+    bytes arrive, N being the document's position in the filing (same numbering as filterHTML.py).
+    Every document, kept or not, gets a row in self.documents with its byte offsets in the raw filing.
+
+    open_writer(path) must return a binary file object, so the documents can be compressed the same
+    way as the raw filing.
+    """
+    def __init__(self, output_dir, document_types=None, open_writer=None):
+        self.output_dir = output_dir
+        self.document_types = document_types
+        self.open_writer = open_writer or (lambda path: open(path, 'wb'))
+        self.buf = bytearray()
+        self.buf_offset = 0  # offset of buf[0] in the raw filing
+        self.state = 'outside'
+        self.current = None
+        self.writer = None
+        self.documents = []
+
+    def _start_document(self, header):
+        fields = parse_document_header(header)
+        self.current.update({
+            'type': fields.get('type', ''),
+            'sequence': fields.get('sequence', ''),
+            'filename': fields.get('filename', ''),
+            'description': fields.get('description', ''),
+        })
+        self.current['kept'] = type_matches(self.current['type'], self.document_types)
+        if self.current['kept']:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.current['output'] = f"document{self.current['document']}.txt"
+            self.writer = self.open_writer(os.path.join(self.output_dir, self.current['output']))
+
+    def _write(self, data):
+        if self.writer is not None and data:
+            self.writer.write(data)
+            self.current['bytes'] += len(data)
+
+    def _end_document(self, end_offset):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.current['end'] = end_offset
+        self.documents.append(self.current)
+        self.current = None
+
+    def _consume(self, n):
+        del self.buf[:n]
+        self.buf_offset += n
+
+    def feed(self, chunk):
+        self.buf += chunk
+        while True:
+            if self.state == 'outside':
+                i = self.buf.find(DOC_START)
+                if i < 0:
+                    # keep just enough to catch a tag split across chunks
+                    self._consume(max(0, len(self.buf) - len(DOC_START) + 1))
+                    return
+                self.current = {'document': len(self.documents) + 1, 'start': self.buf_offset + i,
+                                'bytes': 0, 'output': ''}
+                self._consume(i + len(DOC_START))
+                self.state = 'header'
+
+            elif self.state == 'header':
+                i = self.buf.find(TEXT_START)
+                j = self.buf.find(DOC_END)
+                if i < 0 and j < 0 and len(self.buf) < MAX_HEADER_BYTES:
+                    return
+                header_end = min(k for k in (i, j, len(self.buf)) if k >= 0)
+                self._start_document(bytes(self.buf[:header_end]))
+                self.state = 'body'
+
+            elif self.state == 'body':
+                i = self.buf.find(DOC_END)
+                if i < 0:
+                    keep = len(DOC_END) - 1
+                    if len(self.buf) > keep:
+                        self._write(self.buf[:len(self.buf) - keep])
+                        self._consume(len(self.buf) - keep)
+                    return
+                self._write(self.buf[:i])
+                self._consume(i + len(DOC_END))
+                self._end_document(self.buf_offset)
+                self.state = 'outside'
+
+    def abort(self):
+        """Close the document being written without finishing it, e.g. when the download fails."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def close(self):
+        """Flush a truncated last document, if any. Returns the per-document rows."""
+        if self.state == 'header' and self.buf:
+            self._start_document(bytes(self.buf))
+            self.state = 'body'
+        if self.state == 'body':
+            self._write(self.buf)
+            self._consume(len(self.buf))
+            self._end_document(self.buf_offset)
+        self.state = 'outside'
+        return self.documents
+
+    def write_index(self, path):
+        """Write the per-document offsets as a csv next to the documents."""
+        fieldnames = ['document', 'type', 'sequence', 'filename', 'description', 'start', 'end', 'kept', 'bytes', 'output']
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(self.documents)
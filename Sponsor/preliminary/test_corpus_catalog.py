@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import pytest
+
+from corpus_catalog import CorpusCatalog
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+@pytest.fixture
+def catalog(tmp_path):
+    root = tmp_path / 'corpus'
+    write(root / '100' / '0000100000-14-000001.txt', 'same filing')
+    write(root / '1_2' / '0000100000-14-000002.txt', 'other filing')
+    write(root / '102' / '0000100000-14-000003.txt', 'same filing')
+    write(root / '102' / '7' / '0000100000-14-000005.txt', 'nested filing')
+    write(root / '900' / '0000100000-14-000004.txt', 'same filing')
+    catalog = CorpusCatalog(str(tmp_path / 'catalog.sqlite'), str(root))
+    catalog.refresh()
+    catalog.hash_files(workers=2)
+    yield catalog
+    catalog.close()
+
+def full(catalog, *parts):
+    return os.path.join(catalog.root, *parts)
+
+def test_canonical_copy_is_the_smallest_path(catalog):
+    assert catalog.duplicate_paths() == {full(catalog, '102', '0000100000-14-000003.txt'),
+                                         full(catalog, '900', '0000100000-14-000004.txt')}
+
+def test_canonical_copy_is_picked_within_the_selected_paths(catalog):
+    # A run over 102..900 does not process 100, so 102 is the copy it keeps
+    selected = [full(catalog, '102', '0000100000-14-000003.txt'), full(catalog, '900', '0000100000-14-000004.txt')]
+    assert catalog.duplicate_paths(selected) == {full(catalog, '900', '0000100000-14-000004.txt')}
+    assert catalog.duplicate_paths(selected[1:]) == set()
+    assert catalog.duplicate_paths([]) == set()
+
+def test_forgetting_a_directory_leaves_lookalike_names_alone(catalog):
+    # "1_2/%" as a LIKE pattern would also match "102/7"
+    shutil.rmtree(full(catalog, '1_2'))
+    catalog.refresh()
+    paths = [row[0] for row in catalog.conn.execute('SELECT path FROM files ORDER BY path')]
+    assert paths == [os.path.join('100', '0000100000-14-000001.txt'), os.path.join('102', '0000100000-14-000003.txt'),
+                     os.path.join('102', '7', '0000100000-14-000005.txt'),
+                     os.path.join('900', '0000100000-14-000004.txt')]
@@ -0,0 +1,125 @@
+import os
+import hashlib
+import threading
+
+import pytest
+
+from local_edgar_server import build_fake_archive, serve
+from download_journal import DownloadJournal
+from index_catalog import IndexCatalog
+from edgar_downloader import EdgarDownloader
+from corpus_catalog import CorpusCatalog
+from local_edgar_server import FAKE_FILING
+
+HEADERS = {'User-Agent': 'test test@example.com'}
+RATE = 40
+WORKERS = 4
+BACKOFF = 0.05
+# The QTR1 index and the five 10-Ks of QTR2 answer 429, then 503, then the file
+FAIL_STATUSES = [429, 503]
+FAIL_PATTERN = r'QTR1/master\.idx|/edgar/data/100032'
+MISSING = 'edgar/data/1010340/00001010340-03-000004.txt'
+
+def make_downloader(tmp_path, url='http://127.0.0.1:1/', **kwargs):
+    journal = DownloadJournal(str(tmp_path / 'journal.sqlite'))
+    catalog = IndexCatalog(str(tmp_path / 'catalog.sqlite'))
+    return EdgarDownloader(str(tmp_path / 'download'), HEADERS, journal, catalog, base_url=url, **kwargs)
+
+@pytest.fixture
+def server(tmp_path):
+    root = str(tmp_path / 'archive')
+    build_fake_archive(root, [2003])
+    # A filing the index lists but the archive does not have: 404, which is not retried
+    os.remove(os.path.join(root, MISSING))
+    server = serve(root, 0, delay=0.05, fail_statuses=FAIL_STATUSES, fail_pattern=FAIL_PATTERN)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, root
+    server.shutdown()
+    server.server_close()
+
+def test_download_against_local_server(server, tmp_path):
+    server, root = server
+    base = str(tmp_path / 'download')
+    journal = DownloadJournal(str(tmp_path / 'journal.sqlite'))
+    catalog = IndexCatalog(str(tmp_path / 'catalog.sqlite'))
+    downloader = EdgarDownloader(base, HEADERS, journal, catalog, base_url=f'http://127.0.0.1:{server.server_port}/',
+                                 max_workers=WORKERS, requests_per_second=RATE, max_retries=3, backoff=BACKOFF)
+    saved = downloader.run([2003])
+    downloader.close()
+
+    # 10-K and 10-K405 of four quarters, minus the missing one. 10-K/A and 8-K are not requested.
+    assert saved == 4 * 7 - 1
+    assert not [path for path in server.attempts if '/edgar/data/102' in path or '/edgar/data/103' in path]
+
+    # Every file on disk is the archive's, the journal has its size and checksum, the 404 is failed
+    summary = journal.summary()
+    assert summary == {'done': saved, 'failed': 1}
+    assert [elements[4] for _, _, elements in journal.failed()] == [MISSING]
+    rows = journal.conn.execute("SELECT url, year, qtr, cik, bytes, sha256, attempts FROM filings WHERE state = 'done'").fetchall()
+    assert len(rows) == saved
+    for url, year, qtr, cik, size, checksum, attempts in rows:
+        with open(os.path.join(root, url), 'rb') as f:
+            expected = f.read()
+        with open(os.path.join(base, str(year), qtr, cik[:3], cik, os.path.basename(url)), 'rb') as f:
+            assert f.read() == expected
+        assert (size, checksum, attempts) == (len(expected), hashlib.sha256(expected).hexdigest(), 1)
+    journal.close()
+    catalog.close()
+
+    # 429 and 5xx are retried until the file comes, everything else is requested once
+    failing = [path for path in server.attempts if path.endswith('QTR1/master.idx') or '/edgar/data/100032' in path]
+    assert len(failing) == 6
+    assert all(server.attempts[path] == len(FAIL_STATUSES) + 1 for path in failing)
+    assert all(count == 1 for path, count in server.attempts.items() if path not in failing)
+    # with a growing backoff in between
+    for path in failing:
+        times = [t for t, requested in server.requests if requested == path]
+        assert times[1] - times[0] >= BACKOFF and times[2] - times[1] >= 2 * BACKOFF
+
+    # Requests overlap, but never more than the workers, and never faster than the rate limit
+    assert 1 < server.max_in_flight <= WORKERS
+    times = sorted(t for t, _ in server.requests)
+    window = 10
+    for first, last in zip(times, times[window:]):
+        # Some slack for when the server thread picks the request up
+        assert last - first >= window / RATE * 0.8
+
+FILING = FAKE_FILING.format(accession='0001234567-03-000001', form='10-K', company='FAKE CO', cik='1234567').encode()
+
+def test_split_documents_cleans_up_a_failed_download(tmp_path):
+    downloader = make_downloader(tmp_path, document_types=['10-K*', 'EX-21*'])
+    path = str(tmp_path / 'download' / '0001234567-03-000001.txt')
+    output_dir = os.path.splitext(path)[0]
+
+    def broken_stream():
+        yield FILING[:FILING.index(b'New York')]
+        raise ConnectionError('connection reset')
+
+    with pytest.raises(ConnectionError):
+        for _ in downloader.split_documents(broken_stream(), path):
+            pass
+    assert not os.path.exists(output_dir)
+
+    # A reader that stops early (write_stream failing) closes the generator
+    chunks = downloader.split_documents(iter([FILING[:200], FILING[200:]]), path)
+    next(chunks)
+    next(chunks)
+    chunks.close()
+    assert not os.path.exists(output_dir)
+
+    assert b''.join(downloader.split_documents(iter([FILING[:200], FILING[200:]]), path)) == FILING
+    assert sorted(os.listdir(output_dir)) == ['document1.txt', 'document2.txt', 'documents.csv']
+    downloader.close()
+
+def test_split_documents_are_not_cataloged_as_filings(server, tmp_path):
+    server, root = server
+    downloader = make_downloader(tmp_path, f'http://127.0.0.1:{server.server_port}/', max_workers=WORKERS,
+                                 requests_per_second=100, max_retries=3, backoff=0.01, document_types=['10-K*'])
+    saved = downloader.run([2003])
+    downloader.close()
+    catalog = CorpusCatalog(str(tmp_path / 'corpus.sqlite'), str(tmp_path / 'download'))
+    catalog.refresh()
+    names = [row[0] for row in catalog.conn.execute('SELECT name FROM files')]
+    catalog.close()
+    assert len(names) == saved and not [name for name in names if name.startswith('document')]
@@ -0,0 +1,26 @@
+import pandas as pd
+import pytest
+
+from filing_metadata import (full_year, accession_year, parse_accession, parse_filing_path,
+                             accession_metadata, filing_path_metadata)
+
+NAMES = ['0000320193-93-000001.txt', 'entity_report_0000320193-99-000024.csv', '0000320193-00-000003.txt',
+         '0000320193-14-000024.txt', '0000320193-92-000005.txt', 'no accession here']
+
+def test_full_year():
+    assert [full_year(yy) for yy in (93, 94, 99, 0, 14, 92)] == [1993, 1994, 1999, 2000, 2014, 2092]
+
+def test_accession_year():
+    assert [accession_year(name) for name in NAMES] == [1993, 1999, 2000, 2014, 2092, None]
+
+def test_filing_path_year():
+    assert parse_filing_path('123/1234567/0001234567-93-000001.txt')['year'] == 1993
+    assert parse_filing_path('1994/QTR1/123/1234567/0001234567-93-000001.txt')['year'] == 1994
+
+def test_columns_match_the_scalar_rule():
+    pytest.importorskip('pyarrow')
+    frame = accession_metadata(NAMES)
+    expected = [parse_accession(name)['filer_year'] for name in NAMES]
+    assert [None if pd.isna(year) else year for year in frame['filer_year']] == expected
+    paths = ['2014/QTR1/320/320193/0000320193-{}-000001.txt'.format(yy) for yy in ('93', '99', '00', '14', '92')]
+    assert list(filing_path_metadata(paths)['filer_year']) == [1993, 1999, 2000, 2014, 2092]
@@ -0,0 +1,29 @@
+from index_catalog import IndexCatalog, ten_k_forms
+
+MASTER_IDX = """Description:           Master Index of EDGAR Dissemination Feed
+Last Data Received:    March 31, 2003
+
+CIK|Company Name|Form Type|Date Filed|Filename
+--------------------------------------------------------------------------------
+1000045|NICHOLAS FINANCIAL INC|10-K|2003-01-15|edgar/data/1000045/0001000045-03-000001.txt
+1000045|NICHOLAS FINANCIAL INC|10-K/A|2003-02-15|edgar/data/1000045/0001000045-03-000002.txt
+1000097|KINGDON CAPITAL|10-K405|20030120|edgar/data/1000097/0001000097-03-000001.txt
+1000180|SANDISK CORP|10-KT|2003-03-01|edgar/data/1000180/0001000180-03-000001.txt
+1000209|MEDALLION FINANCIAL|10-KSB|2003-03-02|edgar/data/1000209/0001000209-03-000001.txt
+1000228|HENRY SCHEIN INC|10-K405/A|2003-03-03|edgar/data/1000228/0001000228-03-000001.txt
+1000229|CORE LABORATORIES|10-Q|2003-03-04|edgar/data/1000229/0001000229-03-000001.txt
+"""
+
+def forms_selected(tmp_path, **kwargs):
+    catalog = IndexCatalog(str(tmp_path / 'catalog.sqlite'))
+    catalog.load_quarter(2003, 'QTR1', MASTER_IDX)
+    rows = catalog.query(forms=ten_k_forms(**kwargs), years=[2003])
+    catalog.close()
+    return sorted(row[2] for row in rows)
+
+def test_default_is_the_base_forms(tmp_path):
+    assert forms_selected(tmp_path) == ['10-K', '10-K405', '10-KSB', '10-KT']
+
+def test_amendments_are_opt_in(tmp_path):
+    assert forms_selected(tmp_path, amendments=True) == ['10-K', '10-K/A', '10-K405', '10-K405/A', '10-KSB', '10-KT']
+    assert forms_selected(tmp_path, forms=['10-K'], amendments=True) == ['10-K', '10-K/A']
@@ -0,0 +1,43 @@
+import pytest
+
+from raw_data_joiner import copy_all_first3cik_files
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+@pytest.fixture
+def trees(tmp_path):
+    # The same CIK in two quarters, both with a filing named the same and a --split_documents folder
+    src = tmp_path / 'src'
+    write(src / '2014' / 'QTR1' / '123' / '1234567' / 'a.txt', 'first')
+    write(src / '2014' / 'QTR1' / '123' / '1234567' / '0001-14-000001' / 'document1.txt', 'doc1')
+    write(src / '2014' / 'QTR2' / '123' / '1234567' / 'a.txt', 'second')
+    write(src / '2014' / 'QTR2' / '123' / '1234567' / 'b.txt', 'b')
+    write(src / '2014' / 'QTR2' / '123' / '1234567' / '0001-14-000001' / 'document2.txt', 'doc2')
+    dest = tmp_path / 'dest'
+    write(dest / '123' / '1234567' / 'kept.txt', 'from an earlier run')
+    return src, dest
+
+@pytest.mark.parametrize('mode', ['link', 'copy'])
+def test_first_copy_wins_and_subdirectories_merge(trees, mode):
+    src, dest = trees
+    stats = copy_all_first3cik_files(str(src), 2014, 2015, str(dest), workers=4, mode=mode)
+    cik = dest / '123' / '1234567'
+    assert (cik / 'a.txt').read_text() == 'first'
+    assert (cik / 'b.txt').read_text() == 'b'
+    assert (cik / 'kept.txt').read_text() == 'from an earlier run'
+    assert sorted(p.name for p in (cik / '0001-14-000001').iterdir()) == ['document1.txt', 'document2.txt']
+    assert (stats.files, stats.skipped) == (4, 1)
+
+def test_rerun_skips_everything(trees):
+    src, dest = trees
+    copy_all_first3cik_files(str(src), 2014, 2015, str(dest), mode='copy')
+    stats = copy_all_first3cik_files(str(src), 2014, 2015, str(dest), mode='copy')
+    assert (stats.files, stats.skipped) == (0, 5)
+
+def test_dry_run_counts_without_writing(trees):
+    src, dest = trees
+    stats = copy_all_first3cik_files(str(src), 2014, 2015, str(dest), dry_run=True)
+    assert (stats.files, stats.skipped) == (4, 1)
+    assert not (dest / '123' / '1234567' / 'a.txt').exists()
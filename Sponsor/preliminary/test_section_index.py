@@ -0,0 +1,40 @@
+from section_index import find_sections, parse_sections, section_spans
+
+# A 10-K shaped text: the table of contents lists every item, then the sections follow, and the
+# body of Item 1 refers to other items in running text.
+TOC = "TABLE OF CONTENTS PART I Item 1. Business 3 Item 1A. Risk Factors 9 PART II Item 7. Management's Discussion 20 "
+BUSINESS = ("Item 1. Business " + "We make widgets in Ohio and sell them abroad. " * 10 +
+            "For our results see item 7 of this report, and see item 1a risk factors below. " +
+            "Our plants run around the clock. " * 30)
+RISKS = "Item 1A. Risk Factors " + "Our widgets may break. " * 15
+MDA = "Item 7. Management's Discussion and Analysis " + "Revenue grew in every quarter of the year. " * 25
+TEXT = TOC + BUSINESS + RISKS + MDA
+
+def section_text(text, item):
+    return [text[start:end] for found, start, end in find_sections(text) if found == item]
+
+def test_sections_are_the_bodies_not_the_toc():
+    sections = {item: (start, end) for item, start, end in find_sections(TEXT)}
+    assert sections['1'][0] == len(TOC)
+    assert sections['1A'][0] == len(TOC) + len(BUSINESS)
+    assert sections['7'] == (len(TOC) + len(BUSINESS) + len(RISKS), len(TEXT))
+
+def test_lowercase_reference_is_not_a_heading():
+    # "see item 7 of this report" inside Item 1 must neither end Item 1 nor become Item 7
+    (business,) = section_text(TEXT, '1')
+    assert business == BUSINESS
+    (mda,) = section_text(TEXT, '7')
+    assert mda.startswith("Item 7. Management's")
+
+def test_glued_and_uppercase_headings():
+    text = "PART IIITEM 7.MANAGEMENT'S DISCUSSION" + " numbers" * 50 + "ITEM 7A: Market Risk" + " rates" * 50
+    assert [item for item, _, _ in find_sections(text)] == ['7', '7A']
+
+def test_no_headings_keeps_the_whole_text():
+    text = "see item 7 of this report and item 1a below"
+    assert find_sections(text) == []
+    assert section_spans(text, ['7']) == [(0, len(text))]
+
+def test_parse_sections():
+    assert parse_sections('1, 7a') == ['1', '7A']
+    assert parse_sections('') is None
@@ -0,0 +1,81 @@
+import pytest
+
+from sgml_splitter import iter_documents, document_text, type_matches
+
+# An EDGAR style submission with the markup 10-K HTML really has: a style sheet and a script in the
+# head, comments, comparisons in table cells, entities and tags split over lines.
+FILING = """<SEC-DOCUMENT>0000012345-14-000001.txt : 20140301
+<SEC-HEADER>0000012345-14-000001.hdr.sgml : 20140301
+CONFORMED SUBMISSION TYPE:\t10-K
+</SEC-HEADER>
+<DOCUMENT>
+<TYPE>10-K
+<SEQUENCE>1
+<FILENAME>form10k.htm
+<DESCRIPTION>ANNUAL REPORT
+<TEXT>
+<html><head><title>Form 10-K</title>
+<style type="text/css">p {margin:0} td > p {color:#000}</style>
+<script language="javascript">if (a < b) { x = "</p>"; }</script></head>
+<body><!-- page 1 > cover -->
+<P STYLE="font-family:Times">UNITED STATES<BR>SECURITIES AND EXCHANGE COMMISSION</P>
+<p>Barnes Group Inc. &#8211; Bristol, Connecticut&nbsp;06010</p>
+<table><tr><td align="right">Revenue growth < 5% and cost > 3%</td><td>x <= 10</td></tr>
+<tr><td
+  valign="top">AT&amp;T &lt;NYSE&gt;</td></tr></table>
+</body></html>
+</TEXT>
+</DOCUMENT>
+<DOCUMENT>
+<TYPE>EX-21
+<SEQUENCE>2
+<FILENAME>ex21.htm
+<TEXT>
+<html><body><p>Subsidiaries of the Registrant</p><p>Barnes Group (Bermuda) Ltd.</p></body></html>
+</TEXT>
+</DOCUMENT>
+<DOCUMENT>
+<TYPE>GRAPHIC
+<SEQUENCE>3
+<FILENAME>logo.jpg
+<TEXT>
+begin 644 logo.jpg
+M_]C_X``02D9)1@`!`@``9`!D``#_[``11'5C:WD``0`$````9```_^X`#D%D
+end
+</TEXT>
+</DOCUMENT>
+</SEC-DOCUMENT>
+"""
+
+@pytest.fixture
+def filing(tmp_path):
+    path = tmp_path / '0000012345-14-000001.txt'
+    path.write_text(FILING, encoding='utf-8')
+    return str(path)
+
+def test_documents_and_headers(filing):
+    documents = list(iter_documents(filing))
+    assert [(d['document'], d['type'], d['filename']) for d in documents] == \
+        [(1, '10-K', 'form10k.htm'), (2, 'EX-21', 'ex21.htm'), (3, 'GRAPHIC', 'logo.jpg')]
+    assert documents[0]['description'] == 'ANNUAL REPORT'
+    data = FILING.encode('utf-8')
+    for document in documents:
+        assert data[document['start']:document['end']].startswith(b'<DOCUMENT>')
+        assert data[document['start']:document['end']].endswith(b'</DOCUMENT>')
+
+def test_document_types(filing):
+    assert [d['type'] for d in iter_documents(filing, ['10-K*', 'EX-21*'])] == ['10-K', 'EX-21']
+    assert type_matches('10-K405', ['10-K*'])
+    assert not type_matches('EX-10.1', ['10-K*'])
+
+def test_text_matches_beautifulsoup(filing):
+    bs4 = pytest.importorskip('bs4')
+    with open(filing, encoding='utf-8') as f:
+        soup = bs4.BeautifulSoup(f.read(), 'html.parser')
+    expected = [document.get_text(strip=True) for document in soup.find_all('document')]
+    assert [document_text(d['content']) for d in iter_documents(filing)] == expected
+
+def test_script_style_and_comparisons():
+    text = document_text(b'<style>p {color:red}</style><script>x = 1 < 2;</script>Hello'
+                         b'<td>revenue < 5 and cost > 3</td><!-- a > b -->')
+    assert text == 'Hellorevenue < 5 and cost > 3'
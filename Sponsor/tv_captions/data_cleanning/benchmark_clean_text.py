@@ -0,0 +1,195 @@
+import io
+import time
+import random
+import argparse
+from pathlib import Path
+import pandas as pd
+
+import clean_text
+from clean_text import clean_text_cascade as clean_cell, clean_series, normalize_caption
+
+# Throughput of caption cleaning in rows per second: the old process_csv_file() loop (iloc per cell),
+# the rule cascade clean_text_cascade() mapped over the column, the single-pass normalize_caption()
+# (what clean_text() runs) mapped over the column, and the column engine clean_series(). Every run's
+# output is checked to be byte-identical to clean_text_cascade() on every cell, written the way
+# process_year() writes it, and normalize_caption() is first checked on the golden cases below, which
+# are the places where the single pass and the cascade could differ.
+# Default input is synthetic caption rows; a real Closed.Captions csv can be passed with --file, or a
+# whole year directory with --year_dir (every csv in it, like process_year()).
+#
+#   python benchmark_clean_text.py --rows 200000
+#   python benchmark_clean_text.py --file /scratch/alpine/diga9728/TVarchive/Closed.Captions/2016/CNN.Text.2016.1.csv
+#   python benchmark_clean_text.py --year_dir /scratch/alpine/diga9728/TVarchive/Closed.Captions/2016
+
+WORDS = ("the president said that markets were down today in new york and washington as investors "
+         "watched the fed closely we will be right back after this break joining us now is").split()
+ENTITIES = ['&amp;', '&quot;', '&#39;', '&gt;', '&lt;', '&nbsp;', '&eacute;', '&#x27;', '&bogus;']
+
+# Markup nested in markup, removals that join text into new markup, entities and '>' runs that meet
+# across removed markup, whitespace made by entities
+GOLDEN = [
+    '[[TITLE.START]]Hardball[[TITLE.END]]  [[TIME.START]]0:01[[TIME.END]] >> good evening\n\n>> thanks',
+    '[[[TIME.START]]0:01[[TIME.END]]x]] left',
+    '[[TIME.START]]0:01[[time.end]][[NOTE]] <i>italic</i>  text  TOPICS: TOPIC FREQUENCY fed 3',
+    '<a [[x]] b>kept',
+    '<b [[>]] c>kept',
+    '[<i>[x]] and [[[TIME.START]]1[[TIME.END]][y]]',
+    '&am<b>p; &#1<i>0; &amp<i>;',
+    '&amp;&#10;  &nbsp;\n  &#32;&#32;x',
+    '&gt;&gt; &gt;> >&gt; >>> \n>>> \n>> &nvgt;>',
+    '><i>>x \n<i></i>>> y',
+    'a[[b&amp;]]c &a[[x]]b; &#x3e;&#62;',
+    '\t\n \xa0 >> \r\n x  \n  \n',
+    'TOPIC FREQUENCY only',
+    '[[TIME.START]]no end <i>x</i> [[b',
+    # Entity names stop after 32 characters, so one can end on the first '[' of a marker
+    'Hi &' + 'a' * 31 + '[[TIME.START]]00:01[[TIME.END]] there',
+    '&copy' + 'x' * 27 + '[[y]] tail',
+    '&' + 'a' * 40 + '<i>b</i>; &amp[[x]]; &amp<b>;',
+]
+
+def synthetic_caption(rng):
+    """One caption cell: a title header, timed lines with speaker changes, markup and entities, sometimes topics."""
+    pieces = []
+    if rng.random() < 0.7:
+        pieces.append(f"[[TITLE.START]]{rng.choice(['CNN Newsroom', 'Squawk Box', 'Hardball'])}[[TITLE.END]]  ")
+    for _ in range(rng.randint(1, 12)):
+        if rng.random() < 0.5:
+            pieces.append(f"[[TIME.START]]{rng.randint(0, 59)}:{rng.randint(0, 59):02d}[[time.end]] ")
+        if rng.random() < 0.3:
+            pieces.append(rng.choice(['>> ', '>>', '\n>> ', '>>>> ']))
+        line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+        if rng.random() < 0.2:
+            line += ' ' + rng.choice(ENTITIES) + ' '
+        if rng.random() < 0.1:
+            line = f"<i>{line}</i>"
+        if rng.random() < 0.1:
+            line += '[[NOTE]]'
+        pieces.append(line + rng.choice([' ', '  ', '\n', '\n \n', '\n\n\n', '\t']))
+    if rng.random() < 0.2:
+        pieces.append(rng.choice(['TOPICS: TOPIC FREQUENCY fed 3', 'TOPIC FREQUENCY markets 2']))
+    return ''.join(pieces)
+
+def synthetic_frame(rows, seed=0):
+    """Three columns like a caption csv read with header=None, caption text in column 2, a few empty cells."""
+    rng = random.Random(seed)
+    text = [synthetic_caption(rng) if rng.random() > 0.01 else None for _ in range(rows)]
+    return pd.DataFrame({0: range(rows), 1: ['2016-01-01'] * rows, 2: text})
+
+def legacy_process(df):
+    """The old process_csv_file() cleaning loop."""
+    cleaned_df = df.copy()
+    for i in range(len(cleaned_df)):
+        for j in range(len(cleaned_df.columns)):
+            cleaned_df.iloc[i, j] = clean_cell(cleaned_df.iloc[i, j])
+    return cleaned_df
+
+def mapped_process(df):
+    return df.apply(lambda column: column.map(clean_cell))
+
+def normalized_process(df):
+    return df.apply(lambda column: column.map(normalize_caption))
+
+def series_process(df):
+    return df.apply(clean_series)
+
+def check_golden():
+    """Golden cases where normalize_caption() differs from clean_text_cascade()."""
+    return [text for text in GOLDEN if normalize_caption(text) != clean_cell(text)]
+
+def csv_bytes(df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    return buffer.getvalue().encode('utf-8')
+
+def measure(name, func, df, expected, repeat):
+    """Best rows per second of repeat runs, and whether the written csv equals expected."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    same = csv_bytes(result) == expected
+    print(f'  {name:<14} {len(df):>8} rows {best:8.2f} s {len(df) / best:12,.0f} rows/s  '
+          f'{"identical" if same else "DIFFERENT"}')
+    return len(df) / best, same
+
+def read_captions(path):
+    """A caption csv the way process_csv_file() reads it."""
+    df = pd.read_csv(path, header=None)
+    if clean_text.just_text and len(df.columns) >= 3:
+        df = df[[2]]
+    return df
+
+def measure_year(year_dir, paths):
+    """
+    Seconds of each path over every csv of a year directory, one file at a time, and the files whose
+    output differs from clean_text_cascade() mapped over the column.
+    """
+    seconds = {name: 0.0 for name in paths}
+    different = {name: [] for name in paths}
+    rows = text_bytes = 0
+    for csv_file in sorted(Path(year_dir).glob('*.csv')):
+        df = read_captions(csv_file)
+        rows += len(df)
+        text_bytes += sum(len(value.encode('utf-8')) for value in df[df.columns[0]] if isinstance(value, str))
+        expected = None
+        for name, func in paths.items():
+            start = time.perf_counter()
+            result = func(df)
+            seconds[name] += time.perf_counter() - start
+            written = csv_bytes(result)
+            if expected is None:
+                expected = written
+            elif written != expected:
+                different[name].append(csv_file.name)
+    return rows, text_bytes, seconds, different
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rows per second of the caption cleaning paths.')
+    parser.add_argument('--file', type=str, required=False, help='Caption csv (no header), default is synthetic rows')
+    parser.add_argument('--year_dir', type=str, required=False, help='Year directory of caption csvs, all timed together')
+    parser.add_argument('--rows', type=int, default=100000, help='Synthetic rows')
+    parser.add_argument('--legacy_rows', type=int, default=5000, help='Rows timed with the old iloc loop, which is slow')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per path, the best one counts')
+    args = parser.parse_args()
+
+    failed = check_golden()
+    print(f'{len(GOLDEN) - len(failed)} of {len(GOLDEN)} golden cases identical')
+    if failed:
+        raise SystemExit(f'normalize_caption() differs from clean_text_cascade() on {failed}')
+
+    if args.year_dir:
+        # clean_text_cascade() mapped over the column goes first, it is what the others are compared to
+        paths = {'map': mapped_process, 'normalize_caption': normalized_process, 'clean_series': series_process}
+        rows, text_bytes, seconds, different = measure_year(args.year_dir, paths)
+        print(f'{args.year_dir}: {rows} rows, {text_bytes / 1024 ** 2:.1f} MB of caption text')
+        for name in paths:
+            rate = text_bytes / 1024 ** 2 / seconds[name] if seconds[name] else 0
+            print(f'  {name:<18} {seconds[name]:8.2f} s {rate:8.1f} MB/s  '
+                  f'{"DIFFERENT in " + ", ".join(different[name]) if different[name] else "identical"}')
+        if any(different.values()):
+            raise SystemExit('Cleaned output differs from clean_text_cascade()')
+    else:
+        if args.file:
+            df = read_captions(args.file)
+        else:
+            df = synthetic_frame(args.rows)
+            if clean_text.just_text:
+                df = df[[2]]
+        text_bytes = sum(len(value.encode('utf-8')) for value in df[df.columns[0]] if isinstance(value, str))
+        print(f'{len(df)} rows, {text_bytes / 1024 ** 2:.1f} MB of caption text')
+
+        expected = csv_bytes(df.apply(lambda column: column.map(clean_cell)))
+        legacy_df = df.head(args.legacy_rows)
+        legacy_rate, _ = measure('iloc loop', legacy_process, legacy_df, csv_bytes(mapped_process(legacy_df)), 1)
+        mapped_rate, _ = measure('map', mapped_process, df, expected, args.repeat)
+        normalized_rate, normalized_same = measure('normalize', normalized_process, df, expected, args.repeat)
+        series_rate, same = measure('clean_series', series_process, df, expected, args.repeat)
+        print(f'clean_series is {series_rate / legacy_rate:.1f}x the iloc loop and {series_rate / mapped_rate:.2f}x map')
+        print(f'normalize_caption is {normalized_rate / mapped_rate:.2f}x map and {normalized_rate / series_rate:.2f}x clean_series')
+        if not same:
+            raise SystemExit('clean_series output differs from clean_text_cascade()')
+        if not normalized_same:
+            raise SystemExit('normalize_caption output differs from clean_text_cascade()')
@@ -1,17 +1,53 @@
 from pathlib import Path
 import os
+import numpy as np
 import pandas as pd
 import sys
 import glob
 import re
 from html import unescape
+from html.entities import html5 as HTML5
 
 # Global flag for whether to strip out just the text after [[TITLE.END]]
 just_text = True
 
+TITLE_END = "[[TITLE.END]]"
+TOPICS = "TOPICS: TOPIC FREQUENCY"
+TOPIC_FREQUENCY = "TOPIC FREQUENCY"
+
+# The patterns of clean_text_cascade() compiled once for clean_series(). The last two are rewritten
+# to match the same places with far fewer attempts: ' +' -> ' ' replaces every single space by itself, and a
+# lookbehind in front of '>>' is tried at every position, after it only where '>>' is found.
+TIME_MARKERS = re.compile(r'\[\[TIME\.START\]\].*?\[\[TIME\.END\]\]', flags=re.IGNORECASE)
+DOUBLE_BRACKETS = re.compile(r'\[\[.*?\]\]')
+HTML_TAGS = re.compile(r'<[^>]+>')
+SPEAKER_CHANGE = re.compile(r'>>(?<!\n>>)')
+SPACES_AFTER_NEWLINE = re.compile(r'\n\s+')
+NEWLINE_RUNS = re.compile(r'\n{2,}')
+SPACE_RUNS = re.compile(r' {2,}')
+
+# Everything normalize_caption() removes or rewrites, found in one scan. The entity alternative is the
+# pattern html.unescape() itself uses, so one entity token unescapes exactly like it does in place.
+# Every alternative starts with its own literal character outside the groups, which lets the engine
+# skip to the next '[', '<', '&' or '>' instead of trying every alternative at every character.
+CAPTION_TOKENS = re.compile(
+    r'\[\[(?:(?P<time>(?i:TIME\.START\]\].*?\[\[TIME\.END\]\]))|(?P<brackets>.*?\]\]))'
+    r'|<(?P<tag>[^>]+>)'
+    r'|&(?P<entity>#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)'
+    r'|>(?P<gt>>*)')
+GT_RUNS = re.compile(r'(>+)')
+
 def clean_text(text):
     """
-    Clean the text according to specified rules.
+    Clean the text according to specified rules. normalize_caption() does it in one pass, see
+    clean_text_cascade() for the rules themselves.
+    """
+    return normalize_caption(text)
+
+def clean_text_cascade(text):
+    """
+    The cleaning rules as one pass each, in order. This is the reference normalize_caption() and
+    clean_series() are checked against, and what normalize_caption() falls back to.
     """
     if not isinstance(text, str):
         return text
@@ -48,6 +84,175 @@ def clean_text(text):
     
     return text.strip()
 
+def topic_cut(text):
+    """The topic section rule of clean_text_cascade() for a text that has TOPIC FREQUENCY in it."""
+    if TOPICS in text:
+        return text.split(TOPICS)[0].strip()
+    return text.split(TOPIC_FREQUENCY)[0].strip()
+
+def normalize_caption(text):
+    """
+    clean_text_cascade() in one scan. Markers, tags, entities and '>' runs are tokens of a single
+    pattern, the text between them is copied, and the >>, newline and space rules are applied to the
+    result while it is written, with the last characters written as the only state.
+
+    The cascade removes markers, then brackets, then tags, then unescapes, each pass on the output of
+    the one before, so a removal can join text into something a later pass matches ("<a [[x]] b>",
+    "&am<b>p;", "[" + marker + "[x]]"). A text where that can happen goes to clean_text_cascade().
+    clean_text() is this per cell, for whole columns clean_series() is faster.
+    """
+    if not isinstance(text, str):
+        return text
+    original = text
+    if just_text and TITLE_END in text:
+        text = text.split(TITLE_END, 1)[1].strip()
+    if TOPIC_FREQUENCY in text:
+        text = topic_cut(text)
+
+    out = []
+    last = ''        # Last character written
+    skip = False     # Right after a newline, whitespace is dropped
+    before = ''      # Last character of the text the >> rule sees (markup removed, entities unescaped)
+    gt = 0           # A run of '>' not written yet, and the character before it
+    gt_before = ''
+
+    def write(piece):
+        # Newline and space rules, on the text after the >> rule
+        nonlocal last, skip
+        if skip:
+            piece = piece.lstrip()
+            if not piece:
+                return
+            skip = False
+        # Most pieces have no newline before their last character and no double space
+        if piece.find('\n', 0, -1) != -1:
+            piece = SPACES_AFTER_NEWLINE.sub('\n', piece)
+        if '  ' in piece:
+            piece = SPACE_RUNS.sub(' ', piece)
+        if last == ' ' and piece[0] == ' ':
+            piece = piece[1:]
+            if not piece:
+                return
+        out.append(piece)
+        last = piece[-1]
+        skip = last == '\n'
+
+    def flush_gt():
+        # '>>' becomes a newline unless a newline is right before it, pairs taken from the left
+        nonlocal gt
+        run = ''
+        if gt_before == '\n':
+            run = '>'
+            gt -= 1
+        write(run + '\n' * (gt // 2) + '>' * (gt % 2))
+        gt = 0
+
+    def emit(piece):
+        # Unescaped text as the >> rule sees it, may have '>' in it
+        nonlocal before, gt, gt_before
+        for part in GT_RUNS.split(piece):
+            if not part:
+                continue
+            if part[0] == '>':
+                if not gt:
+                    gt_before = before
+                gt += len(part)
+            else:
+                if gt:
+                    flush_gt()
+                write(part)
+            before = part[-1]
+
+    pos = 0
+    kept_end = 0       # End of the last text that stays
+    removed_end = 0    # End of the last marker, bracket or tag
+    entity_start = entity_end = -1
+    for match in CAPTION_TOKENS.finditer(text):
+        start, end = match.span()
+        if start > pos:
+            # Text between tokens, never with a '>' in it
+            if gt:
+                flush_gt()
+            write(text[pos:start])
+            before = text[start - 1]
+            kept_end = start
+        kind = match.lastgroup
+        if kind == 'gt':
+            if not gt:
+                gt_before = before
+            gt += end - start
+            before = '>'
+            kept_end = end
+        elif kind == 'entity':
+            token = match.group()
+            # The name may run into a marker or a tag that an earlier pass would have removed first
+            # ("&name[[x]]", a name cut off at 32 characters right before "[[" or "<")
+            if '[[' in token or text.startswith(('[', '<'), end):
+                return clean_text_cascade(original)
+            # A whole entity name is one dict lookup, like in unescape()
+            decoded = HTML5.get(token[1:]) or unescape(token)
+            if decoded:
+                emit(decoded)
+            entity_start, entity_end = start, end
+            kept_end = end
+        else:
+            # A later pass would see this token differently if it holds an earlier pass's brackets,
+            # if removing it makes a new '[[', or if it cuts into an entity
+            if kind != 'time' and text.find('[[', start + 1, end) != -1:
+                return clean_text_cascade(original)
+            if kept_end and text[kept_end - 1] == '[' and text.startswith('[', end):
+                return clean_text_cascade(original)
+            amp = text.rfind('&', removed_end, start)
+            if amp != -1 and not (amp == entity_start and (entity_end < start or text[entity_end - 1] == ';')):
+                return clean_text_cascade(original)
+            removed_end = end
+        pos = end
+    if pos < len(text):
+        if gt:
+            flush_gt()
+        write(text[pos:])
+    if gt:
+        flush_gt()
+    return ''.join(out).strip()
+
+def column_rules():
+    """
+    clean_text_cascade() as (substring, rule) steps in its order. A text without the substring is
+    left as it is by the rule, so only the texts that have it are touched.
+    """
+    rules = []
+    if just_text:
+        rules.append((TITLE_END, lambda text: text.split(TITLE_END, 1)[1].strip()))
+    rules += [
+        (TOPIC_FREQUENCY, topic_cut),
+        # Case-insensitive, but brackets have no case
+        ('[[', lambda text: DOUBLE_BRACKETS.sub('', TIME_MARKERS.sub('', text))),
+        ('<', lambda text: HTML_TAGS.sub('', text)),
+        ('&', unescape),
+        ('>>', lambda text: SPEAKER_CHANGE.sub('\n', text)),
+        ('\n', lambda text: SPACES_AFTER_NEWLINE.sub('\n', text)),
+        ('\n\n', lambda text: NEWLINE_RUNS.sub('\n', text)),
+        ('  ', lambda text: SPACE_RUNS.sub(' ', text)),
+    ]
+    return rules
+
+def clean_series(series):
+    """
+    clean_text_cascade() over a whole column: the same output for every cell, but rule by rule over
+    the column, each rule only on the texts that contain what it removes. Cells that are not text
+    (NaN, numbers) are kept as they are, like clean_text_cascade() does.
+    """
+    values = series.to_numpy(dtype=object, copy=True)
+    is_text = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+    texts = values[is_text]
+    for needle, rule in column_rules():
+        hits = np.flatnonzero(np.fromiter((needle in text for text in texts), dtype=bool, count=len(texts)))
+        if len(hits):
+            texts[hits] = [rule(text) for text in texts[hits]]
+    texts[:] = [text.strip() for text in texts]
+    values[is_text] = texts
+    return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
 def process_csv_file(file_path):
     """
     Process a single CSV file while maintaining structure but cleaning text content.
@@ -62,18 +267,11 @@ def process_csv_file(file_path):
             else:
                 print(f"Warning: File {file_path} has fewer than 3 columns")
         
-        # Create a copy of the dataframe for modification
-        cleaned_df = df.copy()
-        
         print(f"Debug: Shape of dataframe: {df.shape}")
         
-        # Clean text in each cell
-        for i in range(len(cleaned_df)):
-            for j in range(len(cleaned_df.columns)):
-                cleaned_df.iloc[i, j] = clean_text(cleaned_df.iloc[i, j])
-            
-            if i % 1000 == 0:
-                print(f"Processed {i} rows...")
+        # Clean the text of every column, one whole column at a time
+        cleaned_df = df.apply(clean_series)
+        print(f"Processed {len(cleaned_df)} rows")
         
         return cleaned_df
         
@@ -6,6 +6,10 @@ import pandas as pd
 from collections import Counter
 import argparse
 
+# Shared file name parser lives with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from filing_metadata import caption_metadata
+
 def extract_org_counts_from_csv(file_path):
     """
     Reads a CSV file that contains a JSON dump of spaCy entity results
@@ -48,15 +52,14 @@ def process_files(input_dir, output_dir):
     csv_files = glob.glob(pattern, recursive=True)
     print(f"Found {len(csv_files)} CSV files in {input_dir}")
 
-    for file_path in csv_files:
+    # Network and year of every file name at once, e.g. Bloomberg.Text.2020.1.csv
+    metadata = caption_metadata(csv_files)
+
+    for file_path, network, year in zip(csv_files, metadata['source'], metadata['year']):
         file_name = os.path.basename(file_path)
-        # Expecting filename pattern like: Bloomberg.Text.2020.1.csv
-        parts = file_name.split('.')
-        if len(parts) < 5:
+        if pd.isna(year):
             print(f"Filename '{file_name}' does not match expected pattern; skipping.")
             continue
-        network = parts[0]
-        year = parts[2]
         print(f"Processing '{file_name}' (Network: {network}, Year: {year})")
 
         org_counter = extract_org_counts_from_csv(file_path)
@@ -3,19 +3,19 @@ import os
 import glob
 import pandas as pd
 
+# Shared file name parser lives with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from filing_metadata import caption_metadata
+
 def process_network(network_dir, network_name, output_dir):
     """Processes all CSVs for a given network and extracts the top 50 NORP counts."""
     csv_files = glob.glob(os.path.join(network_dir, "*.csv"))
     all_top50 = []
+    # Year of every file name at once, pattern "cleaned_<Network>.Text.<Year>.NORP_counts.csv"
+    years = caption_metadata(csv_files)['year']
 
-    for csv_file in csv_files:
-        filename = os.path.basename(csv_file)
-        parts = filename.split('.')
-        
-        # Extract year from filename
-        try:
-            year = parts[2]  # Assuming the pattern "cleaned_<Network>.Text.<Year>.NORP_counts.csv"
-        except IndexError:
+    for csv_file, year in zip(csv_files, years):
+        if pd.isna(year):
             year = "UNKNOWN"
         
         # Read CSV and standardize column names
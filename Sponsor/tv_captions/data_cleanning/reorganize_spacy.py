@@ -5,6 +5,10 @@ import sys
 import json
 import pandas as pd
 
+# Shared file name parser lives with the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'preliminary'))
+from filing_metadata import match_channels
+
 def reorganize_and_expand_entities(
     source_root,
     target_root="/scratch/alpine/jasn7628/spacy_tv_final",
@@ -31,6 +35,9 @@ def reorganize_and_expand_entities(
         if not csv_files:
             print(f"[INFO] No .csv files found in {year_dir}\n")
             continue
+
+        # Channel of every file name at once, "Other" if none of the channels is in it
+        file_channels = dict(zip(csv_files, match_channels(csv_files, channels)))
         
         for csv_file in csv_files:
             source_path = os.path.join(year_dir, csv_file)
@@ -85,15 +92,7 @@ def reorganize_and_expand_entities(
                 expanded_df.drop(columns=["entities"], inplace=True)
           
 
-            matched_channel = None
-            filename_lower = csv_file.lower()
-            for ch in channels:
-                if ch.lower() in filename_lower:
-                    matched_channel = ch
-                    break
-            if matched_channel is None:
-                matched_channel = "Other"
-            
+            matched_channel = file_channels[csv_file]
             channel_dir = os.path.join(target_root, matched_channel)
             os.makedirs(channel_dir, exist_ok=True)
             
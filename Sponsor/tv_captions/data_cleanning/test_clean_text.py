@@ -0,0 +1,39 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+from clean_text import clean_text, clean_text_cascade, clean_series
+from benchmark_clean_text import GOLDEN, synthetic_caption
+
+PIECES = ['[[', '[', ']]', ']', '<', '>', '>>', '&', 'amp;', '&#39;', '&eacute', '&lt;', 'TIME.START', 'TIME.END',
+          'time.start', '[[TITLE.END]]', 'TOPIC FREQUENCY', ' ', '  ', '\n', '\n\n', 'a', 'b x', '<b>', ';', '#']
+
+def test_golden_cases_match_the_cascade():
+    assert [clean_text(text) for text in GOLDEN] == [clean_text_cascade(text) for text in GOLDEN]
+
+def test_entity_name_cut_before_markup():
+    # An entity name stops after 32 characters, here on the first '[' of a marker the cascade removes first
+    text = 'Hi &' + 'a' * 31 + '[[TIME.START]]00:01[[TIME.END]] there'
+    assert text in GOLDEN
+    assert clean_text(text) == clean_text_cascade(text) == 'Hi &' + 'a' * 31 + ' there'
+    text = '&copy' + 'x' * 27 + '[[y]] tail'
+    assert clean_text(text) == clean_text_cascade(text) == '\xa9' + 'x' * 27 + ' tail'
+    assert clean_series(pd.Series([text]))[0] == clean_text(text)
+
+def long_entity(rng):
+    return '&' + rng.choice('ax') * rng.randint(26, 34)
+
+def test_random_markup_matches_the_cascade():
+    rng = random.Random(0)
+    texts = [''.join(long_entity(rng) if rng.random() < 0.1 else rng.choice(PIECES) for _ in range(rng.randint(0, 14)))
+             for _ in range(20000)]
+    texts += [synthetic_caption(rng) for _ in range(200)]
+    assert [clean_text(text) for text in texts] == [clean_text_cascade(text) for text in texts]
+
+def test_clean_series_keeps_non_text_cells():
+    series = pd.Series(['[[TITLE.END]] a  &amp; b >> c', np.nan, 3])
+    cleaned = clean_series(series)
+    assert cleaned[0] == clean_text_cascade(series[0]) == 'a & b \nc'
+    assert np.isnan(cleaned[1]) and cleaned[2] == 3
+    assert clean_text(np.nan) is np.nan